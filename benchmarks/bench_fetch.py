@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare a new connection per-page against :class:`code_include.fetch.ConnectionPool`.
+
+Run this from the repository's root directory:
+
+::
+
+    PYTHONPATH=src python benchmarks/bench_fetch.py
+
+A local :mod:`http.server` stands in for a real intersphinx website.
+Each request has a small, artificial connection delay to mimic the
+cost of a TCP / TLS handshake.
+
+"""
+
+import argparse
+import http.server
+import threading
+import time
+import typing
+from urllib import request as urllib_request
+
+from code_include import fetch
+
+_PAGE = (
+    b"<html><body>" + b"<div id='foo'>def foo(): pass</div>" * 2000 + b"</body></html>"
+)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serve :data:`_PAGE` over a keep-alive connection."""
+
+    handshake = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        """Pretend that each new connection needs an expensive handshake."""
+        time.sleep(self.handshake)
+
+        super(_Handler, self).setup()
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Send back the page."""
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(_PAGE)))
+        self.end_headers()
+        self.wfile.write(_PAGE)
+
+    def log_message(self, *args: typing.Any) -> None:
+        """Don't print anything while the benchmark runs."""
+
+
+def _time(function: typing.Callable[[], None]) -> float:
+    """float: Run ``function`` and get the number of seconds that it took."""
+    start = time.perf_counter()
+    function()
+
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--handshake", type=float, default=0.005)
+    arguments = parser.parse_args()
+
+    _Handler.handshake = arguments.handshake
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = "http://127.0.0.1:{port}/_modules/foo.html".format(
+        port=server.server_address[1]
+    )
+
+    def _urlopen() -> None:
+        for _ in range(arguments.pages):
+            with urllib_request.urlopen(url) as handler:
+                handler.read()
+
+    pool = fetch.ConnectionPool()
+
+    def _pooled() -> None:
+        for _ in range(arguments.pages):
+            pool.request(url, {})
+
+    try:
+        unpooled = _time(_urlopen)
+        pooled = _time(_pooled)
+    finally:
+        pool.close()
+        server.shutdown()
+        server.server_close()
+
+    print("pages:     {pages}".format(pages=arguments.pages))
+    print("urlopen:   {seconds:.3f}s".format(seconds=unpooled))
+    print(
+        "pooled:    {seconds:.3f}s ({connections} connection(s))".format(
+            seconds=pooled, connections=pool.connections
+        )
+    )
+    print("speed-up:  {ratio:.1f}x".format(ratio=unpooled / pooled))
+
+
+if __name__ == "__main__":
+    main()
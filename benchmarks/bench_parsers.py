@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare every installed HTML parser on large, synthetic viewcode pages.
+
+Run this from the repository's root directory:
+
+::
+
+    PYTHONPATH=src python benchmarks/bench_parsers.py
+
+Each page is made by repeating every viewcode block of the
+``fake_project`` basic module. Every parser is timed three ways:
+
+- first - :func:`code_include.pages.extract` of the page's first tag.
+- last - :func:`code_include.pages.extract` of the page's last tag.
+- index - :meth:`code_include.pages.PageIndex.build` of the whole page.
+
+The BeautifulSoup tree, which is only built for
+``code_include_preprocessor``, is also timed for comparison.
+
+"""
+
+import argparse
+import functools
+import io
+import os
+import time
+import typing
+
+from code_include import pages
+
+_CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+_BASIC_PAGE = os.path.join(
+    _CURRENT_DIRECTORY,
+    "..",
+    "tests",
+    "unittests",
+    "fake_project",
+    "_modules",
+    "fake_project",
+    "basic.html",
+)
+_MARKER = '<div class="viewcode-block" id="MyKlass">'
+
+
+def _make_page(copies: int) -> tuple[str, str, str]:
+    """Repeat every viewcode block of :data:`_BASIC_PAGE`.
+
+    Args:
+        copies: The number of times to repeat the blocks.
+
+    Returns:
+        The page's HTML, its first tag, and its last tag.
+
+    """
+    with io.open(_BASIC_PAGE, "r", encoding="utf-8") as handler:
+        contents = handler.read()
+
+    head, body = contents.split(_MARKER, 1)
+    blocks = "".join(
+        (_MARKER + body).replace('id="', 'id="copy{index}_'.format(index=index))
+        for index in range(copies)
+    )
+
+    return head + blocks + _MARKER + body, "copy0_MyKlass", "MyKlass"
+
+
+def _time(function: typing.Callable[[], typing.Any], repeat: int) -> float:
+    """float: Get the fastest number of seconds that ``function`` took."""
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--copies", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    contents, first, last = _make_page(arguments.copies)
+    print(
+        "page:  {size:.1f} MB, default parser: {default}".format(
+            size=len(contents) / 1024 / 1024,
+            default=pages.get_parser(),
+        )
+    )
+    print(
+        "{name:<12} {first:>9} {last:>9} {index:>9} {tree:>9}".format(
+            name="parser", first="first", last="last", index="index", tree="tree"
+        )
+    )
+
+    for name in pages.PARSERS:
+        try:
+            pages.get_parser(name)
+        except EnvironmentError:
+            print("{name:<12} (not installed)".format(name=name))
+
+            continue
+
+        timings = [
+            _time(functools.partial(function, *arguments_), arguments.repeat)
+            for function, *arguments_ in [
+                (pages.extract, contents, first, name),
+                (pages.extract, contents, last, name),
+                (pages.PageIndex.build, contents, name),
+                (pages.parse, contents, name),
+            ]
+        ]
+        print(
+            "{name:<12} {0:>8.3f}s {1:>8.3f}s {2:>8.3f}s {3:>8.3f}s".format(
+                *timings, name=name
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
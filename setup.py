@@ -79,5 +79,8 @@ setup(
     install_requires=[
         read("requirements.txt").splitlines(),
     ],
-    extras_require={},
+    extras_require={
+        "html5lib": ["html5lib"],
+        "lxml": ["lxml"],
+    },
 )
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Save every resolved code-include into one file so that later builds need no network.
+
+There are two modes, chosen with ``code_include_bundle_mode`` in ``conf.py``.
+
+- "record" - Every :class:`.SourceResult` that a build finds is written to
+  ``code_include_bundle_path`` once the build finishes.
+- "offline" - Every code-include is served from ``code_include_bundle_path``.
+  Nothing is imported or downloaded. A missing target raises
+  :class:`.MissingBundleEntry` immediately.
+
+The bundle is gzip-compressed JSON with a format version, so that an
+incompatible bundle is never silently misread.
+
+"""
+
+import gzip
+import json
+import logging
+import os
+import typing
+
+from sphinx import application as application_
+from sphinx import environment
+
+from . import error_classes
+from . import helper
+
+_LOGGER = logging.getLogger(__name__)
+_FORMAT = "sphinx-code-include-bundle"
+_VERSION = 1
+_ENVIRONMENT_KEY = "code_include_bundle"
+
+OFFLINE = "offline"
+RECORD = "record"
+
+Key = tuple[str, str, bool]
+"""The directive, namespace, and "prefer import" setting of some code-include."""
+
+
+class Result(typing.NamedTuple):
+    """The serializable parts of a :class:`.SourceResult`."""
+
+    code: str
+    namespace: str
+    source_code_link: str
+    documentation_link: str
+
+
+class Bundle(object):
+    """A collection of resolved code-include results, keyed by their target."""
+
+    def __init__(self, results: typing.Optional[dict[Key, Result]] = None) -> None:
+        """Keep track of every result.
+
+        Args:
+            results: Any pre-existing results to include.
+
+        """
+        super(Bundle, self).__init__()
+
+        self._results = results or {}
+
+    def __len__(self) -> int:
+        """int: The number of stored results."""
+        return len(self._results)
+
+    @classmethod
+    def load(cls, path: str) -> "Bundle":
+        """Read a bundle file from disk.
+
+        Args:
+            path: The absolute path to a file written by :meth:`Bundle.save`.
+
+        Raises:
+            EnvironmentError:
+                If ``path`` doesn't exist or it is not a bundle that
+                this version of code-include can read.
+
+        Returns:
+            The loaded bundle.
+
+        """
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as handler:
+                data = json.load(handler)
+        except (OSError, ValueError) as error:
+            raise EnvironmentError(
+                'Bundle "{path}" could not be read. Error: "{error}".'.format(
+                    path=path, error=error
+                )
+            )
+
+        if not isinstance(data, dict) or data.get("format") != _FORMAT:
+            raise EnvironmentError(
+                'Path "{path}" is not a code-include bundle.'.format(path=path)
+            )
+
+        if data.get("version") != _VERSION:
+            raise EnvironmentError(
+                'Bundle "{path}" has version "{version}" but only "{expected}" '
+                "is supported. Please re-record it.".format(
+                    path=path,
+                    version=data.get("version"),
+                    expected=_VERSION,
+                )
+            )
+
+        results = {}
+
+        for directive, namespace, prefer_import, *result in data["results"]:
+            results[(directive, namespace, prefer_import)] = Result(*result)
+
+        return cls(results)
+
+    def add(self, key: Key, result: Result) -> None:
+        """Include ``result`` in this bundle.
+
+        Args:
+            key: The code-include target which found ``result``.
+            result: The found source code and its links.
+
+        """
+        self._results[key] = result
+
+    def get(self, key: Key) -> Result:
+        """Find the stored result of some code-include target.
+
+        Args:
+            key: The directive, namespace, and "prefer import" setting to find.
+
+        Raises:
+            :class:`.MissingBundleEntry`: If ``key`` was never recorded.
+
+        Returns:
+            The found result.
+
+        """
+        try:
+            return self._results[key]
+        except KeyError:
+            directive, namespace, _ = key
+
+            raise error_classes.MissingBundleEntry(
+                'Directive / namespace "{directive} / {namespace}" is not in the '
+                "offline bundle. Re-record the bundle with "
+                'code_include_bundle_mode = "record".'.format(
+                    directive=directive,
+                    namespace=namespace,
+                )
+            )
+
+    def save(self, path: str) -> None:
+        """Write this bundle to disk.
+
+        Args:
+            path: The absolute path to write to. Any existing file is replaced.
+
+        """
+        data = {
+            "format": _FORMAT,
+            "version": _VERSION,
+            "results": [
+                [*key, *result] for key, result in sorted(self._results.items())
+            ],
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        helper.write_atomic(path, gzip.compress(json.dumps(data).encode("utf-8")))
+
+
+def _get_records(env: environment.BuildEnvironment) -> dict[str, dict[Key, Result]]:
+    """dict[str, dict[Key, Result]]: Get the recorded results of every document."""
+    if not hasattr(env, _ENVIRONMENT_KEY):
+        setattr(env, _ENVIRONMENT_KEY, {})
+
+    return typing.cast(dict[str, dict[Key, Result]], getattr(env, _ENVIRONMENT_KEY))
+
+
+def get_mode(application: typing.Optional[application_.Sphinx]) -> str:
+    """str: Get the user's ``code_include_bundle_mode``, if any."""
+    if not application or not getattr(application, "config", None):
+        return ""
+
+    return typing.cast(str, application.config.code_include_bundle_mode)
+
+
+def get_path(application: application_.Sphinx) -> str:
+    """Find where the bundle file is read from / written to.
+
+    Args:
+        application: The Sphinx application which is building.
+
+    Raises:
+        EnvironmentError: If the user set a bundle mode but no path.
+
+    Returns:
+        The absolute path to the bundle file.
+
+    """
+    path = application.config.code_include_bundle_path
+
+    if not path:
+        raise EnvironmentError(
+            'code_include_bundle_mode is "{mode}" but no code_include_bundle_path '
+            "was defined.".format(mode=get_mode(application))
+        )
+
+    return os.path.join(application.confdir, path)
+
+
+def record(
+    env: environment.BuildEnvironment,
+    docname: str,
+    key: Key,
+    result: Result,
+) -> None:
+    """Remember that ``docname`` resolved ``key`` as ``result``.
+
+    Args:
+        env: The environment which tracks every document.
+        docname: The document that has the code-include directive.
+        key: The directive, namespace, and "prefer import" setting of the directive.
+        result: The found source code and its links.
+
+    """
+    _get_records(env).setdefault(docname, {})[key] = result
+
+
+def purge_document(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+    docname: str,
+) -> None:
+    """Forget every result of ``docname``, because it is about to be re-read.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        docname: The document which is being removed or re-read.
+
+    """
+    _get_records(env).pop(docname, None)
+
+
+def merge_documents(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+    docnames: set[str],
+    other: environment.BuildEnvironment,
+) -> None:
+    """Copy the results of documents that were read in a parallel sub-process.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The main process's environment.
+        docnames: The documents that ``other`` read.
+        other: The sub-process's environment.
+
+    """
+    records = _get_records(env)
+    others = _get_records(other)
+
+    for name in docnames:
+        if name in others:
+            records[name] = others[name]
+
+
+def write(
+    application: application_.Sphinx,
+    exception: typing.Optional[Exception],
+) -> None:
+    """Save every recorded result to disk, if the user is recording.
+
+    Args:
+        application: The Sphinx application which just finished building.
+        exception: The error that stopped the build, if any.
+
+    """
+    if exception or get_mode(application) != RECORD:
+        return
+
+    bundle = Bundle()
+
+    for results in _get_records(application.env).values():
+        for key, result in results.items():
+            bundle.add(key, result)
+
+    path = get_path(application)
+    bundle.save(path)
+    _LOGGER.info('Wrote %s code-include result(s) to "%s".', len(bundle), path)
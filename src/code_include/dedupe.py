@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Share each finished code-include with every identical code-include of the build.
+
+The same few functions are often included on dozens of pages. Each
+distinct include - its role, namespace, and the options which change its
+code - is resolved and unindented once per-build. Every later
+occurrence re-uses the same, immutable :class:`Entry`.
+
+"""
+
+import typing
+
+from . import helper
+from . import records
+
+Key = tuple[str, str, bool, bool]
+"""The directive, namespace, "prefer import", and "unindent" setting of an include.
+
+These are every option which changes an include's code. The
+``link-to-*`` options only change which code is found through "prefer
+import". The rest of the options are applied to each include's own
+code-block, after the shared entry, so they're not part of the key:
+
+- ``language`` - The code-block's highlighting
+- ``link-at-bottom`` and ``link-to-*`` - Which hyperlinks are added, and where
+- ``fallback-text`` - Only used when no code is found, so there's no entry
+
+"""
+
+
+class Entry(typing.NamedTuple):
+    """A finished code-include and the record which it came from."""
+
+    record: records.Record
+    result: typing.Any
+    """The unindented (if requested) :class:`.SourceResult`."""
+
+
+class Store(object):
+    """Every finished code-include of a build. Every method is thread-safe."""
+
+    def __init__(self) -> None:
+        """Start with no entries."""
+        super(Store, self).__init__()
+
+        self._entries = helper.Cache()
+
+    def __contains__(self, key: object) -> bool:
+        """bool: Check if ``key`` is finished."""
+        return key in self._entries
+
+    def __len__(self) -> int:
+        """int: The number of distinct, finished code-includes."""
+        return len(self._entries)
+
+    @property
+    def saved(self) -> int:
+        """int: The number of resolutions which were avoided by re-using an entry."""
+        return self._entries.hits
+
+    def add(self, key: Key, entry: Entry) -> Entry:
+        """Share ``entry`` with every later occurrence of ``key``.
+
+        Args:
+            key: The canonical description of the code-include.
+            entry: The finished code-include.
+
+        Returns:
+            The shared entry. If another thread finished ``key`` first,
+            its entry is returned, instead.
+
+        """
+        return typing.cast(Entry, self._entries.setdefault(key, entry))
+
+    def clear(self) -> None:
+        """Remove every entry and reset the saved count."""
+        self._entries.clear()
+
+    def get(self, key: Key) -> typing.Optional[Entry]:
+        """Find the finished code-include of ``key``, if any.
+
+        Args:
+            key: The canonical description of the code-include.
+
+        Returns:
+            The found entry, if any.
+
+        """
+        return typing.cast(typing.Optional[Entry], self._entries.get(key))
@@ -38,3 +38,11 @@ class NotFoundUrl(Exception):
 
 class NoMatchFound(Exception):
     """The directive and namespace were correct but no source code could be found."""
+
+
+class MissingBundleEntry(Exception):
+    """If the offline bundle has no source code for the requested target."""
+
+
+class ImportWorkerError(Exception):
+    """If an out-of-process import took too long or its worker process stopped."""
@@ -3,6 +3,8 @@
 
 """The main module that adds the code-include directive to Sphinx."""
 
+import concurrent.futures
+import functools
 import logging
 import textwrap
 import typing
@@ -10,11 +12,22 @@ import typing
 from docutils import nodes
 from docutils.parsers import rst
 from sphinx import application as application_
+from sphinx import environment
+from sphinx import transforms
 from sphinx.writers import html5
 
+from . import bundle
+from . import dedupe
 from . import error_classes
+from . import fetch
 from . import formatter
+from . import highlight
+from . import prefetch
+from . import records
+from . import report
 from . import source_code
+from . import state
+from . import workers as workers_
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -66,20 +79,22 @@ class Directive(rst.Directive):
         if not source_code.APPLICATION:
             return False
 
-        return (
-            source_code.APPLICATION.config._raw_config.get(  # pylint: disable=protected-access
-                "code_include_reraise",
-            )
-            or False
+        return bool(
+            source_code.APPLICATION.config.code_include_reraise,
         )
 
-    def _get_code(
+    def _find_code(
         self,
         directive: str,
         namespace: str,
         prefer_import: bool = True,
-    ) -> typing.Optional[source_code.SourceResult]:
-        """Get the source code that the user requested.
+        found: typing.Optional[
+            typing.Union[source_code.SourceResult, Exception]
+        ] = None,
+    ) -> tuple[
+        typing.Optional[source_code.SourceResult], typing.Optional[records.Record]
+    ]:
+        """Get the source code that the user requested and the record that it came from.
 
         Args:
             directive:
@@ -92,13 +107,34 @@ class Directive(rst.Directive):
                 If ``False``, look for source code from Sphinx before and if not found,
                 do a real Python import for the source code. If ``True`` then do a
                 Python import first, instead.
+            found:
+                The source code of ``namespace`` or the error that finding
+                it raised, if it was already resolved. e.g. by :class:`_ResolveIncludes`.
 
         Returns:
-            The found source code, if any.
+            The found source code, if any, and its record. Fallback text
+            has no record.
 
         """
+        env = self.state.document.settings.env
+        key = (directive, namespace, prefer_import)
+        record = records.get(env, env.docname, key)
+
+        report.note_cache(bool(record))
+
+        if record:
+            _LOGGER.debug('Re-using the stored "%s / %s" result.', directive, namespace)
+            report.note_strategy(report.RECORD)
+            records.note_dependency(env, record)
+            self._record(key, record)
+
+            return (source_code.SourceResult(*record.result), record)
+
         try:
-            return source_code.get_source_code(
+            if isinstance(found, Exception):
+                raise found
+
+            result = found or source_code.get_source_code(
                 directive, namespace, prefer_import=prefer_import
             )
         except Exception as error:  # pylint: disable=broad-exception-caught
@@ -112,12 +148,53 @@ class Directive(rst.Directive):
             if text:
                 _LOGGER.info('code-include will use "%s" fallback text.', text)
 
-                return source_code.SourceResult(text, "", "", "")
+                return (source_code.SourceResult(text, "", "", ""), None)
 
             if self._reraise_exception():
                 raise
 
-        return None
+            return (None, None)
+
+        record = records.make(
+            result, namespace, state.get(source_code.APPLICATION).sources
+        )
+        records.add(env, env.docname, key, record)
+        records.note_dependency(env, record)
+        self._record(key, record)
+
+        return (result, record)
+
+    def _get_code(
+        self,
+        directive: str,
+        namespace: str,
+        prefer_import: bool = True,
+        found: typing.Optional[
+            typing.Union[source_code.SourceResult, Exception]
+        ] = None,
+    ) -> typing.Optional[source_code.SourceResult]:
+        """Get the source code that the user requested.
+
+        Args:
+            directive:
+                The tag / target that the user expects the namespace to be.
+                e.g. "func", "py:class", "class", etc.
+            namespace:
+                The identifier string that locates this code.
+                Example: "some_package_name.module_name.KlassName.get_foo".
+            prefer_import:
+                If ``False``, look for source code from Sphinx before and if not found,
+                do a real Python import for the source code. If ``True`` then do a
+                Python import first, instead.
+            found:
+                The source code of ``namespace`` or the error that finding
+                it raised, if it was already resolved. e.g. by :class:`_ResolveIncludes`.
+
+        Returns:
+            The found source code, if any.
+
+        """
+        return self._find_code(directive, namespace, prefer_import, found=found)[0]
 
     def _get_fallback_text(self) -> str:
         """str: Some text to render if the Sphinx namespace cannot be found."""
@@ -173,6 +250,35 @@ class Directive(rst.Directive):
         else:
             results.append(hyperlink)
 
+    def _reuse(self, key: bundle.Key, entry: dedupe.Entry) -> None:
+        """Use the shared ``entry`` in this document, without resolving it again.
+
+        Args:
+            key: The directive, namespace, and "prefer import" setting of the directive.
+            entry: The code-include which an identical directive already finished.
+
+        """
+        _LOGGER.debug('Re-using the shared "%s / %s" result.', key[0], key[1])
+        env = self.state.document.settings.env
+        report.note_reuse()
+        records.add(env, env.docname, key, entry.record)
+        records.note_dependency(env, entry.record)
+        self._record(key, entry.record)
+
+    def _record(self, key: bundle.Key, record: records.Record) -> None:
+        """Remember ``record`` so that it is written to the user's offline bundle.
+
+        Args:
+            key: The directive, namespace, and "prefer import" setting of the directive.
+            record: The found source code.
+
+        """
+        if bundle.get_mode(source_code.APPLICATION) != bundle.RECORD:
+            return
+
+        env = self.state.document.settings.env
+        bundle.record(env, env.docname, key, record.result)
+
     def _log_exception_context(
         self,
         error: Exception,
@@ -215,6 +321,11 @@ class Directive(rst.Directive):
 
             return
 
+        if isinstance(error, error_classes.MissingBundleEntry):
+            _LOGGER.warning("%s", error)
+
+            return
+
         if isinstance(error, error_classes.NoMatchFound):
             _LOGGER.warning(
                 'Directive / Namespace "%s / %s" has no matching source code.',
@@ -230,7 +341,7 @@ class Directive(rst.Directive):
             type(error),
         )
 
-    def run(self) -> list[nodes.literal_block]:
+    def run(self) -> list[nodes.Node]:
         """Create the code block, if it can.
 
         Raises:
@@ -262,6 +373,105 @@ class Directive(rst.Directive):
         directive, namespace = formatter.get_raw_content(target)
         directive = formatter.get_converted_directive(directive) or directive
 
+        if _is_deferred():
+            return [self._defer(directive, namespace)]
+
+        return list(self._measure(directive, namespace))
+
+    def _defer(self, directive: str, namespace: str) -> nodes.pending:
+        """Create a placeholder which is replaced once the whole document is parsed.
+
+        Args:
+            directive:
+                The Python type that `namespace` is. Example: "py:method".
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+
+        Returns:
+            The placeholder. See :class:`_ResolveIncludes`.
+
+        """
+        node = nodes.pending(
+            _ResolveIncludes,
+            details={
+                "directive": self,
+                "target": prefetch.Target(
+                    directive, namespace, frozenset(self.options)
+                ),
+            },
+        )
+        self.state.document.note_pending(node)
+
+        return node
+
+    def _measure(
+        self,
+        directive: str,
+        namespace: str,
+        found: typing.Optional[
+            typing.Union[source_code.SourceResult, Exception]
+        ] = None,
+        measured: typing.Optional[report.Include] = None,
+    ) -> list[nodes.literal_block]:
+        """Create the code block of ``namespace`` and add it to the user's report.
+
+        Args:
+            directive:
+                The Python type that `namespace` is. Example: "py:method".
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+            found:
+                The source code of ``namespace`` or the error that finding
+                it raised, if it was already resolved.
+            measured:
+                The measurements of finding ``found``, if it was found
+                in another thread. The rest of the directive is added to it.
+
+        Returns:
+            The code-blocks that this class generates.
+
+        """
+        if not report.is_enabled(source_code.APPLICATION):
+            return self._run(directive, namespace, found=found)
+
+        env = self.state.document.settings.env
+        include = measured or report.Include(env.docname, directive, namespace)
+
+        with report.measure(include):
+            results = self._run(directive, namespace, found=found)
+
+        report.add(env, include)
+
+        return results
+
+    def _run(
+        self,
+        directive: str,
+        namespace: str,
+        found: typing.Optional[
+            typing.Union[source_code.SourceResult, Exception]
+        ] = None,
+    ) -> list[nodes.literal_block]:
+        """Create the code block of ``namespace``, if it can.
+
+        Args:
+            directive:
+                The Python type that `namespace` is. Example: "py:method".
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+            found:
+                The source code of ``namespace`` or the error that finding
+                it raised, if it was already resolved.
+
+        Returns:
+            The code-blocks that this class generates. If any URLs
+            are missing, this function warns the user and returns no
+            code-blocks, instead.
+
+        """
         known_exceptions = (
             error_classes.MissingTag,
             error_classes.MissingNamespace,
@@ -277,62 +487,317 @@ class Directive(rst.Directive):
         _LOGGER.debug('is_source_requested="%s"', is_source_requested)
         _LOGGER.debug('is_link_requested="%s"', is_link_requested)
 
-        try:
-            result = self._get_code(
-                directive,
-                namespace,
-                prefer_import=not is_source_requested or not is_link_requested,
+        prefer_import = not is_source_requested or not is_link_requested
+        key = (directive, namespace, prefer_import, self._needs_unindent())
+        shared = _get_shared()
+        entry = shared.get(key) if shared is not None else None
+
+        if entry:
+            self._reuse(key[:3], entry)
+            result = entry.result
+        else:
+            try:
+                result, record = self._find_code(
+                    directive,
+                    namespace,
+                    prefer_import=prefer_import,
+                    found=found,
+                )
+            except known_exceptions:
+                if self._reraise_exception():
+                    raise
+
+                _LOGGER.warning('"Get Code" logic failed. Returning nothing')
+
+                return []
+
+            if not result:
+                _LOGGER.warning(
+                    'No source code was found for directive / namespace "%s / %s".',
+                    directive,
+                    namespace,
+                )
+
+                return []
+
+            if key[3]:
+                _LOGGER.debug('Unindenting "%s" namespace code.', result.namespace)
+
+                with report.phase(report.FORMAT):
+                    result = result.__class__(
+                        formatter.unindent_outer_whitespace(result.code),
+                        result.namespace,
+                        result.source_code_link,
+                        result.documentation_link,
+                    )
+
+            if shared is not None and record:
+                result = shared.add(key, dedupe.Entry(record, result)).result
+
+        with report.phase(report.FORMAT):
+            node = nodes.literal_block(result.code, result.code)
+            node["language"] = self.options.get("language", "python")
+            highlight.mark(node)
+
+            self.add_name(node)
+
+            results = [node]
+
+            if result.documentation_link and is_link_requested:
+                _LOGGER.debug("Adding documentation link to code-include.")
+
+                self._add_documentation_link(result, results)
+
+            if result.source_code_link and is_source_requested:
+                _LOGGER.debug("Adding source link to code-include.")
+
+                self._add_source_code_link(result, results)
+
+        _LOGGER.debug('Returning "%s" results', repr(results))
+
+        return results
+
+
+class _ResolveIncludes(transforms.SphinxTransform):
+    """Find the source code of every deferred code-include of a document, at once.
+
+    Each deferred :class:`Directive` leaves a :class:`docutils.nodes.pending`
+    placeholder. Once the whole document is parsed, the first placeholder
+    resolves every placeholder of the document together. Identical targets
+    are found once, their viewcode pages are read concurrently, and each
+    placeholder is replaced by its code-block and hyperlinks.
+
+    """
+
+    default_priority = 400
+
+    def apply(self, **kwargs: typing.Any) -> None:
+        """Replace every unresolved placeholder of the document.
+
+        Args:
+            **kwargs: Any keyword arguments from docutils. They're unused.
+
+        """
+        if typing.cast(nodes.pending, self.startnode).get("resolved"):
+            return
+
+        pending = [
+            node
+            for node in self.document.findall(nodes.pending)
+            if node.transform is _ResolveIncludes and not node.get("resolved")
+        ]
+        found = _resolve_targets(
+            self.env,
+            [node.details["target"] for node in pending],
+            prefetch.get_workers(self.app),
+        )
+        measured = {key: include for key, (_, include) in found.items()}
+
+        for node in pending:
+            node["resolved"] = True
+            directive: Directive = node.details["directive"]
+            target: prefetch.Target = node.details["target"]
+            key = _get_key(target)
+            results = directive._measure(  # pylint: disable=protected-access
+                target.directive,
+                target.namespace,
+                found=found[key][0] if key in found else None,
+                # Identical targets were found once, so only the first is measured
+                measured=measured.pop(key, None),
             )
-        except known_exceptions:
-            if self._reraise_exception():
-                raise
 
-            _LOGGER.warning('"Get Code" logic failed. Returning nothing')
+            if results:
+                node.replace_self(results)
+            else:
+                node.parent.remove(node)
 
-            return []
 
-        if not result:
-            _LOGGER.warning(
-                'No source code was found for directive / namespace "%s / %s".',
-                directive,
-                namespace,
+def _get_shared() -> typing.Optional[dedupe.Store]:
+    """Store: Get the finished code-includes of the current build, if there is a build."""
+    if not source_code.APPLICATION:
+        return None
+
+    return state.get(source_code.APPLICATION).includes
+
+
+def _get_key(target: prefetch.Target) -> bundle.Key:
+    """Key: Get the directive, namespace, and "prefer import" setting of ``target``."""
+    return (target.directive, target.namespace, target.prefers_import())
+
+
+def _is_deferred() -> bool:
+    """bool: Check if the user wants code-includes to be resolved once per-document."""
+    return bool(
+        source_code._get_setting(  # pylint: disable=protected-access
+            "code_include_deferred", False
+        )
+    )
+
+
+def _resolve_target(
+    key: bundle.Key,
+    document: str,
+) -> tuple[typing.Union[source_code.SourceResult, Exception], report.Include]:
+    """Find the source code of one deferred target and measure it for the report.
+
+    This function runs in a worker thread. Each thread measures into its
+    own :class:`.report.Include`, which the directive continues, later.
+
+    Args:
+        key: The directive, namespace, and "prefer import" setting of the target.
+        document: The document which has the target.
+
+    Returns:
+        The target's source code or the error it raised and its measurements.
+
+    """
+    directive, namespace, prefer_import = key
+    include = report.Include(document, directive, namespace)
+    result: typing.Union[source_code.SourceResult, Exception]
+
+    with report.measure(include):
+        try:
+            result = source_code.get_source_code(
+                directive, namespace, prefer_import=prefer_import
             )
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # The directive reports this error, once it uses the result
+            result = error
 
-            return []
+    return result, include
+
+
+def _resolve_targets(
+    env: environment.BuildEnvironment,
+    targets: list[prefetch.Target],
+    workers: int,
+) -> dict[
+    bundle.Key,
+    tuple[typing.Union[source_code.SourceResult, Exception], report.Include],
+]:
+    """Find the source code of many targets, concurrently.
+
+    Targets which are stored from an earlier build are skipped. The
+    directive re-uses their stored result itself.
+
+    Args:
+        env: The environment which tracks every document.
+        targets: Every deferred code-include of a document. May contain duplicates.
+        workers: The maximum number of pages / targets to find at the same time.
+
+    Returns:
+        Each resolved target, its source code or the error it raised,
+        and the measurements of finding it.
+
+    """
+    missing = {
+        _get_key(target): target
+        for target in targets
+        if not records.has(env, _get_key(target))
+    }
 
-        if self._needs_unindent():
-            _LOGGER.debug('Unindenting "%s" namespace code.', result.namespace)
+    if not missing:
+        return {}
 
-            result = result.__class__(
-                formatter.unindent_outer_whitespace(result.code),
-                result.namespace,
-                result.source_code_link,
-                result.documentation_link,
+    workers = max(1, workers or 1)
+
+    if bundle.get_mode(source_code.APPLICATION) != bundle.OFFLINE:
+        prefetch.prefetch_targets(
+            missing.values(), workers, env=env, document=env.docname
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(
+            zip(
+                missing,
+                executor.map(
+                    functools.partial(_resolve_target, document=env.docname),
+                    missing,
+                ),
             )
+        )
 
-        node = nodes.literal_block(result.code, result.code)
-        node["language"] = self.options.get("language", "python")
 
-        self.add_name(node)
+def _activate(
+    application: application_.Sphinx,
+    env: environment.BuildEnvironment,  # pylint: disable=unused-argument
+    added: set[str],  # pylint: disable=unused-argument
+    changed: set[str],  # pylint: disable=unused-argument
+    removed: set[str],  # pylint: disable=unused-argument
+) -> list[str]:
+    """Use the caches of ``application`` because it's about to read documents.
 
-        results = [node]
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        added: The documents which are new.
+        changed: The documents which changed.
+        removed: The documents which were deleted.
 
-        if result.documentation_link and is_link_requested:
-            _LOGGER.debug("Adding documentation link to code-include.")
+    Returns:
+        No extra documents need to be read.
 
-            self._add_documentation_link(result, results)
+    """
+    source_code.activate(application)
 
-        if result.source_code_link and is_source_requested:
-            _LOGGER.debug("Adding source link to code-include.")
+    return []
 
-            self._add_source_code_link(result, results)
 
-        _LOGGER.debug('Returning "%s" results', repr(results))
+def _clear_caches(application: application_.Sphinx) -> None:
+    """Remove any data from a previous build so that this build starts fresh.
 
-        return results
+    Args:
+        application: The Sphinx application that is about to build.
+
+    """
+    source_code.activate(application)
+    source_code.clear_caches()
+
+    if application.env:
+        report.reset(application.env, state.get(application).hosts)
+
+
+def _report_caches(
+    application: application_.Sphinx,
+    exception: typing.Optional[Exception],  # pylint: disable=unused-argument
+) -> None:
+    """Log how well code-include's caches were used during the build.
+
+    Args:
+        application: The Sphinx application that just finished building.
+        exception: The error that stopped the build, if any.
+
+    """
+    _LOGGER.info(
+        "code-include page cache: %s hits, %s misses, %s evictions.",
+        state.get(application).pages.hits,
+        state.get(application).pages.misses,
+        state.get(application).pages.evictions,
+    )
+    _LOGGER.info(
+        "code-include source file cache: %s hits, %s misses.",
+        state.get(application).sources.hits,
+        state.get(application).sources.misses,
+    )
+    _LOGGER.info(
+        "code-include identical includes: %s distinct, %s re-used.",
+        len(state.get(application).includes),
+        state.get(application).includes.saved,
+    )
+
+    highlighter = getattr(application.builder, "highlighter", None)
+
+    if isinstance(highlighter, highlight.Highlighter):
+        _LOGGER.info(
+            "code-include highlight cache: %s hits, %s misses.",
+            highlighter.hits,
+            highlighter.misses,
+        )
 
 
-def setup(application: application_.Sphinx) -> dict[str, bool]:
+def setup(
+    application: application_.Sphinx,
+) -> dict[str, typing.Union[bool, int]]:
     """Add the code-include directive to Sphinx.
 
     Important:
@@ -401,4 +866,81 @@ def setup(application: application_.Sphinx) -> dict[str, bool]:
         Directive,
     )
 
-    return {"parallel_read_safe": True, "parallel_write_safe": True}
+    # The code that code-includes find depends on the "env" settings, so
+    # Sphinx re-reads every document once one of them changes.
+    #
+    for name, default, rebuild, types in [
+        ("code_include_reraise", False, "", [bool]),
+        ("code_include_preprocessor", None, "", []),
+        (
+            "code_include_strategies",
+            list(source_code.DEFAULT_STRATEGIES),
+            "env",
+            [list, tuple],
+        ),
+        ("code_include_html_parser", "", "env", [str]),
+        ("code_include_bundle_mode", "", "env", [str]),
+        ("code_include_bundle_path", "", "env", [str]),
+        ("code_include_deferred", False, "", [bool]),
+        ("code_include_prefetch_workers", prefetch.DEFAULT_WORKERS, "", [int]),
+        ("code_include_check_remote", prefetch.DEFAULT_CHECK_REMOTE, "", [bool]),
+        ("code_include_cache_directory", fetch.DEFAULT_DIRECTORY, "", [str]),
+        ("code_include_cache_size", fetch.DEFAULT_CACHE_SIZE, "", [int]),
+        ("code_include_cache_max_age", fetch.DEFAULT_MAX_AGE, "", [int, float]),
+        ("code_include_cache_scope", "", "", [str]),
+        ("code_include_page_cache_size", 0, "", [int]),
+        ("code_include_page_cache_ttl", 0, "", [int, float]),
+        (
+            "code_include_connect_timeout",
+            fetch.DEFAULT_CONNECT_TIMEOUT,
+            "",
+            [int, float],
+        ),
+        ("code_include_read_timeout", fetch.DEFAULT_READ_TIMEOUT, "", [int, float]),
+        ("code_include_retries", fetch.DEFAULT_RETRIES, "", [int]),
+        ("code_include_retry_backoff", fetch.DEFAULT_BACKOFF, "", [int, float]),
+        ("code_include_circuit_breaker_threshold", fetch.DEFAULT_THRESHOLD, "", [int]),
+        (
+            "code_include_circuit_breaker_reset",
+            fetch.DEFAULT_RESET_AFTER,
+            "",
+            [int, float],
+        ),
+        ("code_include_import_workers", 0, "", [int]),
+        ("code_include_import_timeout", workers_.DEFAULT_TIMEOUT, "", [int, float]),
+        (
+            "code_include_import_worker_max_requests",
+            workers_.DEFAULT_MAX_REQUESTS,
+            "",
+            [int],
+        ),
+        (
+            "code_include_import_worker_max_memory",
+            workers_.DEFAULT_MAX_MEMORY,
+            "",
+            [int],
+        ),
+        ("code_include_highlight_cache_size", highlight.DEFAULT_CACHE_SIZE, "", [int]),
+        ("code_include_report_path", "", "", [str]),
+        ("code_include_report_slowest", report.DEFAULT_SLOWEST, "", [int]),
+    ]:
+        application.add_config_value(name, default, rebuild, types=types)
+
+    application.connect("builder-inited", _clear_caches)
+    application.connect("builder-inited", highlight.install)
+    application.connect("env-before-read-docs", prefetch.prefetch_documents)
+    application.connect("env-purge-doc", bundle.purge_document)
+    application.connect("env-merge-info", bundle.merge_documents)
+    application.connect("env-purge-doc", records.purge_document)
+    application.connect("env-merge-info", records.merge_documents)
+    application.connect("env-purge-doc", report.purge_document)
+    application.connect("env-merge-info", report.merge_documents)
+    application.connect("env-updated", records.prune)
+    application.connect("env-get-outdated", _activate)
+    application.connect("env-get-outdated", records.get_outdated)
+    application.connect("env-get-outdated", prefetch.get_outdated)
+    application.connect("build-finished", _report_caches)
+    application.connect("build-finished", bundle.write)
+    application.connect("build-finished", report.write)
+
+    return {"env_version": 1, "parallel_read_safe": True, "parallel_write_safe": True}
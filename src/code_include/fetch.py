@@ -0,0 +1,793 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Download remote viewcode pages and keep them on-disk between builds.
+
+Every request goes through a :class:`ConnectionPool`, which keeps
+persistent HTTP/1.1 connections open per-host so that a build with
+hundreds of pages on the same website only pays for one TCP / TLS
+handshake. Responses may be gzip / deflate compressed.
+
+Slow or dead websites are handled with connect / read timeouts,
+retries with jittered exponential backoff, and a per-host
+:class:`CircuitBreaker`. Once a host fails too often, later requests to
+it fail immediately instead of waiting for yet another timeout.
+
+Each downloaded page is stored alongside its ETag / Last-Modified
+validators. Later builds send a conditional request so that an unchanged
+page comes back as a cheap "304 Not Modified" response. Within
+``max_age`` seconds of the last download, no request is made at all.
+
+"""
+
+import collections
+import gzip
+import http.client
+import json
+import logging
+import random
+import threading
+import time
+import typing
+import zlib
+from urllib import error as urllib_error
+from urllib import parse
+from urllib import request as urllib_request
+
+from . import error_classes
+from . import helper
+from . import report
+
+_CONTENTS = ".html"
+_LOGGER = logging.getLogger(__name__)
+_METADATA = ".json"
+_NOT_MODIFIED = 304
+_REDIRECTS = frozenset((301, 302, 303, 307, 308))
+_MAXIMUM_REDIRECTS = 5
+_USER_AGENT = "sphinx-code-include"
+_WEB_SCHEMES = frozenset(("http", "https"))
+_RETRY_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+DEFAULT_DIRECTORY = ""
+"""The default ``code_include_cache_directory``. Empty means Sphinx's doctree directory."""
+DEFAULT_CACHE_SIZE = 50 * 1024 * 1024
+"""The default ``code_include_cache_size``, in bytes."""
+DEFAULT_MAX_AGE = 0
+"""The default ``code_include_cache_max_age``, in seconds."""
+DEFAULT_CONNECT_TIMEOUT = 10
+"""The default ``code_include_connect_timeout``, in seconds."""
+DEFAULT_READ_TIMEOUT = 30
+"""The default ``code_include_read_timeout``, in seconds."""
+DEFAULT_RETRIES = 2
+"""The default ``code_include_retries``."""
+DEFAULT_BACKOFF = 0.5
+"""The default ``code_include_retry_backoff``, in seconds."""
+DEFAULT_THRESHOLD = 5
+"""The default ``code_include_circuit_breaker_threshold``."""
+DEFAULT_RESET_AFTER = 60
+"""The default ``code_include_circuit_breaker_reset``, in seconds."""
+
+_Host = tuple[str, str, int]
+
+
+class _Entry(typing.NamedTuple):
+    """The metadata of one cached page."""
+
+    url: str
+    etag: str
+    last_modified: str
+    fetched: float
+    size: int
+
+
+class Response(typing.NamedTuple):
+    """The parts of an HTTP response that code-include cares about."""
+
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+
+class RetryPolicy(typing.NamedTuple):
+    """How many times, and how long to wait, before re-sending a failed request.
+
+    Attributes:
+        retries (int):
+            The number of extra attempts after the first one fails.
+        backoff (float):
+            The base number of seconds to wait. Each retry doubles it.
+        maximum (float):
+            The most seconds to wait between any two attempts.
+
+    """
+
+    retries: int = DEFAULT_RETRIES
+    backoff: float = DEFAULT_BACKOFF
+    maximum: float = 8.0
+
+    def get_delay(self, attempt: int) -> float:
+        """Find how long to wait before sending the next request.
+
+        This uses "full jitter" so that many failed requests don't all
+        retry at the same time.
+
+        Args:
+            attempt: The number of attempts which failed so far, starting at 1.
+
+        Returns:
+            The number of seconds to wait.
+
+        """
+        return random.uniform(0, min(self.maximum, self.backoff * 2 ** (attempt - 1)))
+
+
+class Options(typing.NamedTuple):
+    """The settings of a :class:`Fetcher`.
+
+    Attributes:
+        max_age (float):
+            The number of seconds that a stored page is assumed to be
+            up-to-date. Within this time, no request is sent.
+        retry (RetryPolicy):
+            How to re-try requests that failed for a temporary reason.
+        threshold (int):
+            The number of consecutive failures that stops all requests
+            to a host. See :class:`CircuitBreaker`.
+        reset_after (float):
+            The number of seconds to wait before trying a failing host again.
+
+    """
+
+    max_age: float = DEFAULT_MAX_AGE
+    retry: RetryPolicy = RetryPolicy()
+    threshold: int = DEFAULT_THRESHOLD
+    reset_after: float = DEFAULT_RESET_AFTER
+
+
+class CircuitBreaker(object):
+    """Stop sending requests to a host once it fails too many times in a row.
+
+    After ``threshold`` consecutive failures, a host is "open" and
+    every request to it fails immediately. Once ``reset_after`` seconds
+    pass, one request is allowed through. If it succeeds, the host is
+    usable again. If not, it stays open for another ``reset_after``.
+
+    """
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_THRESHOLD,
+        reset_after: float = DEFAULT_RESET_AFTER,
+    ) -> None:
+        """Keep track of each host's failures.
+
+        Args:
+            threshold:
+                The number of consecutive failures that opens a host.
+                A value of 0 or less never opens any host.
+            reset_after:
+                The number of seconds to wait before trying an open host again.
+
+        """
+        super(CircuitBreaker, self).__init__()
+
+        self._threshold = threshold
+        self._reset_after = reset_after
+        self._failures: collections.Counter[str] = collections.Counter()
+        self._opened: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        """Check if a request may be sent to ``host``.
+
+        Args:
+            host: The network location of some website. e.g. "www.foo.com:443".
+
+        Returns:
+            If ``host`` is usable.
+
+        """
+        with self._lock:
+            opened = self._opened.get(host)
+
+            if opened is None:
+                return True
+
+            if time.monotonic() - opened < self._reset_after:
+                return False
+
+            # Let one request through. Until it finishes, pretend the
+            # host was just opened so that other requests still fail fast.
+            #
+            self._opened[host] = time.monotonic()
+
+            return True
+
+    def record_failure(self, host: str) -> None:
+        """Count a failed request to ``host``, opening it if it failed too often.
+
+        Args:
+            host: The network location of some website. e.g. "www.foo.com:443".
+
+        """
+        with self._lock:
+            self._failures[host] += 1
+
+            if 0 < self._threshold <= self._failures[host]:
+                if host not in self._opened:
+                    _LOGGER.warning(
+                        'Host "%s" failed %s times. It will be skipped.',
+                        host,
+                        self._failures[host],
+                    )
+
+                self._opened[host] = time.monotonic()
+
+    def record_success(self, host: str) -> None:
+        """Mark ``host`` as usable again.
+
+        Args:
+            host: The network location of some website. e.g. "www.foo.com:443".
+
+        """
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened.pop(host, None)
+
+
+class ConnectionPool(object):
+    """Re-use persistent HTTP/1.1 connections, per-host.
+
+    Attributes:
+        connections (int): The number of connections which were opened so far.
+        requests (int): The number of requests which were sent so far.
+
+    """
+
+    def __init__(
+        self,
+        maximum: int = 8,
+        connect_timeout: typing.Optional[float] = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: typing.Optional[float] = DEFAULT_READ_TIMEOUT,
+    ) -> None:
+        """Create an empty pool.
+
+        Args:
+            maximum:
+                The most idle connections to keep open for any one host.
+                Extra connections are closed once they're done.
+            connect_timeout:
+                The most seconds to wait while opening a new connection.
+                If ``None``, wait forever.
+            read_timeout:
+                The most seconds to wait for any response data.
+                If ``None``, wait forever.
+
+        """
+        super(ConnectionPool, self).__init__()
+
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+
+        self._idle: collections.defaultdict[_Host, list[http.client.HTTPConnection]] = (
+            collections.defaultdict(list)
+        )
+        self._maximum = maximum
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+    @property
+    def read_timeout(self) -> typing.Optional[float]:
+        """float: The most seconds to wait for any response data, if any."""
+        return self._read_timeout
+
+    def _acquire(self, host: _Host) -> tuple[http.client.HTTPConnection, bool]:
+        """Find an idle connection to ``host`` or open a new one.
+
+        Args:
+            host: The scheme, host name, and port to connect to.
+
+        Raises:
+            OSError: If a new connection could not be opened in time.
+
+        Returns:
+            The connection and ``True`` if it was used before.
+
+        """
+        with self._lock:
+            idle = self._idle[host]
+
+            if idle:
+                return idle.pop(), True
+
+            self.connections += 1
+
+        scheme, name, port = host
+        connection: http.client.HTTPConnection
+
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                name, port, timeout=self._connect_timeout
+            )
+        else:
+            connection = http.client.HTTPConnection(
+                name, port, timeout=self._connect_timeout
+            )
+
+        try:
+            connection.connect()
+        except BaseException:
+            connection.close()
+
+            raise
+
+        if connection.sock:
+            connection.sock.settimeout(self._read_timeout)
+
+        return connection, False
+
+    def _release(
+        self,
+        host: _Host,
+        connection: http.client.HTTPConnection,
+    ) -> None:
+        """Make ``connection`` available for other requests.
+
+        Args:
+            host: The scheme, host name, and port of ``connection``.
+            connection: An open connection which has no pending response.
+
+        """
+        with self._lock:
+            idle = self._idle[host]
+
+            if len(idle) < self._maximum:
+                idle.append(connection)
+
+                return
+
+        connection.close()
+
+    def _send(self, url: str, headers: dict[str, str]) -> Response:
+        """Send one GET request, without following redirects.
+
+        Args:
+            url: Some website address.
+            headers: Extra HTTP headers to include in the request.
+
+        Raises:
+            ValueError: If ``url`` isn't an HTTP / HTTPS URL.
+
+        Returns:
+            The response, with its body already decompressed.
+
+        """
+        parts = parse.urlsplit(url)
+
+        if parts.scheme not in _WEB_SCHEMES or not parts.hostname:
+            raise ValueError('URL "{url}" is not a web address.'.format(url=url))
+
+        default_port = 443 if parts.scheme == "https" else 80
+        host = (parts.scheme, parts.hostname, parts.port or default_port)
+        path = parts.path or "/"
+
+        if parts.query:
+            path += "?" + parts.query
+
+        headers = dict(headers)
+        headers.setdefault("Accept-Encoding", "gzip, deflate")
+        headers.setdefault("User-Agent", _USER_AGENT)
+
+        while True:
+            connection, reused = self._acquire(host)
+
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+
+                if reused:
+                    # The server closed an idle connection. Try again
+                    # with a different (or brand new) connection.
+                    #
+                    continue
+
+                raise
+            except BaseException:
+                connection.close()
+
+                raise
+
+            break
+
+        with self._lock:
+            self.requests += 1
+
+        response_headers = _get_headers(response.headers)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(host, connection)
+
+        return Response(
+            response.status,
+            response_headers,
+            _decompress(body, response_headers.get("content-encoding", "")),
+        )
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        with self._lock:
+            idle = [connection for items in self._idle.values() for connection in items]
+            self._idle.clear()
+
+        for connection in idle:
+            connection.close()
+
+    def request(self, url: str, headers: dict[str, str]) -> Response:
+        """Send a GET request for ``url``, following any redirects.
+
+        Args:
+            url: Some website address.
+            headers: Extra HTTP headers to include in the request.
+
+        Raises:
+            :class:`urllib.error.HTTPError`:
+                If the server responds with an error status code.
+
+        Returns:
+            The final response. A "304 Not Modified" is returned, not raised.
+
+        """
+        for _ in range(_MAXIMUM_REDIRECTS + 1):
+            response = self._send(url, headers)
+
+            if response.status in _REDIRECTS and "location" in response.headers:
+                url = parse.urljoin(url, response.headers["location"])
+
+                continue
+
+            if response.status >= 400:
+                raise urllib_error.HTTPError(
+                    url,
+                    response.status,
+                    "Request failed",
+                    http.client.HTTPMessage(),
+                    None,
+                )
+
+            return response
+
+        raise urllib_error.URLError(
+            'URL "{url}" has too many redirects.'.format(url=url)
+        )
+
+
+class DiskCache(object):
+    """A size-capped, least-recently-used store of downloaded pages.
+
+    Every page is written as two files, ``{key}.html`` (the raw
+    contents) and ``{key}.json`` (its validators), in a
+    :class:`.helper.DiskStore`.
+
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Keep track of the directory where pages are stored.
+
+        Args:
+            directory:
+                An absolute path on-disk where pages will be written to. It
+                is created if it doesn't exist.
+            max_size:
+                The maximum number of bytes that all pages may use.
+                If a new page would go above this limit, the
+                least-recently-used pages are deleted.
+
+        """
+        super(DiskCache, self).__init__()
+
+        self._store = helper.DiskStore(directory, (_CONTENTS, _METADATA), max_size)
+
+    def get(self, url: str) -> typing.Optional[tuple[_Entry, bytes]]:
+        """Find the stored page for ``url``, if any.
+
+        Args:
+            url: Some website address to a viewcode page.
+
+        Returns:
+            The page's metadata and raw contents, if ``url`` was stored.
+
+        """
+        files = self._store.read(url)
+
+        if files is None:
+            return None
+
+        try:
+            entry = _Entry(**json.loads(files[_METADATA]))
+        except (TypeError, ValueError):
+            return None
+
+        return entry, files[_CONTENTS]
+
+    def set(self, entry: _Entry, contents: bytes) -> None:
+        """Write ``contents`` to disk, evicting old pages if needed.
+
+        Args:
+            entry: The validators of ``contents``.
+            contents: The raw HTML page to store.
+
+        """
+        files = {
+            _CONTENTS: contents,
+            _METADATA: json.dumps(entry._asdict()).encode("utf-8"),
+        }
+
+        if not self._store.write(entry.url, files):
+            _LOGGER.debug('Page "%s" is too large to cache.', entry.url)
+
+    def remove(self, url: str) -> None:
+        """Delete the stored page of ``url``, if any.
+
+        Args:
+            url: Some website address to a viewcode page.
+
+        """
+        self._store.remove(url)
+
+    def touch(self, entry: _Entry) -> None:
+        """Mark an existing page as freshly validated.
+
+        Args:
+            entry: The page's validators. Its ``fetched`` time is written to disk.
+
+        """
+        try:
+            self._store.update(
+                entry.url, _METADATA, json.dumps(entry._asdict()).encode("utf-8")
+            )
+        except OSError:
+            pass
+
+
+class Fetcher(object):
+    """Download viewcode pages, using a :class:`DiskCache` if one is given."""
+
+    def __init__(
+        self,
+        cache: typing.Optional[DiskCache] = None,
+        pool: typing.Optional[ConnectionPool] = None,
+        options: Options = Options(),
+        hosts: typing.Optional[report.Hosts] = None,
+    ) -> None:
+        """Store the options that control how pages are downloaded.
+
+        Args:
+            cache:
+                A place to store each page between builds. If no cache is
+                given, every page is always downloaded.
+            pool:
+                The connections to send requests with. If no pool is
+                given, a new one is made.
+            options:
+                The maximum age of stored pages, how to re-try failed
+                requests, and when to stop sending requests to a failing host.
+            hosts:
+                If given, the latency and size of every request is added
+                to it. See :mod:`.report`.
+
+        """
+        super(Fetcher, self).__init__()
+
+        self._cache = cache
+        self._max_age = options.max_age
+        self.pool = pool or ConnectionPool()
+        self._retry = options.retry
+        self._breaker = CircuitBreaker(options.threshold, options.reset_after)
+        self._hosts = hosts
+
+    def _note(
+        self,
+        host: str,
+        started: float,
+        size: int = 0,
+        failed: bool = False,
+    ) -> None:
+        """Measure one request which started at ``started`` (a :func:`time.perf_counter`)."""
+        report.note_transfer(size)
+
+        if self._hosts is not None:
+            self._hosts.add(host, time.perf_counter() - started, size, failed=failed)
+
+    def _request(self, url: str, headers: dict[str, str]) -> Response:
+        """Send a GET request, re-trying any temporary failures.
+
+        Args:
+            url: Some website address.
+            headers: Extra HTTP headers to include in the request.
+
+        Raises:
+            :class:`.NotFoundUrl`:
+                If the host of ``url`` failed too many times, recently.
+                No request is sent.
+
+        Returns:
+            The final response.
+
+        """
+        host = parse.urlsplit(url).netloc
+        attempt = 0
+
+        while True:
+            if not self._breaker.allow(host):
+                raise error_classes.NotFoundUrl(
+                    'Host "{host}" is unavailable. Skipped "{url}".'.format(
+                        host=host, url=url
+                    )
+                )
+
+            attempt += 1
+            started = time.perf_counter()
+
+            try:
+                response = self.pool.request(url, headers)
+            except urllib_error.HTTPError as error:
+                self._note(host, started, failed=True)
+
+                if error.code not in _RETRY_STATUSES:
+                    # The host is fine, the page just doesn't exist
+                    self._breaker.record_success(host)
+
+                    raise
+
+                self._breaker.record_failure(host)
+
+                if attempt > self._retry.retries:
+                    raise
+            except (OSError, http.client.HTTPException):
+                self._note(host, started, failed=True)
+                self._breaker.record_failure(host)
+
+                if attempt > self._retry.retries:
+                    raise
+            else:
+                self._note(host, started, size=len(response.body))
+                self._breaker.record_success(host)
+
+                return response
+
+            delay = self._retry.get_delay(attempt)
+            _LOGGER.debug('Request "%s" failed. Retrying in %.2f seconds.', url, delay)
+            time.sleep(delay)
+
+    def close(self) -> None:
+        """Close any connections which are still open."""
+        self.pool.close()
+
+    def fetch(self, url: str) -> bytes:
+        """Get the raw contents of ``url``.
+
+        Args:
+            url: Some website address to a viewcode page.
+
+        Raises:
+            :class:`urllib.error.HTTPError`:
+                If the server responds with an error status code which
+                isn't temporary, e.g. because the page was removed. Any
+                stored copy of the page is deleted.
+
+        Returns:
+            The downloaded (or stored) page. If the page couldn't be
+            downloaded because of a timeout, connection failure, or an
+            unavailable host, its stored copy is used, if any.
+
+        """
+        if parse.urlsplit(url).scheme not in _WEB_SCHEMES:
+            # Rare, but intersphinx could point to a "file://" or similar URL
+            with urllib_request.urlopen(url, timeout=self.pool.read_timeout) as handler:
+                return typing.cast(bytes, handler.read())
+
+        if not self._cache:
+            return self._request(url, {}).body
+
+        stored = self._cache.get(url)
+        headers = {}
+
+        if stored:
+            entry, contents = stored
+
+            if time.time() - entry.fetched < self._max_age:
+                _LOGGER.debug('Page "%s" is still fresh. No request was sent.', url)
+
+                return contents
+
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            status, response_headers, body = self._request(url, headers)
+        except (OSError, http.client.HTTPException, error_classes.NotFoundUrl) as error:
+            if stored and _is_definitive(error):
+                # The server answered, so the stored page is out of date
+                self._cache.remove(url)
+            elif stored:
+                # A stale page is still better than no page at all
+                _LOGGER.warning(
+                    'Page "%s" could not be re-validated. Using a stored copy.', url
+                )
+
+                return stored[1]
+
+            raise
+
+        if status == _NOT_MODIFIED and stored:
+            _LOGGER.debug('Page "%s" was not modified.', url)
+            entry, contents = stored
+            self._cache.touch(entry._replace(fetched=time.time()))
+
+            return contents
+
+        self._cache.set(
+            _Entry(
+                url=url,
+                etag=response_headers.get("etag", ""),
+                last_modified=response_headers.get("last-modified", ""),
+                fetched=time.time(),
+                size=len(body),
+            ),
+            body,
+        )
+
+        return body
+
+
+def _decompress(body: bytes, encoding: str) -> bytes:
+    """Undo any gzip / deflate compression of ``body``.
+
+    Args:
+        body: Some HTTP response contents.
+        encoding: The response's "Content-Encoding" header.
+
+    Returns:
+        The uncompressed data.
+
+    """
+    encoding = encoding.strip().lower()
+
+    if encoding in ("gzip", "x-gzip"):
+        return gzip.decompress(body)
+
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send "raw" deflate data, without a zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+
+    return body
+
+
+def _is_definitive(error: Exception) -> bool:
+    """bool: Check if ``error`` is a server's final answer, e.g. "404 Not Found"."""
+    return (
+        isinstance(error, urllib_error.HTTPError) and error.code not in _RETRY_STATUSES
+    )
+
+
+def _get_headers(headers: typing.Any) -> dict[str, str]:
+    """dict[str, str]: Convert HTTP response ``headers`` to lower-case names."""
+    return {key.lower(): value for key, value in headers.items()}
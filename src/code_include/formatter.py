@@ -44,6 +44,8 @@ def get_converted_directive(directive: str) -> str:
     inventory_directive_mapper = {
         "attr": "py:attribute",
         "class": "py:class",
+        "data": "py:data",
+        "exc": "py:exception",
         "func": "py:function",
         "meth": "py:method",
         "mod": "py:module",
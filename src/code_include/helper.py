@@ -5,61 +5,636 @@
 
 from __future__ import annotations
 
+import collections
+import functools
+import hashlib
+import logging
+import os
+import threading
+import time
 import typing
+import uuid
 
+_LOGGER = logging.getLogger(__name__)
+_MISSING = object()
 
-class MemoDict(dict[typing.Any, typing.Any]):
-    """A class that stores a function and caches each unique function call."""
+# The operating system applies the process's umask, like for any other
+# new file. Reading the umask in Python means setting it, which races
+# with other threads that create files.
+#
+_FILE_MODE = 0o666
+_TEMPORARY_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
 
-    def __init__(self, function: typing.Callable[..., typing.Any]) -> None:
+
+class _Flight(object):  # pylint: disable=too-few-public-methods
+    """One call of a :meth:`Cache.get_or_create` factory, which other threads wait for."""
+
+    def __init__(self) -> None:
+        """Start the call."""
+        super(_Flight, self).__init__()
+
+        self.done = threading.Event()
+        self.error: typing.Optional[BaseException] = None
+        self.value: typing.Any = None
+
+
+class Cache(object):
+    """A thread-safe, least-recently-used cache with optional size and age limits.
+
+    When many threads ask for the same missing key at once, only one of
+    them creates its value. The others wait and re-use it.
+
+    Attributes:
+        evictions (int): The number of values which were removed because of a limit.
+        hits (int): The number of times that a value was served from memory.
+        misses (int): The number of times that a value had to be created.
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, max_size: int = 0, ttl: float = 0.0) -> None:
+        """Create an empty cache.
+
+        Args:
+            max_size:
+                The maximum number of values to keep. Once a new value
+                would go above it, the least-recently-used value is
+                removed. 0 means there's no limit.
+            ttl:
+                The number of seconds that each value is kept for. 0
+                means that values never expire.
+
+        """
+        super(Cache, self).__init__()
+
+        self._entries: collections.OrderedDict[
+            typing.Hashable, tuple[float, typing.Any]
+        ] = collections.OrderedDict()
+        self._flights: dict[typing.Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._ttl = ttl
+        self.evictions = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: object) -> bool:
+        """bool: Check if ``key`` has a value which hasn't expired."""
+        with self._lock:
+            return self._find(key) is not _MISSING
+
+    def __len__(self) -> int:
+        """int: The number of values which are currently stored."""
+        return len(self._entries)
+
+    def _find(self, key: typing.Hashable) -> typing.Any:
+        """Get the value of ``key`` and mark it as most-recently-used.
+
+        The caller must hold the lock.
+
+        Args:
+            key: Some cache key.
+
+        Returns:
+            The found value or ``_MISSING`` if there's no value or it expired.
+
+        """
+        try:
+            created, value = self._entries[key]
+        except KeyError:
+            return _MISSING
+
+        if self._ttl and time.monotonic() - created > self._ttl:
+            del self._entries[key]
+            self.evictions += 1
+
+            return _MISSING
+
+        self._entries.move_to_end(key)
+
+        return value
+
+    def _store(self, key: typing.Hashable, value: typing.Any) -> None:
+        """Add ``value``, removing the least-recently-used values if it's too full.
+
+        The caller must hold the lock.
+
+        Args:
+            key: Some cache key.
+            value: The value to keep.
+
+        """
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+
+        while self._max_size and len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every value and reset the hit / miss / eviction counts."""
+        with self._lock:
+            self._entries.clear()
+            self.evictions = 0
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        """Find the value of ``key``, if any.
+
+        Args:
+            key: Some cache key.
+            default: The value to return if ``key`` has no value.
+
+        Returns:
+            The found value or ``default``.
+
+        """
+        with self._lock:
+            value = self._find(key)
+
+            if value is _MISSING:
+                self.misses += 1
+
+                return default
+
+            self.hits += 1
+
+            return value
+
+    def get_or_create(
+        self,
+        key: typing.Hashable,
+        factory: typing.Callable[[], typing.Any],
+        is_valid: typing.Optional[typing.Callable[[typing.Any], bool]] = None,
+    ) -> typing.Any:
+        """Find the value of ``key``, creating it only if needed.
+
+        If ``factory`` raises an exception, nothing is stored and every
+        thread which waited for it gets the same exception.
+
+        Args:
+            key: Some cache key.
+            factory: A function which creates the value of ``key``.
+            is_valid:
+                If provided, a function which checks if a stored value
+                is still up to date. If it isn't, the value is created again.
+
+        Returns:
+            The found or newly-created value.
+
+        """
+        with self._lock:
+            value = self._find(key)
+
+            if value is not _MISSING and (is_valid is None or is_valid(value)):
+                self.hits += 1
+
+                return value
+
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if flight is None:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+            else:
+                self.hits += 1
+
+        if not leader:
+            flight.done.wait()
+
+            if flight.error:
+                raise flight.error
+
+            return flight.value
+
+        try:
+            flight.value = factory()
+        except BaseException as error:
+            flight.error = error
+
+            raise
+        else:
+            with self._lock:
+                self._store(key, flight.value)
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+            flight.done.set()
+
+        return flight.value
+
+    def invalidate(self, key: typing.Hashable) -> bool:
+        """Remove the value of ``key`` so that it's created again, next time.
+
+        Args:
+            key: Some cache key.
+
+        Returns:
+            If ``key`` had a value.
+
+        """
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        """Keep ``value`` for ``key``, replacing any older value.
+
+        Args:
+            key: Some cache key.
+            value: The value to keep.
+
+        """
+        with self._lock:
+            self._store(key, value)
+
+    def setdefault(self, key: typing.Hashable, value: typing.Any) -> typing.Any:
+        """Keep ``value`` for ``key``, unless ``key`` already has a value.
+
+        Args:
+            key: Some cache key.
+            value: The value to keep.
+
+        Returns:
+            The value of ``key``. If another thread stored a value first,
+            that value is returned, instead.
+
+        """
+        with self._lock:
+            found = self._find(key)
+
+            if found is not _MISSING:
+                return found
+
+            self._store(key, value)
+
+            return value
+
+
+class Memoized(object):  # pylint: disable=too-few-public-methods
+    """A function whose results are kept in a :class:`Cache`, per unique arguments.
+
+    Attributes:
+        cache (Cache): Every result of the function.
+        function (callable): The function to remember.
+
+    """
+
+    def __init__(
+        self, function: typing.Callable[..., typing.Any], cache: Cache
+    ) -> None:
         """Keep track of a function so that we can call it later.
 
         Args:
             function: The callable function to remember.
+            cache: The object which stores each result.
 
         """
-        super().__init__()
+        super(Memoized, self).__init__()
 
+        self.cache = cache
         self.function = function
+        functools.update_wrapper(self, function)
 
-    def __call__(self, *args: str) -> typing.Any:
-        """Get data from this instance using ``args``.
+    def __call__(self, *args: typing.Hashable) -> typing.Any:
+        """Get the result of ``args``, calling the function only if needed.
 
         Args:
-            args: Any data to query from.
+            args: The arguments to call the function with.
 
         Returns:
             The result.
 
         """
-        return self[args]
+        return self.cache.get_or_create(args, lambda: self.function(*args))
 
-    def __missing__(self, key: str) -> typing.Any:
-        """Pass ``key`` to the underlying function and call it from there.
 
-        Args:
-            key: The information to send to the function.
+@typing.overload
+def memoize(function: typing.Callable[..., typing.Any]) -> Memoized:
+    """Cache the results of ``function``, with no limits."""
 
-        """
-        result = self.function(*key)
-        self[key] = result
 
-        return result
+@typing.overload
+def memoize(
+    function: None = None, max_size: int = 0, ttl: float = 0.0
+) -> typing.Callable[[typing.Callable[..., typing.Any]], Memoized]:
+    """Make a decorator which caches results, with optional size and age limits."""
 
 
-def memoize(function: typing.Callable[..., typing.Any]) -> MemoDict:
+def memoize(
+    function: typing.Optional[typing.Callable[..., typing.Any]] = None,
+    max_size: int = 0,
+    ttl: float = 0.0,
+) -> typing.Union[
+    Memoized, typing.Callable[[typing.Callable[..., typing.Any]], Memoized]
+]:
     """Wrap a function with this decorator to cache its results.
 
-    Reference:
-        http://code.activestate.com/recipes/578231-probably-the-fastest-memoization-decorator-in-the-/#c1
+    Use it as ``@memoize`` or, to limit the cache, as
+    ``@memoize(max_size=100, ttl=60.0)``.
 
     Args:
         function:
             Some Python callable will become cache-able by this function.
+        max_size:
+            The maximum number of results to keep. See :class:`Cache`.
+        ttl:
+            The number of seconds that each result is kept for. See :class:`Cache`.
 
     Returns:
         A per-function instance gets called only once for a set of
-        arguments once.
+        arguments once. If no ``function`` is given, a decorator which
+        makes that instance.
 
     """
-    return MemoDict(function)
+
+    def _wrap(function_: typing.Callable[..., typing.Any]) -> Memoized:
+        return Memoized(function_, Cache(max_size=max_size, ttl=ttl))
+
+    if function is None:
+        return _wrap
+
+    return _wrap(function)
+
+
+class DiskStore(object):
+    """A thread-safe, size-capped, least-recently-used store of files on-disk.
+
+    Every entry is one file per suffix, which all share a name. e.g. a
+    downloaded page is stored as ``{name}.html`` and ``{name}.json``.
+    Whenever an entry is used, its modification time is refreshed so
+    that the oldest modification time is always the least-recently-used
+    entry.
+
+    The directory is only listed once, the first time that an entry is
+    written. Afterwards, the size and order of every entry is kept in
+    memory, so writing doesn't get slower as the store grows.
+
+    """
+
+    def __init__(
+        self, directory: str, suffixes: typing.Sequence[str], max_size: int
+    ) -> None:
+        """Keep track of the directory where entries are stored.
+
+        Args:
+            directory:
+                An absolute path on-disk where entries will be written to.
+                It is created if it doesn't exist.
+            suffixes:
+                The file extension of each file of an entry. e.g. ``".html"``.
+            max_size:
+                The maximum number of bytes that all entries may use.
+                If a new entry would go above this limit, the
+                least-recently-used entries are deleted.
+
+        """
+        super(DiskStore, self).__init__()
+
+        self._clock = 0
+        self._directory = directory
+        self._entries: typing.Optional[collections.OrderedDict[str, int]] = None
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._size = 0
+        self._suffixes = tuple(suffixes)
+
+    @staticmethod
+    def _get_name(key: str) -> str:
+        """str: Convert ``key`` into a file-name-safe name."""
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _get_path(self, name: str, suffix: str) -> str:
+        """str: Find the absolute path to one file of the entry ``name``."""
+        return os.path.join(self._directory, name + suffix)
+
+    def _mark_used(self, name: str) -> None:
+        """Make ``name`` the most-recently-used entry.
+
+        Args:
+            name: The file name of some stored entry, without its suffix.
+
+        """
+        # Entries that are used in quick succession may share the same
+        # timestamp so the clock always moves forward by at least 1ns.
+        #
+        self._clock = max(time.time_ns(), self._clock + 1)
+
+        if self._entries is not None and name in self._entries:
+            self._entries.move_to_end(name)
+
+        for suffix in self._suffixes:
+            try:
+                os.utime(self._get_path(name, suffix), ns=(self._clock, self._clock))
+            except OSError:
+                pass
+
+    def _get_entries(self) -> list[tuple[int, str, int]]:
+        """Find every stored entry.
+
+        Returns:
+            The last time each entry was used, its file name without a
+            suffix, and the size of all of its files, in bytes. The
+            least-recently-used entry is listed first.
+
+        """
+        try:
+            names = os.listdir(self._directory)
+        except OSError:
+            return []
+
+        entries: dict[str, tuple[int, int]] = {}
+
+        for name in names:
+            base, suffix = os.path.splitext(name)
+
+            if suffix not in self._suffixes:
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self._directory, name))
+            except OSError:
+                continue
+
+            used, size = entries.get(base, (0, 0))
+            entries[base] = (max(used, stat.st_mtime_ns), size + stat.st_size)
+
+        return sorted((used, base, size) for base, (used, size) in entries.items())
+
+    def _evict(self, incoming: int) -> None:
+        """Delete least-recently-used entries until ``incoming`` bytes can be stored.
+
+        Args:
+            incoming: The size of the entry that is about to be written.
+
+        """
+        entries = self._load()
+
+        while entries and self._size + incoming > self._max_size:
+            name = next(iter(entries))
+            _LOGGER.debug('Evicting "%s" from "%s".', name, self._directory)
+            self._remove(name)
+
+    def _load(self) -> collections.OrderedDict[str, int]:
+        """Find the size of every stored entry, from least to most-recently-used.
+
+        The directory is only listed the first time. The caller must hold the lock.
+
+        Returns:
+            Each entry's file name, without a suffix, and the size of all
+            of its files, in bytes.
+
+        """
+        if self._entries is None:
+            self._entries = collections.OrderedDict(
+                (name, size) for _, name, size in self._get_entries()
+            )
+            self._size = sum(self._entries.values())
+
+        return self._entries
+
+    def _remove(self, name: str) -> None:
+        """Delete every file of the entry ``name``, if any."""
+        if self._entries is not None:
+            self._size -= self._entries.pop(name, 0)
+
+        for suffix in self._suffixes:
+            try:
+                os.remove(self._get_path(name, suffix))
+            except OSError:
+                pass
+
+    def read(self, key: str) -> typing.Optional[dict[str, bytes]]:
+        """Find the stored files of ``key`` and mark them as most-recently-used.
+
+        Args:
+            key: Some unique description of the entry. e.g. a URL.
+
+        Returns:
+            Each suffix and the contents of its file, if every file of
+            ``key`` was stored.
+
+        """
+        name = self._get_name(key)
+        files = {}
+
+        with self._lock:
+            try:
+                for suffix in self._suffixes:
+                    with open(self._get_path(name, suffix), "rb") as handler:
+                        files[suffix] = handler.read()
+            except OSError:
+                return None
+
+            self._mark_used(name)
+
+        return files
+
+    def remove(self, key: str) -> None:
+        """Delete the stored files of ``key``, if any.
+
+        Args:
+            key: Some unique description of the entry. e.g. a URL.
+
+        """
+        with self._lock:
+            self._remove(self._get_name(key))
+
+    def update(self, key: str, suffix: str, data: bytes) -> None:
+        """Replace one file of ``key``, without evicting anything.
+
+        Args:
+            key: Some unique description of the entry. e.g. a URL.
+            suffix: The file extension of the file to replace. e.g. ``".json"``.
+            data: The bytes to write.
+
+        Raises:
+            OSError: If the file could not be written.
+
+        """
+        name = self._get_name(key)
+        path = self._get_path(name, suffix)
+
+        with self._lock:
+            try:
+                old = os.path.getsize(path)
+            except OSError:
+                old = 0
+
+            write_atomic(path, data)
+
+            if self._entries is not None and name in self._entries:
+                self._entries[name] += len(data) - old
+                self._size += len(data) - old
+
+    def write(self, key: str, files: dict[str, bytes]) -> bool:
+        """Store ``files``, evicting least-recently-used entries if needed.
+
+        Args:
+            key: Some unique description of the entry. e.g. a URL.
+            files: Each suffix and the contents of its file.
+
+        Raises:
+            OSError: If the files could not be written.
+
+        Returns:
+            If ``files`` were stored. An entry which is larger than the
+            whole store is skipped.
+
+        """
+        size = sum(len(data) for data in files.values())
+
+        if size > self._max_size:
+            return False
+
+        name = self._get_name(key)
+
+        with self._lock:
+            os.makedirs(self._directory, exist_ok=True)
+            entries = self._load()
+            # The entry's old files are replaced, so they don't count
+            self._size -= entries.pop(name, 0)
+            self._evict(size)
+
+            for suffix, data in files.items():
+                write_atomic(self._get_path(name, suffix), data)
+
+            entries[name] = size
+            self._size += size
+            self._mark_used(name)
+
+        return True
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write ``data`` to ``path`` so that other readers never see a partial file.
+
+    ``data`` is written to a temporary file beside ``path``, which then
+    replaces it. Unlike :func:`tempfile.mkstemp`, which makes files that
+    only their owner can read, the temporary file gets the permissions of
+    any other new file, so other users and CI artifact steps can still
+    read it.
+
+    Args:
+        path: The absolute path to a file on-disk.
+        data: The bytes to write.
+
+    """
+    temporary = "{path}.{token}.tmp".format(path=path, token=uuid.uuid4().hex)
+    handle = os.open(temporary, _TEMPORARY_FLAGS, _FILE_MODE)
+
+    try:
+        with os.fdopen(handle, "wb") as handler:
+            handler.write(data)
+
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+        raise
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Keep the Pygments-highlighted markup of each code-include between builds.
+
+Sphinx highlights every ``literal_block`` again on every build, even
+when its code never changed. For module-level includes of large files,
+that is the slowest part of writing a page. :class:`Highlighter` wraps
+the builder's highlighters (light and, if any, dark) and stores the
+markup of each code-include in a size-capped :class:`Cache`. The markup
+is re-used as long as the code, its language, the Pygments version and
+style, and the formatter's options are the same. Code which Sphinx
+warns about, e.g. because of a bad ``:language:``, is never stored, so
+that the warning is shown on every build.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import typing
+
+import pygments  # type: ignore
+import sphinx
+from sphinx import application as application_
+
+from . import helper
+
+_LOGGER = logging.getLogger(__name__)
+_MARKER = "code_include"
+_SPHINX_LOGGER = "sphinx.sphinx.highlighting"
+_SUFFIX = ".html"
+
+DEFAULT_CACHE_SIZE = 20 * 1024 * 1024
+"""The default ``code_include_highlight_cache_size``, in bytes. 0 turns the cache off."""
+
+
+class Cache(object):
+    """A size-capped, least-recently-used store of highlighted markup.
+
+    Every markup is written as one ``{key}.html`` file, in a
+    :class:`.helper.DiskStore`.
+
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Keep track of the directory where markup is stored.
+
+        Args:
+            directory:
+                An absolute path on-disk where markup will be written to.
+                It is created if it doesn't exist.
+            max_size:
+                The maximum number of bytes that all markup may use.
+
+        """
+        super(Cache, self).__init__()
+
+        self._store = helper.DiskStore(directory, (_SUFFIX,), max_size)
+
+    def read(self, key: str) -> typing.Optional[str]:
+        """Find the stored markup of ``key``, if any.
+
+        Args:
+            key: The description of some highlighted code. See :func:`get_key`.
+
+        Returns:
+            The found markup, if any.
+
+        """
+        files = self._store.read(key)
+
+        if files is None:
+            return None
+
+        try:
+            return files[_SUFFIX].decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+
+    def write(self, key: str, markup: str) -> None:
+        """Store ``markup``, evicting old markup if needed.
+
+        Args:
+            key: The description of some highlighted code. See :func:`get_key`.
+            markup: The highlighted code.
+
+        """
+        try:
+            stored = self._store.write(key, {_SUFFIX: markup.encode("utf-8")})
+        except OSError:
+            _LOGGER.debug('Markup "%s" could not be written.', key)
+
+            return
+
+        if not stored:
+            _LOGGER.debug('Markup "%s" is too large to cache.', key)
+
+
+class _Warnings(logging.Filter):
+    """Count the warnings which Sphinx's highlighter logs, in each thread."""
+
+    def __init__(self) -> None:
+        """Start counting from 0."""
+        super(_Warnings, self).__init__()
+
+        self._local = threading.local()
+
+    @property
+    def count(self) -> int:
+        """int: The number of warnings which the current thread logged."""
+        return typing.cast(int, getattr(self._local, "count", 0))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Count ``record`` if it's a warning. Every record is still logged.
+
+        Args:
+            record: Some message from Sphinx's highlighter.
+
+        Returns:
+            Always ``True``.
+
+        """
+        if record.levelno >= logging.WARNING:
+            self._local.count = self.count + 1
+
+        return True
+
+
+_WARNINGS = _Warnings()
+
+
+class Highlighter(object):
+    """Re-use the stored markup of code-includes. Other code is highlighted normally.
+
+    Every attribute besides :meth:`highlight_block` comes from the
+    highlighter which this object wraps.
+
+    Attributes:
+        hits (int): The number of code-includes which were re-used.
+        misses (int): The number of code-includes which had to be highlighted.
+
+    """
+
+    def __init__(self, highlighter: typing.Any, cache: Cache) -> None:
+        """Keep track of the highlighter to wrap.
+
+        Args:
+            highlighter: A Sphinx ``PygmentsBridge`` or something like it.
+            cache: The store to read and write markup with.
+
+        """
+        super(Highlighter, self).__init__()
+
+        self._cache = cache
+        self._highlighter = highlighter
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        logging.getLogger(_SPHINX_LOGGER).addFilter(_WARNINGS)
+
+    def __getattr__(self, name: str) -> typing.Any:
+        """Get any other attribute from the wrapped highlighter."""
+        return getattr(self._highlighter, name)
+
+    def highlight_block(
+        self,
+        source: str,
+        lang: str,
+        opts: typing.Optional[dict[str, typing.Any]] = None,
+        force: bool = False,
+        location: typing.Any = None,
+        **kwargs: typing.Any,
+    ) -> str:
+        """Highlight ``source``, re-using the stored markup of code-includes.
+
+        Args:
+            source: The code to highlight.
+            lang: The Pygments lexer name. e.g. ``"python"``.
+            opts: Options for the Pygments lexer.
+            force: If ``True``, highlight even if the code has lexing errors.
+            location: The node that ``source`` came from.
+            **kwargs: Options for the Pygments formatter. e.g. ``linenos``.
+
+        Returns:
+            The highlighted code.
+
+        """
+        if not _is_code_include(location):
+            return typing.cast(
+                str,
+                self._highlighter.highlight_block(
+                    source, lang, opts=opts, force=force, location=location, **kwargs
+                ),
+            )
+
+        key = get_key(
+            self._highlighter, source, lang, dict(opts or {}, force=force), kwargs
+        )
+        markup = self._cache.read(key)
+
+        with self._lock:
+            if markup is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if markup is not None:
+            return markup
+
+        warnings = _WARNINGS.count
+        markup = self._highlighter.highlight_block(
+            source, lang, opts=opts, force=force, location=location, **kwargs
+        )
+
+        # Stored markup would skip Sphinx's highlighter, along with its
+        # warnings (e.g. about a bad ``:language:``), in every later build
+        #
+        if _WARNINGS.count == warnings:
+            self._cache.write(key, markup)
+
+        return typing.cast(str, markup)
+
+
+def _is_code_include(node: typing.Any) -> bool:
+    """bool: Check if ``node`` was made by a code-include directive."""
+    try:
+        return bool(node.get(_MARKER))
+    except AttributeError:
+        return False
+
+
+def _get_style(highlighter: typing.Any) -> str:
+    """str: Get the full name of the Pygments style of ``highlighter``."""
+    style = getattr(highlighter, "formatter_args", {}).get("style")
+
+    if style is None:
+        return ""
+
+    return "{style.__module__}.{style.__qualname__}".format(style=style)
+
+
+def get_key(
+    highlighter: typing.Any,
+    source: str,
+    lang: str,
+    opts: dict[str, typing.Any],
+    options: dict[str, typing.Any],
+) -> str:
+    """Describe everything that changes the highlighted markup of ``source``.
+
+    Args:
+        highlighter: The Sphinx ``PygmentsBridge`` which highlights ``source``.
+        source: The code to highlight.
+        lang: The Pygments lexer name. e.g. ``"python"``.
+        opts: Options for the Pygments lexer.
+        options: Options for the Pygments formatter. e.g. ``linenos``.
+
+    Returns:
+        A unique description of the markup.
+
+    """
+    formatter = getattr(highlighter, "formatter", None)
+    formatter_args = {
+        name: value
+        for name, value in getattr(highlighter, "formatter_args", {}).items()
+        if name != "style"
+    }
+
+    return json.dumps(
+        [
+            hashlib.sha256(source.encode("utf-8")).hexdigest(),
+            lang,
+            pygments.__version__,
+            sphinx.__version__,
+            _get_style(highlighter),
+            getattr(formatter, "__name__", ""),
+            getattr(highlighter, "dest", ""),
+            getattr(highlighter, "latex_engine", ""),
+            formatter_args,
+            opts,
+            options,
+        ],
+        default=repr,
+        sort_keys=True,
+    )
+
+
+def get_directory(application: application_.Sphinx) -> str:
+    """Find where the highlighted markup of ``application`` is stored.
+
+    Args:
+        application: The Sphinx application that is building.
+
+    Returns:
+        The absolute path to a directory. If the user disabled the
+        cache or there's nowhere to store it, an empty string.
+
+    """
+    if not application.config.code_include_highlight_cache_size:
+        return ""
+
+    directory = typing.cast(str, application.config.code_include_cache_directory)
+
+    if directory:
+        return os.path.join(directory, "highlight")
+
+    if application.doctreedir:
+        return os.path.join(application.doctreedir, "code_include_highlight")
+
+    return ""
+
+
+def install(application: application_.Sphinx) -> None:
+    """Re-use the highlighted markup of code-includes, in ``application``'s builder.
+
+    Args:
+        application: The Sphinx application that is about to build.
+
+    """
+    directory = get_directory(application)
+
+    if not directory:
+        return
+
+    builder = application.builder
+    cache = Cache(
+        directory, max_size=application.config.code_include_highlight_cache_size
+    )
+
+    for name in ("highlighter", "dark_highlighter"):
+        highlighter = getattr(builder, name, None)
+
+        if highlighter and not isinstance(highlighter, Highlighter):
+            setattr(builder, name, Highlighter(highlighter, cache))
+
+
+def mark(node: typing.Any) -> None:
+    """Let :class:`Highlighter` re-use the markup of ``node``.
+
+    Args:
+        node: A ``literal_block`` that a code-include directive made.
+
+    """
+    node[_MARKER] = True
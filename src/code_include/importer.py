@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Import a Python namespace and get the source code of the imported object.
+
+This module has no Sphinx state, so that :mod:`.workers` can use it in a
+separate process without importing the rest of code-include.
+
+"""
+
+import importlib
+import inspect
+import logging
+import typing
+
+from . import static
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _resolve_object(object_: typing.Any, tail: str) -> typing.Any:
+    """Get a Python object located at `tail`, using a root `object_`.
+
+    Args:
+        object_:
+            A Python module that contains `tail`.
+            e.g. The `os` module.
+        tail:
+            A dot-separated string of some attribute, class, or
+            function that is located within `object_`.
+            e.g. "path.join".
+
+    Returns:
+        The resolved class, function, attribute, or module.
+
+    """
+    if not tail:
+        return object_
+
+    objects = tail.split(".")  # Example: ["path", "join"]
+    parent = object_
+
+    for item in objects:
+        try:
+            parent = getattr(parent, item)
+        except AttributeError:
+            return None
+
+    return parent
+
+
+def import_module(name: str, unimportable: set[str]) -> typing.Any:
+    """Import a Python module, unless it already failed to import.
+
+    Args:
+        name: The module to import. e.g. "foo.bar".
+        unimportable: Each module which failed to import. A failed ``name`` is added to it.
+
+    Returns:
+        The imported module, if any.
+
+    """
+    if name in unimportable:
+        return None
+
+    try:
+        return importlib.import_module(name)
+    except ImportError as error:
+        _LOGGER.debug('Could not import "%s": %s', name, error)
+        unimportable.add(name)
+
+        return None
+
+
+def get_source(
+    namespace: str,
+    unimportable: set[str],
+    cache: typing.Optional[static.SourceCache] = None,
+) -> typing.Optional[tuple[str, typing.Any]]:
+    """Import a Python namespace path and get source code directly from it.
+
+    Args:
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+        unimportable:
+            Each module which failed to import. Those modules aren't
+            imported again.
+        cache:
+            The object which reads each file and module once. If none
+            is given, :data:`.static.CACHE` is used.
+
+    Returns:
+        The found source code and the imported object, assuming
+        `namespace` describes an importable location.
+
+    """
+    found = static.find_module(namespace, cache)
+
+    if not found:
+        return None
+
+    module, _ = found
+    tokens = namespace.split(".")
+
+    # If the module fails to import, e.g. because it needs an optional
+    # dependency, its parent packages may still define the namespace.
+    #
+    for count in range(module.count(".") + 1, 0, -1):
+        object_ = import_module(".".join(tokens[:count]), unimportable)
+
+        if object_:
+            break
+    else:
+        return None
+
+    resolved_object = _resolve_object(object_, ".".join(tokens[count:]))
+
+    if not resolved_object:
+        return None
+
+    code = static.get_object_source(resolved_object, cache)
+
+    if code is None:
+        lines, _ = inspect.getsourcelines(resolved_object)
+        code = "".join(lines)
+
+    return code, resolved_object
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fast look-ups into the intersphinx inventory.
+
+Sphinx stores its inventory by role, e.g. ``{"py:class": {"foo.Bar": ...}}``.
+Finding a namespace whose role isn't known (the ``:obj:`` role) would
+mean checking every role, one after another. Instead,
+:class:`NamespaceIndex` reverses the inventory once per-build so that
+each namespace is a single dictionary look-up.
+
+When a namespace is missing, :class:`SuggestionIndex` finds the most
+similar namespaces, to help the user fix their typo.
+
+:class:`RootIndex` finds which intersphinx project some documentation
+URI belongs to.
+
+"""
+
+import collections
+import heapq
+import threading
+import typing
+
+_CANDIDATES = 50
+_END = ""
+_SEPARATORS = frozenset("/\\")
+_GRAM_SIZE = 3
+_MAXIMUM_GRAMS = 8
+_MAXIMUM_POSTINGS = 2000
+_MINIMUM_SIMILARITY = 0.3
+
+Inventory = dict[str, dict[str, tuple[str, str, str, str]]]
+"""Each role, e.g. "py:class", and its namespaces + project / version / URI / name."""
+
+MODULE = "py:module"
+ROLES = (
+    "py:attribute",
+    "py:data",
+    "py:property",
+    "py:function",
+    "py:classmethod",
+    "py:staticmethod",
+    "py:method",
+    "py:exception",
+    "py:class",
+    MODULE,
+)
+"""Every role that ``:obj:`` may refer to.
+
+If a namespace is documented with more than one role, the role which
+comes first in this tuple wins.
+
+"""
+
+
+class Entry(typing.NamedTuple):
+    """The role of some namespace and the URI of its documentation."""
+
+    role: str
+    uri: str
+
+
+class RootIndex(object):
+    """Find the intersphinx project root of a URI, in one pass over the URI.
+
+    Roots are stored in a character trie. If one root is inside another,
+    e.g. "https://host/docs" and "https://host/docs/v2", the longest
+    (most nested) root wins. A root only matches at a path boundary so
+    "https://host/docs" never matches "https://host/docs2/index.html".
+
+    """
+
+    def __init__(self, roots: typing.Iterable[str]) -> None:
+        """Index every root.
+
+        Args:
+            roots: The file paths / URLs of every intersphinx project.
+
+        """
+        super(RootIndex, self).__init__()
+
+        self._roots = frozenset(roots)
+        self._trie: dict[str, typing.Any] = {}
+
+        for root in self._roots:
+            node = self._trie
+
+            for character in root.rstrip("/\\"):
+                node = node.setdefault(character, {})
+
+            node[_END] = root
+
+    def __iter__(self) -> typing.Iterator[str]:
+        """str: Every indexed root."""
+        return iter(self._roots)
+
+    def __len__(self) -> int:
+        """int: The number of indexed roots."""
+        return len(self._roots)
+
+    def get(self, uri: str) -> str:
+        """Find the longest root which contains ``uri``.
+
+        Args:
+            uri:
+                The URL / file-path that presumably came from an intersphinx
+                inventory file. e.g. "https://host/docs/api/foo.html".
+
+        Returns:
+            The found root, exactly as it was given. If no root was
+            found, return an empty string.
+
+        """
+        found = ""
+        node = self._trie
+
+        for character in uri:
+            if character in _SEPARATORS and _END in node:
+                found = node[_END]
+
+            node = node.get(character)  # type: ignore
+
+            if node is None:
+                return found
+
+        return typing.cast(str, node.get(_END, found))
+
+
+class SuggestionIndex(object):
+    """Find the namespaces that are most similar to some misspelled namespace.
+
+    Every namespace is split into overlapping 3-letter "grams". A
+    misspelled namespace still shares most of its grams with the intended
+    one so only namespaces which share its rarest grams are compared.
+
+    """
+
+    def __init__(self, namespaces: typing.Iterable[str]) -> None:
+        """Index every namespace.
+
+        Args:
+            namespaces: Every known namespace. e.g. ``["foo.bar.Parent", ...]``.
+
+        """
+        super(SuggestionIndex, self).__init__()
+
+        self._namespaces = sorted(set(namespaces))
+        postings: dict[str, list[int]] = collections.defaultdict(list)
+
+        for index, namespace in enumerate(self._namespaces):
+            for gram in _get_grams(namespace):
+                postings[gram].append(index)
+
+        self._postings = dict(postings)
+
+    def __len__(self) -> int:
+        """int: The number of indexed namespaces."""
+        return len(self._namespaces)
+
+    def suggest(self, namespace: str, count: int = 5) -> list[str]:
+        """Find the indexed namespaces which are most similar to ``namespace``.
+
+        Args:
+            namespace: Some namespace which wasn't found. e.g. "foo.bar.Prent".
+            count: The maximum number of suggestions to return.
+
+        Returns:
+            The most similar namespaces, most similar first.
+
+        """
+        grams = _get_grams(namespace)
+        postings = sorted(
+            (self._postings[gram] for gram in grams if gram in self._postings),
+            key=len,
+        )
+        # Grams which most namespaces have (e.g. the package name) can't
+        # tell namespaces apart. They're only used if nothing else matches.
+        #
+        rare = [
+            indices for indices in postings if len(indices) <= _MAXIMUM_POSTINGS
+        ] or postings[:1]
+        shared: collections.Counter[int] = collections.Counter()
+
+        for indices in rare[:_MAXIMUM_GRAMS]:
+            shared.update(indices)
+
+        scores = []
+
+        for index, _ in shared.most_common(_CANDIDATES):
+            candidate = self._namespaces[index]
+            other = _get_grams(candidate)
+            similarity = 2 * len(grams & other) / (len(grams) + len(other))
+
+            if similarity >= _MINIMUM_SIMILARITY:
+                scores.append((similarity, candidate))
+
+        return [
+            candidate
+            for _, candidate in heapq.nsmallest(
+                count, scores, key=lambda item: (-item[0], item[1])
+            )
+        ]
+
+
+class NamespaceIndex(object):
+    """Map every Python namespace of an intersphinx inventory to its role and URI."""
+
+    def __init__(self, inventory: Inventory) -> None:
+        """Reverse ``inventory``.
+
+        Args:
+            inventory: The intersphinx inventory of the current build.
+
+        """
+        super(NamespaceIndex, self).__init__()
+
+        self._entries: dict[str, Entry] = {}
+        self._inventory = inventory
+        self._lock = threading.Lock()
+        self._modules = frozenset(inventory.get(MODULE, {}))
+        self._suggestions: dict[typing.Optional[str], SuggestionIndex] = {}
+
+        # Lower-priority roles are added first so that higher-priority
+        # roles replace them.
+        #
+        for role in reversed(ROLES):
+            for namespace, (_, _, uri, _) in inventory.get(role, {}).items():
+                self._entries[namespace] = Entry(role, uri)
+
+    def __contains__(self, namespace: object) -> bool:
+        """bool: Check if ``namespace`` is documented with any :data:`ROLES`."""
+        return namespace in self._entries
+
+    def __len__(self) -> int:
+        """int: The number of indexed namespaces."""
+        return len(self._entries)
+
+    def get(self, namespace: str) -> typing.Optional[Entry]:
+        """Find the highest-priority role of ``namespace``.
+
+        Args:
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+
+        Returns:
+            The found role and URI, if ``namespace`` is documented.
+
+        """
+        return self._entries.get(namespace)
+
+    def get_suggestions(
+        self,
+        namespace: str,
+        role: typing.Optional[str] = None,
+        count: int = 5,
+    ) -> list[str]:
+        """Find the documented namespaces which are most similar to ``namespace``.
+
+        The suggestions of each role are indexed the first time that
+        they're needed and re-used for the rest of the build.
+
+        Args:
+            namespace: Some namespace which wasn't found. e.g. "foo.bar.Prent".
+            role: Only suggest namespaces of this role. If empty, use every :data:`ROLES`.
+            count: The maximum number of suggestions to return.
+
+        Returns:
+            The most similar namespaces, most similar first.
+
+        """
+        with self._lock:
+            try:
+                index = self._suggestions[role]
+            except KeyError:
+                if role:
+                    index = SuggestionIndex(self._inventory.get(role, {}))
+                else:
+                    index = SuggestionIndex(self._entries)
+
+                self._suggestions[role] = index
+
+        return index.suggest(namespace, count=count)
+
+    def get_module(self, namespace: str) -> typing.Optional[str]:
+        """Find the documented module which defines ``namespace``.
+
+        Args:
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+
+        Returns:
+            The longest part of ``namespace`` which is a documented
+            module, if any. e.g. "foo.bar".
+
+        """
+        tokens = namespace.split(".")
+
+        for count in reversed(range(1, len(tokens) + 1)):
+            module = ".".join(tokens[:count])
+
+            if module in self._modules:
+                return module
+
+        return None
+
+
+def _get_grams(text: str) -> set[str]:
+    """set[str]: Split ``text`` into overlapping, case-insensitive, 3-letter parts."""
+    text = " {text} ".format(text=text.lower())
+
+    return {
+        text[index : index + _GRAM_SIZE]
+        for index in range(max(1, len(text) - _GRAM_SIZE + 1))
+    }
@@ -0,0 +1,883 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A build-scoped cache of every viewcode ``_modules`` page that code-include reads.
+
+Many code-include directives usually point to the same few ``_modules``
+pages. Instead of downloading and parsing a page once per-directive,
+each page is read once and every later tag lookup is served from memory.
+
+A page is never fully parsed unless it has to be. The first tag is found
+with a streaming parser which only collects the text of that tag and
+stops as soon as it closes. If more tags are needed from the same page,
+the page is read once more into a :class:`PageIndex`, which maps every
+tag to its text. A full BeautifulSoup tree is only built for users who
+define a ``code_include_preprocessor``.
+
+"""
+
+import functools
+import importlib.util
+import logging
+import threading
+import typing
+from html import parser as html_parser
+
+import bs4
+from bs4 import dammit
+from bs4 import element
+
+from . import helper
+from . import report
+
+_LOGGER = logging.getLogger(__name__)
+_MODULE_TAG = ""
+
+HTML5LIB = "html5lib"
+HTML_PARSER = "html.parser"
+LXML = "lxml"
+PARSERS = (LXML, HTML_PARSER, HTML5LIB)
+"""Every supported HTML parser, from fastest to slowest."""
+_CHUNK_SIZE = 65536
+_ASCII_SPACES = frozenset("\x20\x0a\x09\x0c\x0d")
+_PRESERVE_WHITESPACE_ELEMENTS = frozenset(("pre", "textarea"))
+_SKIPPED_ELEMENTS = frozenset(("script", "style"))
+_VOID_ELEMENTS = frozenset(
+    (
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+    )
+)
+
+Preprocessor = typing.Callable[[element.Tag], None]
+
+
+class _Parser(object):
+    """Collect the text of a viewcode page, without building a tree.
+
+    This class receives the same events as an lxml parser "target".
+    Sub-classes choose which text is kept and what to record when an
+    element opens or closes.
+
+    Attributes:
+        done (bool): If the parser found everything that it needs.
+
+    """
+
+    def __init__(self) -> None:
+        """Prepare to read a page."""
+        super(_Parser, self).__init__()
+
+        self._stack: list[tuple[str, int]] = []
+        self._skip_depth: typing.Optional[int] = None
+        self._texts: list[str] = []
+        self._pending: list[str] = []
+        self._preserve_depth = 0
+        self.done = False
+
+    def _close(self, depth: int) -> None:
+        """Record that the open element at ``depth`` is closing.
+
+        Args:
+            depth: The index of the element in the stack of open elements.
+
+        """
+
+    def _close_to(self, depth: int) -> None:
+        """Close every open element which is deeper than ``depth``."""
+        for index in reversed(range(depth, len(self._stack))):
+            self._close(index)
+
+            if self._stack[index][0] in _PRESERVE_WHITESPACE_ELEMENTS:
+                self._preserve_depth -= 1
+
+        del self._stack[depth:]
+
+        if self._skip_depth is not None and len(self._stack) <= self._skip_depth:
+            self._skip_depth = None
+
+    def _flush(self) -> None:
+        """Collect the text which was read since the last tag.
+
+        Whitespace-only text, outside of ``<pre>``, is shortened the same
+        way that BeautifulSoup does so that both ways of reading a page
+        return the same text.
+
+        """
+        if not self._pending:
+            return
+
+        text = "".join(self._pending)
+        del self._pending[:]
+
+        if not self._preserve_depth and all(
+            character in _ASCII_SPACES for character in text
+        ):
+            text = "\n" if "\n" in text else " "
+
+        self._texts.append(text)
+
+    def _is_collecting(self) -> bool:
+        """bool: Check if text, at the current position, should be kept."""
+        return True
+
+    def _open(
+        self,
+        tag: str,
+        attributes: dict[str, typing.Optional[str]],
+        classes: list[str],
+    ) -> None:
+        """Record that ``tag`` opened. It is already on the stack of open elements.
+
+        Args:
+            tag: The name of the element. e.g. "div".
+            attributes: The HTML attributes of the element.
+            classes: The CSS classes of the element.
+
+        """
+
+    def close(self) -> None:
+        """Read any remaining text and close every element which was left open."""
+        self._flush()
+        self._close_to(0)
+
+    def start(
+        self,
+        tag: str,
+        attrib: typing.Mapping[str, typing.Optional[str]],
+    ) -> None:
+        """Track the opened element."""
+        if self.done:
+            return
+
+        self._flush()
+
+        if tag in _VOID_ELEMENTS:
+            return
+
+        attributes = dict(attrib)
+        classes = (attributes.get("class") or "").split()
+        self._stack.append((tag, len(self._texts)))
+
+        if tag in _PRESERVE_WHITESPACE_ELEMENTS:
+            self._preserve_depth += 1
+
+        if self._skip_depth is not None:
+            return
+
+        if tag in _SKIPPED_ELEMENTS or (tag == "a" and "viewcode-back" in classes):
+            self._skip_depth = len(self._stack) - 1
+
+            return
+
+        self._open(tag, attributes, classes)
+
+    def comment(self, _text: str) -> None:
+        """Split the text around comments. Comments are not source code."""
+        self._flush()
+
+    def end(self, tag: str) -> None:
+        """Close ``tag`` and any element inside of it which was left open."""
+        if self.done:
+            return
+
+        self._flush()
+
+        for index in reversed(range(len(self._stack))):
+            if self._stack[index][0] == tag:
+                self._close_to(index)
+
+                break
+
+    def data(self, data: str) -> None:
+        """Collect ``data`` if it is part of the result."""
+        if not self.done and self._skip_depth is None and self._is_collecting():
+            self._pending.append(data)
+
+
+class _Feeder(html_parser.HTMLParser):
+    """Send the events of Python's built-in HTML parser to a :class:`_Parser`."""
+
+    def __init__(self, target: _Parser) -> None:
+        """Keep track of the object which receives every event.
+
+        Args:
+            target: The object which collects text.
+
+        """
+        super(_Feeder, self).__init__(convert_charrefs=True)
+
+        self._target = target
+
+    def close(self) -> None:
+        """Read any remaining text and tell the target that the page ended."""
+        super(_Feeder, self).close()
+
+        self._target.close()
+
+    def handle_comment(self, data: str) -> None:
+        """Send a comment to the target."""
+        self._target.comment(data)
+
+    def handle_data(self, data: str) -> None:
+        """Send some text to the target."""
+        self._target.data(data)
+
+    def handle_endtag(self, tag: str) -> None:
+        """Send a closed element to the target."""
+        self._target.end(tag)
+
+    def handle_starttag(
+        self,
+        tag: str,
+        attrs: list[tuple[str, typing.Optional[str]]],
+    ) -> None:
+        """Send an opened element to the target."""
+        self._target.start(tag, dict(attrs))
+
+
+class _Extractor(_Parser):
+    """Collect the text of one tag and stop as soon as that tag closes."""
+
+    def __init__(self, tag: str) -> None:
+        """Keep track of the tag to find.
+
+        Args:
+            tag:
+                The ``<div id="...">`` to collect text from. If empty,
+                the text of the element which contains the module's
+                source code is collected instead.
+
+        """
+        super(_Extractor, self).__init__()
+
+        self._tag = tag
+        self._target_depth: typing.Optional[int] = None
+
+    @property
+    def found(self) -> bool:
+        """bool: Check if the requested tag was found, even if it never closed."""
+        return self._target_depth is not None
+
+    def _close(self, depth: int) -> None:
+        """Stop reading if the requested tag is closing."""
+        if depth == self._target_depth:
+            self.done = True
+        elif self._tag == _MODULE_TAG and not self.found and depth == 0:
+            # Nothing outside of an open element can be part of the
+            # module's source code block.
+            #
+            del self._texts[:]
+
+    def _is_collecting(self) -> bool:
+        """bool: Check if text, at the current position, is part of the result."""
+        # The module's parent element isn't known until its first
+        # `<span class="ch">` appears so, until then, every string is kept.
+        #
+        return self._tag == _MODULE_TAG or self.found
+
+    def _open(
+        self,
+        tag: str,
+        attributes: dict[str, typing.Optional[str]],
+        classes: list[str],
+    ) -> None:
+        """Check if ``tag`` is the requested tag."""
+        if self.found:
+            return
+
+        if self._tag == _MODULE_TAG:
+            if tag == "span" and "ch" in classes and len(self._stack) > 1:
+                # The start of the source-code block is always marked
+                # using <span class="ch">. The block is its parent.
+                #
+                self._target_depth = len(self._stack) - 2
+                del self._texts[: self._stack[-2][1]]
+        elif tag == "div" and attributes.get("id") == self._tag:
+            self._target_depth = len(self._stack) - 1
+            del self._texts[:]
+
+    def get_text(self) -> str:
+        """str: Get the collected text."""
+        self._flush()
+
+        return "".join(self._texts)
+
+
+class _Indexer(_Parser):
+    """Collect the text of every ``<div id="...">`` and the module, in one pass."""
+
+    def __init__(self) -> None:
+        """Prepare to record every tag."""
+        super(_Indexer, self).__init__()
+
+        self._identifiers: dict[int, str] = {}
+        self._module_depth: typing.Optional[int] = None
+        self._module: typing.Optional[tuple[int, int]] = None
+        self._spans: dict[str, tuple[int, int]] = {}
+
+    def _close(self, depth: int) -> None:
+        """Record where the text of the closing element ends."""
+        span = (self._stack[depth][1], len(self._texts))
+        identifier = self._identifiers.pop(depth, None)
+
+        if identifier is not None:
+            self._spans.setdefault(identifier, span)
+
+        if depth == self._module_depth:
+            self._module = span
+            self._module_depth = None
+
+    def _open(
+        self,
+        tag: str,
+        attributes: dict[str, typing.Optional[str]],
+        classes: list[str],
+    ) -> None:
+        """Start recording ``tag`` if it is a viewcode block or the module."""
+        depth = len(self._stack) - 1
+        identifier = attributes.get("id")
+
+        if (
+            tag == "div"
+            and identifier
+            and identifier not in self._spans
+            and identifier not in self._identifiers.values()
+        ):
+            # Like BeautifulSoup, only the first tag of some id is used.
+            self._identifiers[depth] = identifier
+
+        if (
+            tag == "span"
+            and "ch" in classes
+            and depth
+            and self._module is None
+            and self._module_depth is None
+        ):
+            self._module_depth = depth - 1
+
+    def get_index(self) -> "PageIndex":
+        """:class:`PageIndex`: Get the text of every recorded tag."""
+        texts = {
+            identifier: "".join(self._texts[start:end])
+            for identifier, (start, end) in self._spans.items()
+        }
+        module = None
+
+        if self._module:
+            start, end = self._module
+            module = "".join(self._texts[start:end]).lstrip()
+
+        return PageIndex(texts, module=module)
+
+
+class PageIndex(object):
+    """The source code of every tag on one viewcode page, found in a single pass."""
+
+    def __init__(
+        self,
+        texts: dict[str, str],
+        module: typing.Optional[str] = None,
+    ) -> None:
+        """Keep track of every tag's source code.
+
+        Args:
+            texts: Each ``<div id="...">`` of the page and its source code.
+            module: The whole module's source code, if the page has it.
+
+        """
+        super(PageIndex, self).__init__()
+
+        self._texts = texts
+        self._module = module
+
+    def __contains__(self, tag: object) -> bool:
+        """bool: Check if ``tag`` is on this page."""
+        if tag == _MODULE_TAG:
+            return self._module is not None
+
+        return tag in self._texts
+
+    def __len__(self) -> int:
+        """int: The number of ``<div id="...">`` tags which were found."""
+        return len(self._texts)
+
+    @classmethod
+    def build(cls, contents: str, parser: str = "") -> "PageIndex":
+        """Read every tag of a viewcode page.
+
+        Args:
+            contents: The raw HTML of some viewcode page.
+            parser: The name of the HTML parser to use. See :func:`get_parser`.
+
+        Returns:
+            The created index.
+
+        """
+        indexer = _Indexer()
+        _feed(indexer, contents, get_parser(parser))
+
+        return indexer.get_index()
+
+    def get(self, tag: str) -> str:
+        """Get the source code of ``tag``.
+
+        Args:
+            tag:
+                The class, method, attribute, or function to find. If
+                empty, the whole module's source code is returned.
+
+        Raises:
+            RuntimeError: If ``tag`` is not on this page.
+
+        Returns:
+            The found source code, as raw text (no HTML tags are included).
+
+        """
+        if tag == _MODULE_TAG:
+            if self._module is None:
+                raise _make_missing_error(tag)
+
+            return self._module
+
+        try:
+            return self._texts[tag]
+        except KeyError:
+            raise _make_missing_error(tag)
+
+
+class Page(object):  # pylint: disable=too-few-public-methods
+    """One viewcode page and the text of every tag that was requested from it.
+
+    The first tag is found with :func:`extract`, which stops reading as
+    soon as that tag closes. Once a second, different tag is requested,
+    the whole page is read once into a :class:`PageIndex` and every later
+    tag is a dictionary lookup.
+
+    """
+
+    def __init__(
+        self,
+        contents: typing.Any,
+        parser: str = "",
+    ) -> None:
+        """Keep track of a page.
+
+        Args:
+            contents: The raw HTML of the page.
+            parser:
+                The name of the HTML parser to use. See :func:`get_parser`.
+                If empty, source code is found with the fastest installed
+                parser but preprocessors get an "html.parser" tree. See
+                :func:`parse`.
+
+        Raises:
+            EnvironmentError: If ``parser`` is unknown or it isn't installed.
+
+        """
+        super(Page, self).__init__()
+
+        if isinstance(contents, bytes):
+            contents = dammit.UnicodeDammit(contents).unicode_markup
+
+        self._contents = typing.cast(str, contents)
+        self._index: typing.Optional[PageIndex] = None
+        self._parser = get_parser(parser) if parser else ""
+        self._texts: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get_text(
+        self,
+        tag: str,
+        preprocessor: typing.Optional[Preprocessor] = None,
+    ) -> str:
+        """Get the source code of ``tag``.
+
+        Args:
+            tag:
+                The class, method, attribute, or function that will be
+                extracted from this page. If empty, the whole module's
+                source code is returned.
+            preprocessor:
+                A user-provided function that modifies the found node
+                before it is converted to text. Because the function
+                may mutate the node or the rest of its page (e.g.
+                through ``node.parent``), each call parses the page
+                again and its result is never cached.
+
+        Raises:
+            RuntimeError: If ``tag`` is not on this page.
+
+        Returns:
+            The found source code, as raw text (no HTML tags are included).
+
+        """
+        if preprocessor:
+            node = _find_node(parse(self._contents, parser=self._parser), tag)
+            preprocessor(node)
+
+            return _get_node_text(node, tag)
+
+        with self._lock:
+            if self._index is not None:
+                return self._index.get(tag)
+
+            try:
+                return self._texts[tag]
+            except KeyError:
+                pass
+
+            if not self._texts:
+                text = extract(self._contents, tag, parser=self._parser)
+                self._texts[tag] = text
+
+                return text
+
+            self._index = PageIndex.build(self._contents, parser=self._parser)
+            self._texts.clear()
+
+            return self._index.get(tag)
+
+
+class PageCache(object):
+    """Store every parsed page, keyed by its resolved URL / file path."""
+
+    def __init__(self, max_size: int = 0, ttl: float = 0.0) -> None:
+        """Create an empty cache.
+
+        Args:
+            max_size:
+                The maximum number of pages to keep. 0 means there's no limit.
+            ttl:
+                The number of seconds that each page is kept for. 0
+                means that pages are kept until :meth:`clear`.
+
+        """
+        super(PageCache, self).__init__()
+
+        self._pages = helper.Cache(max_size=max_size, ttl=ttl)
+
+    def __contains__(self, uri: object) -> bool:
+        """bool: Check if ``uri`` was already read."""
+        return uri in self._pages
+
+    def __len__(self) -> int:
+        """int: The number of pages which are currently stored."""
+        return len(self._pages)
+
+    @property
+    def evictions(self) -> int:
+        """int: The number of pages which were removed because of a limit."""
+        return self._pages.evictions
+
+    @property
+    def hits(self) -> int:
+        """int: The number of times that a page was served from memory."""
+        return self._pages.hits
+
+    @property
+    def misses(self) -> int:
+        """int: The number of times that a page had to be read."""
+        return self._pages.misses
+
+    def clear(self) -> None:
+        """Remove every stored page and reset the hit / miss counts."""
+        self._pages.clear()
+
+    def invalidate(self, uri: str) -> None:
+        """Read ``uri`` again, the next time that it's needed.
+
+        Args:
+            uri: The resolved URL / file path to some viewcode HTML page.
+
+        """
+        self._pages.invalidate(uri)
+
+    def get(
+        self,
+        uri: str,
+        reader: typing.Callable[[str], typing.Any],
+        parser: str = "",
+    ) -> Page:
+        """Find the page for ``uri``, reading it only if needed.
+
+        Args:
+            uri:
+                The resolved URL / file path to some viewcode HTML page.
+            reader:
+                A function that takes ``uri`` and returns the page's raw
+                HTML. It is only called if ``uri`` was not read before.
+            parser:
+                The name of the HTML parser which reads new pages. See
+                :func:`get_parser`.
+
+        Returns:
+            The found or newly-read page.
+
+        """
+        read = []
+
+        def _read() -> Page:
+            _LOGGER.debug('Reading "%s" page.', uri)
+            read.append(uri)
+
+            return Page(reader(uri), parser=parser)
+
+        # Different pages are read at the same time. If two threads need
+        # the same page, only one of them reads it and the other waits.
+        #
+        page = typing.cast(Page, self._pages.get_or_create(uri, _read))
+        report.note_cache(not read)
+
+        return page
+
+
+def _walk(target: _Parser, contents: str) -> None:
+    """Parse ``contents`` with html5lib and send its elements to ``target``.
+
+    html5lib can't stream so the whole page is parsed into a (fast,
+    ElementTree) tree first, which is then walked in document order.
+
+    Args:
+        target: The object which collects text.
+        contents: The raw HTML of some viewcode page.
+
+    """
+    import html5lib  # pylint: disable=import-outside-toplevel
+
+    document = html5lib.parse(contents, namespaceHTMLElements=False)
+
+    for token in html5lib.getTreeWalker("etree")(document):
+        kind = token["type"]
+
+        if kind in ("StartTag", "EmptyTag"):
+            target.start(
+                token["name"],
+                {name: value for (_, name), value in token["data"].items()},
+            )
+
+            if kind == "EmptyTag":
+                target.end(token["name"])
+        elif kind == "EndTag":
+            target.end(token["name"])
+        elif kind in ("Characters", "SpaceCharacters"):
+            target.data(token["data"])
+        elif kind == "Comment":
+            target.comment(token["data"])
+
+        if target.done:
+            return
+
+    target.close()
+
+
+def _feed(target: _Parser, contents: str, parser: str) -> None:
+    """Send the elements of ``contents`` to ``target`` until it has what it needs.
+
+    Args:
+        target: The object which collects text.
+        contents: The raw HTML of some viewcode page.
+        parser: The name of the HTML parser to use. See :data:`PARSERS`.
+
+    """
+    if parser == HTML5LIB:
+        _walk(target, contents)
+
+        return
+
+    feeder: typing.Any
+
+    if parser == LXML:
+        from lxml import etree  # type: ignore  # pylint: disable=import-outside-toplevel
+
+        feeder = etree.HTMLParser(  # pylint: disable=c-extension-no-member
+            target=target
+        )
+    else:
+        feeder = _Feeder(target)
+
+    for index in range(0, len(contents), _CHUNK_SIZE):
+        feeder.feed(contents[index : index + _CHUNK_SIZE])
+
+        if target.done:
+            return
+
+    if contents:
+        feeder.close()
+    else:
+        target.close()
+
+
+def _find_node(soup: bs4.BeautifulSoup, tag: str) -> element.Tag:
+    """Find the HTML tag which contains the source code of ``tag``.
+
+    Args:
+        soup:
+            A parsed viewcode page.
+        tag:
+            The class, method, attribute, or function to find. If
+            empty, the whole module's source code is found instead.
+
+    Raises:
+        RuntimeError: If ``tag`` is not on this page.
+
+    Returns:
+        The found node.
+
+    """
+    if tag == _MODULE_TAG:
+        # If the user didn't provide a tag, it means that they are
+        # trying to get the full module's source code.
+        #
+        # The start of the source-code block is always marked using <span class="ch">
+        #
+        child = soup.find("span", {"class": "ch"})
+
+        if not child or not child.parent:
+            raise _make_missing_error(tag)
+
+        return child.parent
+
+    node = soup.find("div", {"id": tag})
+
+    if not isinstance(node, element.Tag):
+        raise _make_missing_error(tag)
+
+    return node
+
+
+def _get_node_text(node: element.Tag, tag: str) -> str:
+    """str: Get the text of ``node``, which is the source code of ``tag``."""
+    text = node.get_text()
+
+    if tag == _MODULE_TAG:
+        return text.lstrip()
+
+    return text
+
+
+def _make_missing_error(tag: str) -> RuntimeError:
+    """RuntimeError: Describe that ``tag`` isn't on some page."""
+    if tag == _MODULE_TAG:
+        return RuntimeError("No module source code was found.")
+
+    return RuntimeError(f'No node was found for "{tag}" tag.')
+
+
+def _is_installed(parser: str) -> bool:
+    """bool: Check if ``parser`` can be used."""
+    if parser == HTML_PARSER:
+        return True
+
+    return importlib.util.find_spec(parser) is not None
+
+
+def extract(contents: str, tag: str, parser: str = "") -> str:
+    """Get the source code of ``tag`` without parsing the whole page.
+
+    Parsing stops as soon as ``tag`` closes and "viewcode-back"
+    hyperlinks are skipped while reading.
+
+    Args:
+        contents:
+            The raw HTML of some viewcode page.
+        tag:
+            The class, method, attribute, or function to find. If empty,
+            the whole module's source code is returned.
+        parser:
+            The name of the HTML parser to use. See :func:`get_parser`.
+            "html5lib" can't stream so it always parses the whole page
+            before looking for ``tag``.
+
+    Raises:
+        RuntimeError: If ``tag`` is not on this page.
+
+    Returns:
+        The found source code, as raw text (no HTML tags are included).
+
+    """
+    extractor = _Extractor(tag)
+    _feed(extractor, contents, get_parser(parser))
+
+    if not extractor.found:
+        raise _make_missing_error(tag)
+
+    text = extractor.get_text()
+
+    if tag == _MODULE_TAG:
+        return text.lstrip()
+
+    return text
+
+
+@functools.lru_cache(maxsize=None)
+def get_parser(name: str = "") -> str:
+    """Find the HTML parser which reads viewcode pages.
+
+    Args:
+        name:
+            "lxml", "html.parser", or "html5lib". If empty, the fastest
+            installed parser is used.
+
+    Raises:
+        EnvironmentError: If ``name`` is unknown or it isn't installed.
+
+    Returns:
+        The name of the parser to use.
+
+    """
+    if not name:
+        return next(parser for parser in PARSERS if _is_installed(parser))
+
+    if name not in PARSERS:
+        raise EnvironmentError(
+            'HTML parser "{name}" is unknown. Options were "{PARSERS}".'.format(
+                name=name, PARSERS=PARSERS
+            )
+        )
+
+    if not _is_installed(name):
+        raise EnvironmentError(
+            'HTML parser "{name}" is not installed. Run "pip install {name}" '
+            "or choose another parser.".format(name=name)
+        )
+
+    return name
+
+
+def parse(contents: typing.Any, parser: str = "") -> bs4.BeautifulSoup:
+    """Convert an HTML page into a tree of nodes.
+
+    Args:
+        contents:
+            The raw HTML of some viewcode page.
+        parser:
+            The name of the HTML parser to use. See :func:`get_parser`.
+            Each parser builds a slightly different tree so, if empty,
+            "html.parser" is used, whichever other parsers are installed.
+
+    Returns:
+        The parsed page, without any "viewcode-back" hyperlinks.
+
+    """
+    soup = bs4.BeautifulSoup(contents, get_parser(parser or HTML_PARSER))
+
+    for div in soup.find_all("a", {"class": "viewcode-back"}):
+        div.decompose()
+
+    return soup
+
+
+CACHE = PageCache()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Download every viewcode page that a build needs before any document is read.
+
+Normally, each code-include directive reads its page while its document
+is parsed, one after another. Instead, this module scans each outdated
+document for code-include targets, finds their pages using the
+intersphinx inventory, and reads every distinct page at once, using a
+pool of threads. By the time that each directive runs, its page is
+already cached.
+
+"""
+
+import concurrent.futures
+import functools
+import importlib.util
+import io
+import logging
+import re
+import typing
+
+from sphinx import application as application_
+from sphinx import environment
+
+from . import bundle
+from . import formatter
+from . import records
+from . import report
+from . import source_code
+from . import state
+
+_LOGGER = logging.getLogger(__name__)
+_DIRECTIVE_EXPRESSION = re.compile(
+    r"^(?P<indent>\s*)\.\.\s+code-include\s*::(?P<text>.*)$"
+)
+_OPTION_EXPRESSION = re.compile(r"^:(?P<name>[\w-]+):(?:\s|$)")
+_INVENTORY_OPTIONS = frozenset(("link-to-documentation", "link-to-source"))
+
+DEFAULT_WORKERS = 8
+"""The default ``code_include_prefetch_workers``. Prefetching is on unless it's 0."""
+
+DEFAULT_CHECK_REMOTE = True
+"""The default ``code_include_check_remote``. Remote pages are checked each build."""
+
+
+class Target(typing.NamedTuple):
+    """One code-include directive, found in a document."""
+
+    directive: str
+    namespace: str
+    options: frozenset[str]
+
+    def prefers_import(self) -> bool:
+        """bool: Check if this target would try a Python import before intersphinx."""
+        # This mirrors `Directive.run`, which only prefers intersphinx
+        # when both hyperlinks are requested.
+        #
+        return not _INVENTORY_OPTIONS.issubset(self.options)
+
+
+def _get_block(lines: list[str], start: int, indent: str) -> list[str]:
+    """Get every line of a directive's indented block.
+
+    Args:
+        lines: Every line of a document.
+        start: The index of the first line after the directive's ".." line.
+        indent: The whitespace before the directive's "..".
+
+    Returns:
+        The stripped, non-empty lines of the block.
+
+    """
+    block = []
+
+    for line in lines[start:]:
+        if not line.strip():
+            continue
+
+        if len(line) - len(line.lstrip()) <= len(indent):
+            break
+
+        block.append(line.strip())
+
+    return block
+
+
+def _is_importable(namespace: str) -> bool:
+    """Check if the top-level package of ``namespace`` can be imported.
+
+    This check doesn't actually import anything.
+
+    Args:
+        namespace: Some Python dot-separated path. e.g. "foo.bar.ClassName".
+
+    Returns:
+        If the package can be found.
+
+    """
+    try:
+        return importlib.util.find_spec(namespace.split(".")[0]) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _get_locations(targets: typing.Iterable[Target]) -> set[str]:
+    """Find the distinct viewcode pages of every target.
+
+    Targets that would be resolved by a Python import are skipped.
+
+    Args:
+        targets: Every code-include directive to find pages for.
+
+    Returns:
+        The URL / file path of every page.
+
+    """
+    uris = set()
+
+    for target in targets:
+        if target.prefers_import() and _is_importable(target.namespace):
+            continue
+
+        try:
+            location = source_code.get_page_location(target.directive, target.namespace)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # The directive itself will report this, later.
+            _LOGGER.debug('Skipped prefetching "%s". Error: "%s".', target, error)
+
+            continue
+
+        if location:
+            uris.add(location[0])
+
+    return uris
+
+
+def _read(uri: str, document: str = "") -> report.Include:
+    """Read ``uri`` into the page cache, ignoring any errors.
+
+    Args:
+        uri: The URL / file path of some viewcode page.
+        document: The document which needs the page, if only one does.
+
+    Returns:
+        The time, cache use, and downloads of reading the page.
+
+    """
+    page = report.Include(document, "", uri)
+
+    with report.measure(page):
+        try:
+            source_code.read_page(uri)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # The directive itself will report this, later.
+            _LOGGER.debug('Page "%s" could not be prefetched. Error: "%s".', uri, error)
+
+    return page
+
+
+def get_targets(text: str) -> list[Target]:
+    """Find every code-include directive in some reStructuredText.
+
+    Args:
+        text: The raw contents of some document.
+
+    Returns:
+        Every directive whose target uses the same syntax as
+        :func:`.formatter.get_raw_content`. Invalid targets are skipped.
+
+    """
+    lines = text.splitlines()
+    targets = []
+
+    for index, line in enumerate(lines):
+        match = _DIRECTIVE_EXPRESSION.match(line)
+
+        if not match:
+            continue
+
+        block = _get_block(lines, index + 1, match.group("indent"))
+        options = set()
+        content = match.group("text").strip()
+
+        for item in block:
+            option = _OPTION_EXPRESSION.match(item)
+
+            if option:
+                options.add(option.group("name"))
+            elif not content:
+                content = item
+
+        try:
+            directive, namespace = formatter.get_raw_content(content)
+        except RuntimeError:
+            continue
+
+        directive = formatter.get_converted_directive(directive) or directive
+        targets.append(Target(directive, namespace, frozenset(options)))
+
+    return targets
+
+
+def prefetch(
+    uris: typing.Iterable[str],
+    workers: int,
+    env: typing.Optional[environment.BuildEnvironment] = None,
+    document: str = "",
+) -> None:
+    """Read every page in ``uris`` into the page cache, at once.
+
+    Args:
+        uris: The URL / file path of every viewcode page to read.
+        workers: The maximum number of pages to read at the same time.
+        env:
+            If given and the user wants a report, each page's
+            measurements are added to it. See :func:`.report.add_prefetch`.
+        document:
+            The document which needs the pages, if only one does. Its
+            pages are forgotten once the document is read again.
+
+    """
+    uris = sorted(uris)
+
+    if not uris:
+        return
+
+    _LOGGER.info("code-include is prefetching %s page(s).", len(uris))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        found = list(executor.map(functools.partial(_read, document=document), uris))
+
+    if env is not None and report.is_enabled(source_code.APPLICATION):
+        for page in found:
+            report.add_prefetch(env, page)
+
+
+def prefetch_targets(
+    targets: typing.Iterable[Target],
+    workers: int,
+    env: typing.Optional[environment.BuildEnvironment] = None,
+    document: str = "",
+) -> None:
+    """Read the distinct viewcode pages of ``targets`` into the page cache, at once.
+
+    Args:
+        targets: Every code-include directive to read pages for.
+        workers: The maximum number of pages to read at the same time.
+        env: If given, the report to add each page's measurements to.
+        document: The document which needs the pages, if only one does.
+
+    """
+    prefetch(_get_locations(targets), workers, env=env, document=document)
+
+
+def get_workers(application: application_.Sphinx) -> int:
+    """int: Get the user's ``code_include_prefetch_workers``."""
+    return typing.cast(int, application.config.code_include_prefetch_workers)
+
+
+def _get_changed(records_: dict[bundle.Key, records.Record]) -> set[bundle.Key]:
+    """Find every remote record whose code is different from its page's code.
+
+    Args:
+        records_: Every stored record which came from a remote viewcode page.
+
+    Returns:
+        The keys of every record that changed.
+
+    """
+    changed = set()
+
+    for key, record in records_.items():
+        uri, _, tag = record.result.source_code_link.partition("#")
+
+        try:
+            code = source_code.get_page_code(uri, tag)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            # An unreachable page keeps its stored result until it can be checked again
+            _LOGGER.debug('Could not check "%s". Error: "%s".', uri, error)
+
+            continue
+
+        if records.get_digest(code) != record.digest:
+            changed.add(key)
+
+    return changed
+
+
+def is_checking_remote(application: application_.Sphinx) -> bool:
+    """Check if remote viewcode pages should be checked for changes, each build.
+
+    Args:
+        application: The Sphinx application which is building.
+
+    Returns:
+        If the user's ``code_include_check_remote`` is on and the build
+        isn't offline.
+
+    """
+    if bundle.get_mode(application) == bundle.OFFLINE:
+        return False
+
+    return bool(application.config.code_include_check_remote)
+
+
+def get_outdated(
+    application: application_.Sphinx,
+    env: environment.BuildEnvironment,
+    added: set[str],
+    changed: set[str],
+    removed: set[str],
+) -> list[str]:
+    """Find the documents whose code-includes changed on another website.
+
+    Sphinx already re-reads a document once a local file that it
+    includes changes. Remote viewcode pages are checked here, instead.
+    Every page is read again (usually as a cheap "304 Not Modified"
+    response) and each stored result's code is compared to its hash.
+
+    This function is meant to run from Sphinx's ``env-get-outdated`` event.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        added: The documents which are new.
+        changed: The documents which Sphinx already knows to re-read.
+        removed: The documents which were deleted.
+
+    Returns:
+        Every other document whose code-include changed. If the user
+        turned ``code_include_check_remote`` off or the build is
+        offline, nothing is checked.
+
+    """
+    if not is_checking_remote(application):
+        return []
+
+    remote = records.get_remote(env)
+
+    if not remote:
+        return []
+
+    locations = {
+        typing.cast(records.Provenance, record.provenance).location
+        for record in remote.values()
+    }
+    current = state.get(application)
+
+    if current.shared:
+        # Another application of the same scope may have read these pages
+        # already, so they're read again to find out if they changed.
+        #
+        for location in locations:
+            current.pages.invalidate(location)
+
+    prefetch(locations, max(1, get_workers(application) or 1), env=env)
+    outdated = _get_changed(remote)
+
+    if not outdated:
+        return []
+
+    records.discard(env, outdated)
+    documents = records.get_documents(env, outdated) - added - changed - removed
+    _LOGGER.info(
+        "code-include found %s document(s) with changed source code.", len(documents)
+    )
+
+    return sorted(documents)
+
+
+def prefetch_documents(
+    application: application_.Sphinx,
+    env: environment.BuildEnvironment,
+    docnames: list[str],
+) -> None:
+    """Read the viewcode pages of every code-include in ``docnames``.
+
+    This function is meant to run from Sphinx's ``env-before-read-docs`` event.
+    Offline builds read every code-include from their bundle, so
+    nothing is prefetched.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        docnames: The names of every document that is about to be read.
+
+    """
+    if bundle.get_mode(application) == bundle.OFFLINE:
+        return
+
+    workers = get_workers(application)
+
+    if not workers or workers < 1:
+        return
+
+    targets: set[Target] = set()
+
+    for name in docnames:
+        try:
+            with io.open(env.doc2path(name), "r", encoding="utf-8") as handler:
+                text = handler.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+
+        targets.update(get_targets(text))
+
+    prefetch_targets(
+        (
+            target
+            for target in targets
+            # Targets which are stored from an earlier build don't need their page
+            if not records.has(
+                env, (target.directive, target.namespace, target.prefers_import())
+            )
+        ),
+        workers,
+        env=env,
+    )
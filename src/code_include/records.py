@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Keep every resolved code-include in Sphinx's environment, between builds.
+
+Sphinx pickles its :class:`sphinx.environment.BuildEnvironment` after
+each build. Every result that a build finds is stored there as a
+:class:`Record`, along with a hash of its code and its
+:class:`Provenance` - the Python file or viewcode page that it came from.
+
+When a document is read again, e.g. because some unrelated text in it
+changed, each of its code-includes is served from the environment, as
+long as the file or page that it came from is unchanged. Every record is
+also tied to the settings which change how code is found, e.g.
+``code_include_strategies``. Once those change, every document with a
+code-include is read again.
+
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import typing
+
+from sphinx import application as application_
+from sphinx import environment
+
+from . import bundle
+from . import static
+
+_ENVIRONMENT_KEY = "code_include_records"
+_SETTINGS = (
+    "code_include_bundle_mode",
+    "code_include_bundle_path",
+    "code_include_html_parser",
+    "code_include_preprocessor",
+    "code_include_strategies",
+)
+
+FILE = "file"
+PAGE = "page"
+
+
+class Provenance(typing.NamedTuple):
+    """Where some source code came from."""
+
+    kind: str
+    """Either :data:`FILE`, for Python files, or :data:`PAGE`, for viewcode pages."""
+
+    location: str
+    """The file path or URL."""
+
+    signature: str
+    """The modification time and size of a local file. Empty for URLs."""
+
+
+class Record(typing.NamedTuple):
+    """A resolved code-include and what's needed to check if it is still current."""
+
+    result: bundle.Result
+    digest: str
+    provenance: typing.Optional[Provenance]
+
+
+class _Records(object):
+    """Every stored :class:`Record` and the documents which use them."""
+
+    # Environments which were pickled before ``settings`` existed have no value
+    settings = ""
+
+    def __init__(self) -> None:
+        """Create an empty store."""
+        super(_Records, self).__init__()
+
+        self.documents: dict[str, set[bundle.Key]] = {}
+        self.records: dict[bundle.Key, Record] = {}
+        self.settings = ""
+
+    def clear(self) -> None:
+        """Forget every record and the documents which use them."""
+        self.documents.clear()
+        self.records.clear()
+
+    def prune(self) -> None:
+        """Forget every record which no document uses anymore."""
+        used = set().union(*self.documents.values())
+
+        for key in set(self.records) - used:
+            del self.records[key]
+
+
+def _describe(value: typing.Any) -> typing.Any:
+    """Convert some setting into JSON-compatible data which changes when it does.
+
+    Args:
+        value: A setting from the user's ``conf.py``. e.g. a list or function.
+
+    Returns:
+        The source code of functions, when it can be found. Otherwise, the value.
+
+    """
+    if not callable(value):
+        return value
+
+    try:
+        return inspect.getsource(value)
+    except (OSError, TypeError):
+        return "{value.__module__}.{value.__qualname__}".format(value=value)
+
+
+def _get_records(env: environment.BuildEnvironment) -> _Records:
+    """Get (or create) the records which are stored in ``env``.
+
+    Args:
+        env: The environment which tracks every document.
+
+    Returns:
+        The stored records.
+
+    """
+    records = getattr(env, _ENVIRONMENT_KEY, None)
+
+    if not isinstance(records, _Records):
+        records = _Records()
+        setattr(env, _ENVIRONMENT_KEY, records)
+
+    return records
+
+
+def _get_signature(path: str) -> str:
+    """str: Describe the current modification time and size of ``path``."""
+    try:
+        details = os.stat(path)
+    except OSError:
+        return ""
+
+    return "{details.st_mtime_ns}:{details.st_size}".format(details=details)
+
+
+def get_digest(code: str) -> str:
+    """str: Hash ``code`` so that it can be compared cheaply, later."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def get_provenance(
+    result: typing.Any,
+    namespace: str,
+    cache: typing.Optional[static.SourceCache] = None,
+) -> typing.Optional[Provenance]:
+    """Find the file or viewcode page that ``result`` came from.
+
+    Args:
+        result:
+            A :class:`.SourceResult`. An imported result stores the
+            imported object as its namespace.
+        namespace:
+            The importable Python location of ``result``.
+            Example: "foo.bar.ClassName.get_method_data".
+        cache:
+            The object which finds each module once. If none is given,
+            :data:`.static.CACHE` is used.
+
+    Returns:
+        The found provenance, if any.
+
+    """
+    if result.source_code_link:
+        page = result.source_code_link.split("#")[0]
+
+        if os.path.isabs(page):
+            return Provenance(PAGE, page, _get_signature(page))
+
+        return Provenance(PAGE, page, "")
+
+    if isinstance(result.namespace, str):
+        found = static.find_source_file(namespace, cache)
+        path = found[0] if found else None
+    else:
+        try:
+            path = inspect.getsourcefile(inspect.unwrap(result.namespace))
+        except TypeError:
+            path = None
+
+    if not path:
+        return None
+
+    path = os.path.abspath(path)
+
+    return Provenance(FILE, path, _get_signature(path))
+
+
+def is_current(provenance: typing.Optional[Provenance]) -> bool:
+    """Check if the file or page of ``provenance`` is unchanged.
+
+    Args:
+        provenance: Where some stored source code came from.
+
+    Returns:
+        If ``provenance`` is a local file which didn't change, or a URL,
+        return ``True``. If it changed or is unknown, return ``False``.
+        URLs are checked once per-build, by :func:`.prefetch.get_outdated`.
+
+    """
+    if not provenance:
+        return False
+
+    if not provenance.signature:
+        return provenance.kind == PAGE and not os.path.isabs(provenance.location)
+
+    return provenance.signature == _get_signature(provenance.location)
+
+
+def add(
+    env: environment.BuildEnvironment,
+    docname: str,
+    key: bundle.Key,
+    record: Record,
+) -> None:
+    """Remember that ``docname`` resolved ``key`` as ``record``.
+
+    Args:
+        env: The environment which tracks every document.
+        docname: The document that has the code-include directive.
+        key: The directive, namespace, and "prefer import" setting of the directive.
+        record: The found source code and where it came from.
+
+    """
+    records = _get_records(env)
+    records.documents.setdefault(docname, set()).add(key)
+    records.records[key] = record
+
+
+def get(
+    env: environment.BuildEnvironment,
+    docname: str,
+    key: bundle.Key,
+) -> typing.Optional[Record]:
+    """Find a stored result of ``key``, if its file or page didn't change.
+
+    Args:
+        env: The environment which tracks every document.
+        docname: The document that has the code-include directive.
+        key: The directive, namespace, and "prefer import" setting of the directive.
+
+    Returns:
+        The found record, if any.
+
+    """
+    records = _get_records(env)
+    record = records.records.get(key)
+
+    if not record or not is_current(record.provenance):
+        return None
+
+    records.documents.setdefault(docname, set()).add(key)
+
+    return record
+
+
+def discard(
+    env: environment.BuildEnvironment, keys: typing.Iterable[bundle.Key]
+) -> None:
+    """Forget the records of ``keys`` so that they're resolved again.
+
+    Args:
+        env: The environment which tracks every document.
+        keys: The directive, namespace, and "prefer import" setting of each record.
+
+    """
+    stored = _get_records(env).records
+
+    for key in keys:
+        stored.pop(key, None)
+
+
+def get_documents(
+    env: environment.BuildEnvironment,
+    keys: typing.Iterable[bundle.Key],
+) -> set[str]:
+    """Find every document which uses any of ``keys``.
+
+    Args:
+        env: The environment which tracks every document.
+        keys: The directive, namespace, and "prefer import" setting of each record.
+
+    Returns:
+        The name of each found document.
+
+    """
+    keys = set(keys)
+
+    return {
+        name
+        for name, used in _get_records(env).documents.items()
+        if not keys.isdisjoint(used)
+    }
+
+
+def get_outdated(
+    application: application_.Sphinx,
+    env: environment.BuildEnvironment,
+    added: set[str],
+    changed: set[str],
+    removed: set[str],
+) -> list[str]:
+    """Forget every record if the user changed how code-includes are found.
+
+    This function is meant to run from Sphinx's ``env-get-outdated`` event.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        added: The documents which are new.
+        changed: The documents which Sphinx already knows to re-read.
+        removed: The documents which were deleted.
+
+    Returns:
+        Every other document which has a code-include, if the settings
+        changed since the last build.
+
+    """
+    records = _get_records(env)
+    settings = get_settings(application)
+
+    if records.settings == settings:
+        return []
+
+    documents = set(records.documents) - added - changed - removed
+    records.clear()
+    records.settings = settings
+
+    return sorted(documents)
+
+
+def get_settings(application: application_.Sphinx) -> str:
+    """Describe every setting which changes the code that a record stores.
+
+    Args:
+        application: The Sphinx application which is building.
+
+    Returns:
+        A hash of the user's settings.
+
+    """
+    return get_digest(
+        json.dumps(
+            [_describe(getattr(application.config, name)) for name in _SETTINGS],
+            default=repr,
+            sort_keys=True,
+        )
+    )
+
+
+def get_remote(env: environment.BuildEnvironment) -> dict[bundle.Key, Record]:
+    """dict[Key, Record]: Get every record which came from a remote viewcode page."""
+    return {
+        key: record
+        for key, record in _get_records(env).records.items()
+        if record.provenance
+        and record.provenance.kind == PAGE
+        and not os.path.isabs(record.provenance.location)
+    }
+
+
+def has(env: environment.BuildEnvironment, key: bundle.Key) -> bool:
+    """bool: Check if ``env`` has a current record of ``key``, without using it."""
+    record = _get_records(env).records.get(key)
+
+    return bool(record and is_current(record.provenance))
+
+
+def make(
+    result: typing.Any,
+    namespace: str,
+    cache: typing.Optional[static.SourceCache] = None,
+) -> Record:
+    """Create a record for some :class:`.SourceResult`.
+
+    Args:
+        result: The found source code and its links.
+        namespace:
+            The importable Python location of ``result``.
+            Example: "foo.bar.ClassName.get_method_data".
+        cache:
+            The object which finds each module once. If none is given,
+            :data:`.static.CACHE` is used.
+
+    Returns:
+        The serializable record.
+
+    """
+    return Record(
+        bundle.Result(
+            result.code,
+            # An import-based result stores the imported object, not its name
+            result.namespace if isinstance(result.namespace, str) else namespace,
+            result.source_code_link,
+            result.documentation_link,
+        ),
+        get_digest(result.code),
+        get_provenance(result, namespace, cache),
+    )
+
+
+def note_dependency(env: environment.BuildEnvironment, record: Record) -> None:
+    """Re-read the current document whenever the local file of ``record`` changes.
+
+    Args:
+        env: The environment which is reading a document.
+        record: Some code-include of the document.
+
+    """
+    provenance = record.provenance
+
+    if provenance and os.path.isabs(provenance.location):
+        env.note_dependency(provenance.location)
+
+
+def purge_document(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+    docname: str,
+) -> None:
+    """Forget which code-includes ``docname`` uses, because it is about to be re-read.
+
+    The records themselves are kept so that the document can re-use
+    them, once it is read again.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        docname: The document which is being removed or re-read.
+
+    """
+    _get_records(env).documents.pop(docname, None)
+
+
+def merge_documents(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+    docnames: set[str],
+    other: environment.BuildEnvironment,
+) -> None:
+    """Copy the records of documents that were read in a parallel sub-process.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The main process's environment.
+        docnames: The documents that ``other`` read.
+        other: The sub-process's environment.
+
+    """
+    records = _get_records(env)
+    others = _get_records(other)
+
+    for name in docnames:
+        if name not in others.documents:
+            continue
+
+        keys = others.documents[name]
+        records.documents[name] = set(keys)
+
+        for key in keys:
+            records.records[key] = others.records[key]
+
+
+def prune(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+) -> list[str]:
+    """Forget every record which no document uses, once every document was read.
+
+    This function is meant to run from Sphinx's ``env-updated`` event.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+
+    Returns:
+        No extra documents need to be written.
+
+    """
+    _get_records(env).prune()
+
+    return []
@@ -0,0 +1,618 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measure where code-include spends its time and write it as a JSON report.
+
+Set ``code_include_report_path`` in ``conf.py`` to enable it. Each
+code-include directive that a build reads is measured as an
+:class:`Include` - its document, target, the strategy which found its
+code, the seconds spent in each phase (import / fetch / parse /
+format), its cache hits and misses, and the bytes that it downloaded.
+
+Every request to a website is also timed, per-host, by :class:`Hosts`.
+Pages which are prefetched before any document is read belong to no
+single include, so each page is measured on its own and reported in a
+separate "prefetch" section. Once the build finishes, :func:`write`
+saves every measurement, a latency histogram of each host, and the
+slowest includes.
+
+Measurements are kept in Sphinx's environment so that documents which
+are read in parallel sub-processes are included, too. That includes the
+requests of :class:`Hosts`. Each process counts its own requests
+separately, so a sub-process's copy of the main process's counts is
+never added twice.
+
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import uuid
+
+from sphinx import application as application_
+from sphinx import environment
+
+from . import helper
+
+_LOGGER = logging.getLogger(__name__)
+_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_ENVIRONMENT_KEY = "code_include_report"
+_FORMAT = "sphinx-code-include-report"
+_HOSTS_KEY = "code_include_report_hosts"
+_LOCAL = threading.local()
+_ORIGIN = (0, "")
+_PREFETCH_KEY = "code_include_report_prefetch"
+_VERSION = 1
+
+IMPORT = "import"
+FETCH = "fetch"
+PARSE = "parse"
+FORMAT = "format"
+PHASES = (IMPORT, FETCH, PARSE, FORMAT)
+RECORD = "record"
+DEFAULT_SLOWEST = 20
+"""The default ``code_include_report_slowest``."""
+
+
+class Include(object):  # pylint: disable=too-few-public-methods
+    """The measurements of one code-include directive.
+
+    Attributes:
+        bytes (int): The number of bytes that were downloaded for this include.
+        directive (str): The Python type of the target. e.g. "py:method".
+        document (str): The document that has the directive.
+        hits (int): The number of times that a cache had what this include needed.
+        misses (int): The number of times that a cache didn't have it.
+        namespace (str): The target. e.g. "foo.bar.ClassName.get_method_data".
+        phases (dict[str, float]): The seconds spent in each of :data:`PHASES`.
+        reused (bool): If an identical include was already finished during the build.
+        seconds (float): The seconds that the whole directive took.
+        strategy (str): The strategy which found the code, if any.
+
+    """
+
+    # Each attribute is one measurement, as it appears in the report
+    #
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, document: str, directive: str, namespace: str) -> None:
+        """Start with empty measurements.
+
+        Args:
+            document: The document that has the directive.
+            directive: The Python type of the target. e.g. "py:method".
+            namespace: The target. e.g. "foo.bar.ClassName.get_method_data".
+
+        """
+        super(Include, self).__init__()
+
+        self.bytes = 0
+        self.directive = directive
+        self.document = document
+        self.hits = 0
+        self.misses = 0
+        self.namespace = namespace
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.reused = False
+        self.seconds = 0.0
+        self.strategy = ""
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        """dict[str, object]: Convert this include into JSON-compatible data."""
+        return {
+            "document": self.document,
+            "directive": self.directive,
+            "namespace": self.namespace,
+            "strategy": self.strategy,
+            "seconds": self.seconds,
+            "phases": dict(self.phases),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes": self.bytes,
+            "reused": self.reused,
+        }
+
+
+class _Host(object):  # pylint: disable=too-few-public-methods
+    """The requests of one website."""
+
+    def __init__(self) -> None:
+        """Start with no requests."""
+        super(_Host, self).__init__()
+
+        self.bytes = 0
+        self.failures = 0
+        self.histogram = [0] * (len(_BUCKETS) + 1)
+        self.requests = 0
+        self.seconds = 0.0
+
+    def add(self, other: "_Host") -> None:
+        """Count the requests of ``other`` as requests of this host, too."""
+        self.bytes += other.bytes
+        self.failures += other.failures
+        self.histogram = [
+            mine + theirs for mine, theirs in zip(self.histogram, other.histogram)
+        ]
+        self.requests += other.requests
+        self.seconds += other.seconds
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        """dict[str, object]: Convert this host into JSON-compatible data."""
+        labels = [str(bucket) for bucket in _BUCKETS] + ["inf"]
+
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "bytes": self.bytes,
+            "seconds": self.seconds,
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+class Hosts(object):
+    """The latency of every request to every website. Every method is thread-safe.
+
+    Requests are kept per-process. Once a parallel sub-process finishes,
+    :meth:`merge` adds only the requests which that sub-process made.
+
+    """
+
+    def __init__(self) -> None:
+        """Start with no requests."""
+        super(Hosts, self).__init__()
+
+        self._hosts: dict[tuple[str, str], _Host] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, typing.Any]:
+        """dict[str, object]: Get every request, so it can be pickled with ``env``."""
+        with self._lock:
+            return {"_hosts": dict(self._hosts)}
+
+    def __len__(self) -> int:
+        """int: The number of websites which were requested."""
+        with self._lock:
+            return len({host for _, host in self._hosts})
+
+    def __setstate__(self, state: dict[str, typing.Any]) -> None:
+        """Load the requests of an unpickled object.
+
+        Args:
+            state: The data that :meth:`__getstate__` made.
+
+        """
+        self._hosts = state["_hosts"]
+        self._lock = threading.Lock()
+
+    def add(self, host: str, seconds: float, size: int, failed: bool = False) -> None:
+        """Remember one request.
+
+        Args:
+            host: The website which was requested. e.g. "docs.python.org".
+            seconds: How long the request took.
+            size: The number of bytes that were received.
+            failed: If ``True``, the request raised an error.
+
+        """
+        index = next(
+            (index for index, bucket in enumerate(_BUCKETS) if seconds <= bucket),
+            len(_BUCKETS),
+        )
+
+        with self._lock:
+            found = self._hosts.setdefault((_get_origin(), host), _Host())
+            found.bytes += size
+            found.failures += int(failed)
+            found.histogram[index] += 1
+            found.requests += 1
+            found.seconds += seconds
+
+    def clear(self) -> None:
+        """Forget every request."""
+        with self._lock:
+            self._hosts.clear()
+
+    def merge(self, other: "Hosts") -> None:
+        """Add the requests of a parallel sub-process.
+
+        Requests which ``other`` copied from this process when it
+        started are already counted here, so they are skipped.
+
+        Args:
+            other: The requests of some sub-process.
+
+        """
+        found = other.__getstate__()["_hosts"]
+
+        with self._lock:
+            for key, host in found.items():
+                self._hosts.setdefault(key, host)
+
+    def to_dict(self) -> dict[str, dict[str, typing.Any]]:
+        """dict[str, dict[str, object]]: Convert every host into JSON-compatible data."""
+        hosts: dict[str, _Host] = {}
+
+        with self._lock:
+            for (_, name), found in self._hosts.items():
+                hosts.setdefault(name, _Host()).add(found)
+
+        return {name: found.to_dict() for name, found in sorted(hosts.items())}
+
+
+def _get_origin() -> str:
+    """str: Get a unique name of this process, which changes in a forked process."""
+    global _ORIGIN  # pylint: disable=global-statement
+
+    if _ORIGIN[0] != os.getpid():
+        _ORIGIN = (os.getpid(), uuid.uuid4().hex)
+
+    return _ORIGIN[1]
+
+
+def _get_current() -> typing.Optional[Include]:
+    """Include: Get the include which is being measured in this thread, if any."""
+    return typing.cast(typing.Optional[Include], getattr(_LOCAL, "include", None))
+
+
+def _get_includes(env: environment.BuildEnvironment) -> dict[str, list[Include]]:
+    """dict[str, list[Include]]: Get the measured includes of every document."""
+    if not hasattr(env, _ENVIRONMENT_KEY):
+        setattr(env, _ENVIRONMENT_KEY, {})
+
+    return typing.cast(dict[str, list[Include]], getattr(env, _ENVIRONMENT_KEY))
+
+
+def _get_hosts(env: environment.BuildEnvironment) -> Hosts:
+    """Hosts: Get the requests of the build."""
+    if not isinstance(getattr(env, _HOSTS_KEY, None), Hosts):
+        setattr(env, _HOSTS_KEY, Hosts())
+
+    return typing.cast(Hosts, getattr(env, _HOSTS_KEY))
+
+
+def _get_prefetched(env: environment.BuildEnvironment) -> list[Include]:
+    """list[Include]: Get the measurements of every prefetched page."""
+    if not hasattr(env, _PREFETCH_KEY):
+        setattr(env, _PREFETCH_KEY, [])
+
+    return typing.cast(list[Include], getattr(env, _PREFETCH_KEY))
+
+
+def _summarize(includes: list[Include]) -> dict[str, typing.Any]:
+    """dict[str, object]: Add up the time, cache use, and downloads of ``includes``."""
+    phases = dict.fromkeys(PHASES, 0.0)
+
+    for include in includes:
+        for name, seconds in include.phases.items():
+            phases[name] += seconds
+
+    return {
+        "seconds": sum(include.seconds for include in includes),
+        "phases": phases,
+        "hits": sum(include.hits for include in includes),
+        "misses": sum(include.misses for include in includes),
+        "bytes": sum(include.bytes for include in includes),
+    }
+
+
+def get_path(application: typing.Optional[application_.Sphinx]) -> str:
+    """Find where the report is written to.
+
+    Args:
+        application: The Sphinx application which is building.
+
+    Returns:
+        The absolute path to the report file. If the user didn't set
+        ``code_include_report_path``, return an empty string.
+
+    """
+    if not application or not getattr(application, "config", None):
+        return ""
+
+    path = application.config.code_include_report_path
+
+    if not path:
+        return ""
+
+    return os.path.join(application.confdir, path)
+
+
+def is_enabled(application: typing.Optional[application_.Sphinx]) -> bool:
+    """bool: Check if the user wants a report of ``application``'s build."""
+    return bool(get_path(application))
+
+
+@contextlib.contextmanager
+def measure(include: Include) -> typing.Iterator[Include]:
+    """Time ``include`` and send every measurement of this thread to it.
+
+    Args:
+        include: The directive to measure.
+
+    Yields:
+        The same include.
+
+    """
+    previous = _get_current()
+    timers = getattr(_LOCAL, "timers", None)
+    _LOCAL.include = include
+    _LOCAL.timers = []
+    started = time.perf_counter()
+
+    try:
+        yield include
+    finally:
+        include.seconds += time.perf_counter() - started
+        _LOCAL.include = previous
+        _LOCAL.timers = timers
+
+
+@contextlib.contextmanager
+def phase(name: str) -> typing.Iterator[None]:
+    """Add the time spent in this context to the current include's ``name`` phase.
+
+    Phases may be nested. The time of an inner phase is only counted
+    once, for the inner phase. If no include is being measured, nothing
+    is timed.
+
+    Args:
+        name: One of :data:`PHASES`.
+
+    Yields:
+        Nothing.
+
+    """
+    include = _get_current()
+
+    if not include:
+        yield
+
+        return
+
+    timers: list[list[float]] = _LOCAL.timers
+    timer = [0.0]
+    timers.append(timer)
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timers.pop()
+        include.phases[name] += elapsed - timer[0]
+
+        if timers:
+            timers[-1][0] += elapsed
+
+
+def note_cache(hit: bool) -> None:
+    """Count a cache hit or miss for the current include, if any.
+
+    Args:
+        hit: If ``True``, the cache had what the include needed.
+
+    """
+    include = _get_current()
+
+    if not include:
+        return
+
+    if hit:
+        include.hits += 1
+    else:
+        include.misses += 1
+
+
+def note_reuse() -> None:
+    """Remember that the current include re-used an identical include, if any."""
+    include = _get_current()
+
+    if include:
+        include.reused = True
+
+
+def note_strategy(name: str) -> None:
+    """Remember which strategy found the current include's code, if any.
+
+    Args:
+        name:
+            One of :data:`.source_code.STRATEGIES`, "bundle", or
+            :data:`RECORD`, for a result that was stored by an earlier build.
+
+    """
+    include = _get_current()
+
+    if include:
+        include.strategy = name
+
+
+def note_transfer(size: int) -> None:
+    """Add ``size`` downloaded bytes to the current include, if any."""
+    include = _get_current()
+
+    if include:
+        include.bytes += size
+
+
+def add(env: environment.BuildEnvironment, include: Include) -> None:
+    """Remember the measurements of ``include``, once its directive finished.
+
+    Args:
+        env: The environment which tracks every document.
+        include: The measured directive.
+
+    """
+    _get_includes(env).setdefault(include.document, []).append(include)
+
+
+def add_prefetch(env: environment.BuildEnvironment, page: Include) -> None:
+    """Remember the measurements of one page that was read before any document.
+
+    Args:
+        env: The environment which tracks every document.
+        page:
+            The measured page. Its namespace is the page's URL / file
+            path and it has no directive. If only one document needed
+            the page, e.g. for deferred code-includes, that is its
+            document. Otherwise, it has no document.
+
+    """
+    _get_prefetched(env).append(page)
+
+
+def make(
+    includes: typing.Iterable[Include],
+    hosts: Hosts,
+    slowest: int = DEFAULT_SLOWEST,
+    prefetched: typing.Iterable[Include] = (),
+) -> dict[str, typing.Any]:
+    """Summarize a build's measurements.
+
+    Args:
+        includes: Every measured directive.
+        hosts: Every request to every website.
+        slowest: The number of slowest includes to list separately.
+        prefetched: Every page which was measured by :func:`add_prefetch`.
+
+    Returns:
+        The JSON-compatible report.
+
+    """
+    includes = sorted(
+        includes, key=lambda include: (include.document, include.namespace)
+    )
+    pages = sorted(prefetched, key=lambda page: page.namespace)
+
+    return {
+        "format": _FORMAT,
+        "version": _VERSION,
+        **_summarize(includes),
+        "saved": sum(include.reused for include in includes),
+        "prefetch": dict(
+            _summarize(pages),
+            pages=[
+                {
+                    "uri": page.namespace,
+                    "seconds": page.seconds,
+                    "phases": dict(page.phases),
+                    "hits": page.hits,
+                    "misses": page.misses,
+                    "bytes": page.bytes,
+                }
+                for page in pages
+            ],
+        ),
+        "hosts": hosts.to_dict(),
+        "slowest": [
+            include.to_dict()
+            for include in sorted(
+                includes, key=lambda include: include.seconds, reverse=True
+            )[: max(0, slowest)]
+        ],
+        "includes": [include.to_dict() for include in includes],
+    }
+
+
+def purge_document(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+    docname: str,
+) -> None:
+    """Forget the measurements of ``docname``, because it is about to be re-read.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The environment which tracks every document.
+        docname: The document which is being removed or re-read.
+
+    """
+    _get_includes(env).pop(docname, None)
+    _get_prefetched(env)[:] = [
+        page for page in _get_prefetched(env) if page.document != docname
+    ]
+
+
+def merge_documents(
+    application: application_.Sphinx,  # pylint: disable=unused-argument
+    env: environment.BuildEnvironment,
+    docnames: set[str],
+    other: environment.BuildEnvironment,
+) -> None:
+    """Copy the measurements of documents that were read in a parallel sub-process.
+
+    Args:
+        application: The Sphinx application which is building.
+        env: The main process's environment.
+        docnames: The documents that ``other`` read.
+        other: The sub-process's environment.
+
+    """
+    includes = _get_includes(env)
+    others = _get_includes(other)
+
+    for name in docnames:
+        if name in others:
+            includes[name] = others[name]
+
+    _get_prefetched(env).extend(
+        page for page in _get_prefetched(other) if page.document in docnames
+    )
+    _get_hosts(env).merge(_get_hosts(other))
+
+
+def reset(
+    env: environment.BuildEnvironment, hosts: typing.Optional[Hosts] = None
+) -> None:
+    """Forget the measurements of an earlier build, so only this build is reported.
+
+    Args:
+        env: The environment which tracks every document.
+        hosts:
+            The object that this build's requests are counted in. If
+            none is given, an empty one is made.
+
+    """
+    setattr(env, _ENVIRONMENT_KEY, {})
+    setattr(env, _HOSTS_KEY, hosts if hosts is not None else Hosts())
+    setattr(env, _PREFETCH_KEY, [])
+
+
+def write(
+    application: application_.Sphinx,
+    exception: typing.Optional[Exception],  # pylint: disable=unused-argument
+) -> None:
+    """Save the measurements of the build to disk, if the user wants a report.
+
+    The report is written even if the build failed, since a slow or
+    broken include is often the reason why.
+
+    Args:
+        application: The Sphinx application which just finished building.
+        exception: The error that stopped the build, if any.
+
+    """
+    path = get_path(application)
+
+    if not path:
+        return
+
+    includes = [
+        include
+        for found in _get_includes(application.env).values()
+        for include in found
+    ]
+    data = make(
+        includes,
+        _get_hosts(application.env),
+        slowest=application.config.code_include_report_slowest,
+        prefetched=_get_prefetched(application.env),
+    )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    helper.write_atomic(path, json.dumps(data, indent=4).encode("utf-8"))
+
+    _LOGGER.info('Wrote a report of %s code-include(s) to "%s".', len(includes), path)
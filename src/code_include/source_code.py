@@ -3,30 +3,57 @@
 
 """The module responsible for getting the code that this extension displays."""
 
+# pylint: disable=too-many-lines
+
+import asyncio
 import collections
+import concurrent.futures
 import functools
-import inspect
 import io
+import logging
 import os
 import typing
-from urllib import request as urllib_request
 
-import bs4
-from bs4 import element
 from sphinx import application as application_
 
+from . import bundle
 from . import error_classes
-from . import helper
-
+from . import fetch
+from . import importer
+from . import inventory
+from . import pages
+from . import report
+from . import state
+from . import static
+from . import workers
+
+_LOGGER = logging.getLogger(__name__)
+_MEMBER_TAGS = frozenset(
+    (
+        "py:attribute",
+        "py:classmethod",
+        "py:method",
+        "py:property",
+        "py:staticmethod",
+    )
+)
 _OBJ_TAG = "obj"
+_T = typing.TypeVar("_T")
+IMPORT = "import"
+INVENTORY = "inventory"
+STATIC = "static"
+STRATEGIES = (IMPORT, INVENTORY, STATIC)
+DEFAULT_STRATEGIES = (IMPORT, INVENTORY)
+"""The default ``code_include_strategies``, in the order that they're tried."""
+BUNDLE = "bundle"
 APPLICATION: typing.Optional[application_.Sphinx] = None
 SourceResult = collections.namedtuple(
     "SourceResult",
     "code namespace source_code_link documentation_link",
 )
+Target = tuple[str, str]
 
 
-@helper.memoize
 def _get_all_intersphinx_roots() -> set[str]:
     """Every file path / URL that the user added to intersphinx's inventory."""
     roots = set()
@@ -45,15 +72,182 @@ def _get_all_intersphinx_roots() -> set[str]:
         return set()
 
     for key, value in mappings:
-        if not isinstance(value, str):
-            roots.add(list(value)[0])
-        else:
+        if isinstance(value, str) or value is None:
+            # The old, pre-Sphinx 1.0 ``{uri: inventory}`` syntax
             roots.add(key)
+        elif isinstance(value[1], (list, tuple)):
+            # Sphinx normalizes every mapping to ``{name: (name, (uri, inventory))}``
+            roots.add(value[1][0])
+        else:
+            roots.add(value[0])
 
     return roots
 
 
-def _get_app_inventory() -> dict[str, dict[str, tuple[str, str, str, str]]]:
+def _get_root_index() -> inventory.RootIndex:
+    """Index every intersphinx root, re-using the index for the rest of the build."""
+    return typing.cast(
+        inventory.RootIndex,
+        _get_state().get_or_create(
+            "root_index", lambda: inventory.RootIndex(_get_all_intersphinx_roots())
+        ),
+    )
+
+
+def activate(application: application_.Sphinx) -> None:
+    """Use the settings and caches of ``application`` from now on.
+
+    Sphinx builds one application at a time, even if several exist in
+    the same process. This function is called whenever an application
+    starts building so that it never uses another application's caches.
+
+    Args:
+        application: The Sphinx application which is about to build.
+
+    """
+    global APPLICATION  # pylint: disable=global-statement
+
+    APPLICATION = application
+
+
+def _get_state() -> state.State:
+    """state.State: Get the caches of the application which is currently building."""
+    return state.get(APPLICATION)
+
+
+def _get_setting(name: str, default: _T) -> _T:
+    """Get some user-defined ``conf.py`` value.
+
+    Every setting is registered in :func:`.extension.setup`, so the
+    user's value (or the registered default) is always found there.
+
+    Args:
+        name: The variable name to look for. e.g. ``"code_include_reraise"``.
+        default: The value to return if there's no Sphinx application.
+
+    Returns:
+        The found value, if any.
+
+    """
+    if not APPLICATION or not getattr(APPLICATION, "config", None):
+        return default
+
+    return typing.cast(_T, getattr(APPLICATION.config, name, default))
+
+
+def _get_bundle() -> bundle.Bundle:
+    """Load (or re-use) the user's offline bundle.
+
+    Raises:
+        EnvironmentError: If the bundle is missing or could not be read.
+
+    Returns:
+        Every pre-recorded code-include result.
+
+    """
+    if not APPLICATION:
+        raise EnvironmentError("code_include did not initialize properly.")
+
+    path = bundle.get_path(APPLICATION)
+
+    return typing.cast(
+        bundle.Bundle,
+        _get_state().get_or_create("bundle", lambda: bundle.Bundle.load(path)),
+    )
+
+
+def _get_fetcher() -> fetch.Fetcher:
+    """Create (or re-use) the object which downloads remote viewcode pages.
+
+    If the user provides ``code_include_cache_directory`` or Sphinx has
+    a doctree directory, downloaded pages are kept there between builds.
+    Timeouts, retries, and the per-host circuit breaker are also
+    configured from the user's ``conf.py``.
+
+    Returns:
+        The object to download with.
+
+    """
+    return typing.cast(
+        fetch.Fetcher, _get_state().get_or_create("fetcher", _make_fetcher)
+    )
+
+
+def _make_fetcher() -> fetch.Fetcher:
+    """Fetcher: Create a new downloader from the user's ``conf.py`` settings."""
+    current = _get_state()
+    directory = _get_setting("code_include_cache_directory", fetch.DEFAULT_DIRECTORY)
+
+    if not directory and APPLICATION and APPLICATION.doctreedir:
+        directory = os.path.join(APPLICATION.doctreedir, "code_include")
+
+    cache = None
+
+    if directory:
+        cache = fetch.DiskCache(
+            directory,
+            max_size=_get_setting("code_include_cache_size", fetch.DEFAULT_CACHE_SIZE),
+        )
+
+    return fetch.Fetcher(
+        cache=cache,
+        pool=fetch.ConnectionPool(
+            connect_timeout=_get_setting(
+                "code_include_connect_timeout", fetch.DEFAULT_CONNECT_TIMEOUT
+            ),
+            read_timeout=_get_setting(
+                "code_include_read_timeout", fetch.DEFAULT_READ_TIMEOUT
+            ),
+        ),
+        options=fetch.Options(
+            max_age=_get_setting("code_include_cache_max_age", fetch.DEFAULT_MAX_AGE),
+            retry=fetch.RetryPolicy(
+                retries=_get_setting("code_include_retries", fetch.DEFAULT_RETRIES),
+                backoff=_get_setting(
+                    "code_include_retry_backoff", fetch.DEFAULT_BACKOFF
+                ),
+            ),
+            threshold=_get_setting(
+                "code_include_circuit_breaker_threshold", fetch.DEFAULT_THRESHOLD
+            ),
+            reset_after=_get_setting(
+                "code_include_circuit_breaker_reset", fetch.DEFAULT_RESET_AFTER
+            ),
+        ),
+        hosts=current.hosts if report.is_enabled(APPLICATION) else None,
+    )
+
+
+def _get_workers() -> typing.Optional[workers.ImportPool]:
+    """Create (or re-use) the worker processes which import the user's code.
+
+    Returns:
+        The workers, if the user enabled ``code_include_import_workers``.
+
+    """
+    return _get_state().get_or_create("workers", _make_workers)
+
+
+def _make_workers() -> typing.Optional[workers.ImportPool]:
+    """Start the import workers which the user asked for, if any."""
+    count = _get_setting("code_include_import_workers", 0)
+
+    if not count or count < 1:
+        return None
+
+    return workers.ImportPool(
+        workers=count,
+        timeout=_get_setting("code_include_import_timeout", workers.DEFAULT_TIMEOUT),
+        max_requests=_get_setting(
+            "code_include_import_worker_max_requests", workers.DEFAULT_MAX_REQUESTS
+        ),
+        max_memory=_get_setting(
+            "code_include_import_worker_max_memory", workers.DEFAULT_MAX_MEMORY
+        ),
+    )
+
+
+def _get_app_inventory() -> inventory.Inventory:
     """Get all cached targets + namespaces."""
     if not APPLICATION:
         raise EnvironmentError("code_include did not initialize properly.")
@@ -78,7 +272,11 @@ def _get_app_inventory() -> dict[str, dict[str, tuple[str, str, str, str]]]:
         return {}
 
 
-def _get_module_tag(namespace: str, directive: str) -> tuple[str, str]:
+def _get_module_tag(
+    namespace: str,
+    directive: str,
+    module: typing.Optional[str] = None,
+) -> tuple[str, str]:
     """Get the project-relative path to some Python class, method, or function.
 
     Args:
@@ -87,6 +285,9 @@ def _get_module_tag(namespace: str, directive: str) -> tuple[str, str]:
             Example: "foo.bar.ClassName.get_method_data".
         directive:
             The Python type that `namespace` is. Example: "py:method".
+        module:
+            The documented module which defines `namespace`, if known.
+            Example: "foo.bar".
 
     Raises:
         EnvironmentError:
@@ -101,9 +302,20 @@ def _get_module_tag(namespace: str, directive: str) -> tuple[str, str]:
         some header in the HTML file.
 
     """
+    if directive == inventory.MODULE:
+        # Module anchors look like "module-foo.bar". The whole module is returned.
+        base = namespace[len("module-") :].replace(".", "/")
+
+        return "_modules/{base}.html".format(base=base), ""
+
+    if module and namespace.startswith(module + "."):
+        base = module.replace(".", "/")
+
+        return "_modules/{base}.html".format(base=base), namespace[len(module) + 1 :]
+
     tokens = namespace.split(".")
 
-    if directive in {"py:method"}:
+    if directive in _MEMBER_TAGS:
         base = "/".join(tokens[:-2])
 
         return "_modules/{base}.html".format(base=base), ".".join(tokens[-2:])
@@ -113,7 +325,7 @@ def _get_module_tag(namespace: str, directive: str) -> tuple[str, str]:
     return "_modules/{base}.html".format(base=base), tokens[-1]
 
 
-def _get_page_preprocessor() -> typing.Callable[[element.Tag], None]:
+def _get_page_preprocessor() -> typing.Optional[pages.Preprocessor]:
     """Find an optional function that will be run on the found source-code tag.
 
     This function is great way to filter out or add content to
@@ -129,46 +341,47 @@ def _get_page_preprocessor() -> typing.Callable[[element.Tag], None]:
         >>>         tag.decompose()
 
     Returns:
-        The node that will be shown to the user.
+        The user's function, if one was defined.
 
     """
-
-    def do_nothing(
-        application: typing.Any,  # pylint: disable=missing-docstring,unused-argument
-    ) -> None:
-        pass
-
     if not APPLICATION:
-        return do_nothing
-
-    if "code_include_preprocessor" in APPLICATION.config:
-        return APPLICATION.config.code_include_preprocessor
-
-    return do_nothing
+        return None
 
+    return typing.cast(
+        typing.Optional[pages.Preprocessor],
+        _get_setting("code_include_preprocessor", None),
+    )
 
-def _get_project_url_root(uri: str, roots: typing.Iterable[str]) -> str:
-    """Find the top-level project for some URL / file-path.
 
-    Note:
-        The matching `uri` must match an item `roots` exactly.
+def _read_page(uri: str) -> typing.Union[str, bytes]:
+    """Read the raw HTML of some viewcode page.
 
     Args:
-        uri:
-            The URL / file-path that presumably came from an intersphinx inventory
-            file. This path is inside some Sphinx project (which we will find the root of).
-        roots:
-            Potential file paths / URLs that `uri` is a child of.
+        uri: The URL / file-path to a HTML file that has Python source-code.
+
+    Raises:
+        :class:`.NotFoundFile`:
+            If `uri` is a path to an HTML file but the file does not exist.
+        :class:`.NotFoundUrl`:
+            If `uri` is a URL and it could not be read properly.
 
     Returns:
-        The found root. If no root was found, return an empty string.
+        The found HTML.
 
     """
-    for root in roots:
-        if uri.startswith(root):
-            return root
+    if os.path.isabs(uri):
+        if not os.path.isfile(uri):
+            raise error_classes.NotFoundFile(uri)
+
+        with report.phase(report.FETCH):
+            with io.open(uri, "r", encoding="utf-8") as handler:
+                return handler.read()
 
-    return ""
+    with report.phase(report.FETCH):
+        try:
+            return _get_fetcher().fetch(uri)
+        except Exception:
+            raise error_classes.NotFoundUrl(uri)
 
 
 def _get_source_code(uri: str, tag: str) -> str:
@@ -183,6 +396,9 @@ def _get_source_code(uri: str, tag: str) -> str:
             The class, method, attribute, or function that will be
             extracted from `uri`.
 
+    Note:
+        Each page is read only once per-build. See :mod:`.pages`.
+
     Raises:
         :class:`.NotFoundFile`:
             If `uri` is a path to an HTML file but the file does not exist.
@@ -196,50 +412,17 @@ def _get_source_code(uri: str, tag: str) -> str:
         (no HTML tags are included).
 
     """
-    if os.path.isabs(uri):
-        if not os.path.isfile(uri):
-            raise error_classes.NotFoundFile(uri)
-
-        with io.open(uri, "r", encoding="utf-8") as handler:
-            contents = handler.read()
-    else:
-        try:
-            handle = urllib_request.urlopen(uri)  # pylint: disable=consider-using-with
-            contents = handle.read()
-            handle.close()
-        except Exception:
-            raise error_classes.NotFoundUrl(uri)
-
-    soup = bs4.BeautifulSoup(contents, "html.parser")
+    with report.phase(report.PARSE):
+        page = read_page(uri)
 
-    for div in soup.find_all("a", {"class": "viewcode-back"}):
-        div.decompose()
+        return page.get_text(tag, preprocessor=_get_page_preprocessor())
 
-    preprocessor = _get_page_preprocessor()
 
-    if not tag:
-        # If the user didn't provide a tag, it means that they are
-        # trying to get the full module's source code.
-        #
-        # The start of the source-code block is always marked using <span class="ch">
-        #
-        child = soup.find("span", {"class": "ch"})
-        node = child.parent
-        preprocessor(node)
-
-        return node.getText().lstrip()
-
-    node = soup.find("div", {"id": tag})
-
-    if not node:
-        raise RuntimeError(f'No node was found for "{tag}" tag.')
-
-    preprocessor(node)
-
-    return node.get_text()
-
-
-def _get_source_module_data(uri: str, directive: str) -> tuple[str, str]:
+def _get_source_module_data(
+    uri: str,
+    directive: str,
+    module: typing.Optional[str] = None,
+) -> tuple[str, str]:
     """Find the full path to a HTML file and the tagged content to retrieve.
 
     Args:
@@ -248,7 +431,9 @@ def _get_source_module_data(uri: str, directive: str) -> tuple[str, str]:
             Example: "api/fake_project.html#module-fake_project.basic".
         directive:
             A type of marker used by Sphinx to find source code.
-            Examples: "py:class", "py:staticmethod", "py:function", "obj".
+            Examples: "py:class", "py:staticmethod", "py:function".
+        module:
+            The documented module which defines the object of `uri`, if known.
 
     Returns:
         The absolute path to an HTML file and the "#foo" tag (this
@@ -257,37 +442,94 @@ def _get_source_module_data(uri: str, directive: str) -> tuple[str, str]:
 
     """
     url, tag = uri.split("#")  # `url` might be a file path or web URL
-    available_roots = _get_all_intersphinx_roots()
-    root = _get_project_url_root(url, available_roots)
+    roots = _get_root_index()
+    root = roots.get(url)
 
     if not root:
         raise EnvironmentError(
             'URL "{url}" isn\'t in any of the available projects, "{roots}".'.format(
-                url=url, roots=sorted(available_roots)
+                url=url, roots=sorted(roots)
             )
         )
 
-    module_path, tag = _get_module_tag(tag, directive)
+    module_path, tag = _get_module_tag(tag, directive, module=module)
 
     return (root + "/" + module_path, tag)
 
 
-def _get_source_code_from_inventory(
+def _get_namespace_index(cache: inventory.Inventory) -> inventory.NamespaceIndex:
+    """Reverse the intersphinx inventory, re-using the last index if possible.
+
+    Args:
+        cache: Get all cached targets + namespaces.
+
+    Returns:
+        Every namespace of `cache` and its role.
+
+    """
+    current = _get_state()
+    found = current.namespace_index
+
+    if found and found[0] is cache:
+        return found[1]
+
+    index = inventory.NamespaceIndex(cache)
+    current.namespace_index = (cache, index)
+
+    return index
+
+
+def _get_suggestions_message(
+    namespace: str,
+    cache: inventory.Inventory,
+    role: typing.Optional[str] = None,
+) -> str:
+    """Describe the documented namespaces which are closest to a missing one.
+
+    Args:
+        namespace:
+            The importable Python location which wasn't found.
+            Example: "foo.bar.ClassName.get_mthod_data".
+        cache:
+            Get all cached targets + namespaces.
+        role:
+            Only suggest namespaces of this type. If empty, any type may be suggested.
+
+    Returns:
+        A sentence for an error message.
+
+    """
+    suggestions = _get_namespace_index(cache).get_suggestions(namespace, role=role)
+
+    if not suggestions:
+        return "No similar namespace was found."
+
+    return "Did you mean {suggestions}?".format(
+        suggestions=", ".join('"{name}"'.format(name=name) for name in suggestions)
+    )
+
+
+def _get_uri(
     tag: str,
     namespace: str,
-) -> typing.Optional[SourceResult]:
-    """Get the raw code of some class, method, attribute, or function.
+    cache: inventory.Inventory,
+) -> inventory.Entry:
+    """Find a URI, relative to the Sphinx project, that points to source code.
+
+    If `tag` is "obj", `namespace` is found with any role, using
+    :class:`.NamespaceIndex`. Otherwise, only `tag` is checked.
 
     Args:
         tag:
-            The Python type that `namespace` is. Example: "py:method".
+            A type of marker used by Sphinx to find source code.
+            Examples: "py:class", "py:staticmethod", "py:function", "obj".
         namespace:
             The importable Python location of some class, method, or function.
             Example: "foo.bar.ClassName.get_method_data".
+        cache:
+            Get all cached targets + namespaces.
 
     Raises:
-        RuntimeError:
-            If no intersphinx inventory cache could be found.
         :class:`.MissingTag`:
             If `tag` wasn't found in any Sphinx project in the
             intersphinx inventory cache.
@@ -297,89 +539,85 @@ def _get_source_code_from_inventory(
             the intersphinx inventory cache.
 
     Returns:
-        The found source-code for `namespace`, with a type of `tag`.
+        The found role of `namespace` (never "obj") and its project-relative path.
+        Example: ("py:module", "api/fake_project.html#module-fake_project.basic").
 
     """
+    if tag == _OBJ_TAG:
+        entry = _get_namespace_index(cache).get(namespace)
+
+        if not entry:
+            raise error_classes.MissingNamespace(
+                'Namespace "{namespace}" cound not be found for any tag searched by :obj:. '
+                "{suggestions}".format(
+                    namespace=namespace,
+                    suggestions=_get_suggestions_message(namespace, cache),
+                )
+            )
 
-    def __get_uri(
-        tag: str,
-        cache: dict[str, dict[str, tuple[str, str, str, str]]],
-    ) -> str:
-        """Find a URI, relative to the Sphinx project, that points to source code.
-
-        The basic logic of this function goes like this. If `tag`
-        is "obj", try every possible type of tag before raising an
-        exception. If it isn't "obj" then raise an exception as soon as
-        one is needed.
-
-        Args:
-            tag:
-                A type of marker used by Sphinx to find source code.
-                Examples: "py:class", "py:staticmethod", "py:function", "obj".
-            cache:
-                Get all cached targets + namespaces.
-
-        Returns:
-            The project-relative path.
-            Example: "api/fake_project.html#module-fake_project.basic".
+        return entry
 
-        """
-        tags = [tag]
-
-        if tag == "obj":
-            # If the user doesn't know the tag-type of `namespace` then we must
-            # check every possible type, manually.
-            #
-            tags = [
-                "py:attribute",
-                "py:function",
-                "py:classmethod",
-                "py:staticmethod",
-                "py:method",
-                "py:class",
-                "py:module",
-            ]
-
-        for tag_ in tags:
-            try:
-                typed_tag_data = cache[tag_]
-            except KeyError:
-                if tag != _OBJ_TAG:
-                    raise error_classes.MissingTag(
-                        'Tag "{tag_}" was invalid. Options were, "{options}".'.format(
-                            tag_=tag_, options=sorted(cache)
-                        )
-                    )
-
-                continue
-
-            try:
-                _, _, uri, _ = typed_tag_data[namespace]
-            except KeyError:
-                if tag != _OBJ_TAG:
-                    raise error_classes.MissingNamespace(
-                        'Namespace "{namespace}" was invalid. Options were, "{options}".'.format(
-                            namespace=namespace, options=sorted(typed_tag_data)
-                        )
-                    )
-
-                continue
-
-            return uri
+    try:
+        typed_tag_data = cache[tag]
+    except KeyError:
+        raise error_classes.MissingTag(
+            'Tag "{tag}" was invalid. Options were, "{options}".'.format(
+                tag=tag, options=sorted(cache)
+            )
+        )
 
+    try:
+        _, _, uri, _ = typed_tag_data[namespace]
+    except KeyError:
         raise error_classes.MissingNamespace(
-            'Namespace "{namespace}" cound not be found for any tag searched by :obj:.'.format(
-                namespace=namespace
+            'Namespace "{namespace}" was invalid. {suggestions}'.format(
+                namespace=namespace,
+                suggestions=_get_suggestions_message(namespace, cache, role=tag),
             )
         )
 
+    return inventory.Entry(tag, uri)
+
+
+def _get_source_code_from_inventory(
+    tag: str,
+    namespace: str,
+) -> typing.Optional[SourceResult]:
+    """Get the raw code of some class, method, attribute, or function.
+
+    Args:
+        tag:
+            The Python type that `namespace` is. Example: "py:method".
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+
+    Raises:
+        RuntimeError:
+            If no intersphinx inventory cache could be found.
+        :class:`.MissingTag`:
+            If `tag` wasn't found in any Sphinx project in the
+            intersphinx inventory cache.
+        :class:`.MissingNamespace`:
+            If `tag` was in the intersphinx inventory cache but
+            the no `namespace` could be found in any Sphinx project in
+            the intersphinx inventory cache.
+
+    Returns:
+        The found source-code for `namespace`, with a type of `tag`.
+
+    """
     cache = _get_app_inventory()
 
     if not cache:
         return None
 
-    uri = __get_uri(tag, cache)
-    module_url, tag = _get_source_module_data(uri, tag)
+    role, uri = _get_uri(tag, namespace, cache)
+    module_url, tag = _get_source_module_data(
+        uri,
+        role,
+        module=_get_namespace_index(cache).get_module(namespace),
+    )
     code = _get_source_code(module_url, tag)
     full_source_code_url = module_url + "#" + tag
 
@@ -400,95 +638,233 @@ def _get_source_code_from_object(
         The found source code, assuming `namespace` describes an importable location.
 
     """
+    current = _get_state()
+    found = importer.get_source(namespace, current.unimportable, current.sources)
+
+    if not found:
+        return None
 
-    def _recursively_find_first_importable_object(namespaces: list[str]) -> typing.Any:
-        """Find the closest Python module to import from.
+    code, object_ = found
 
-        If `namespaces` isn't importable, this function will re-try
-        using the parent namespace of `namespaces`.
+    return SourceResult(code, object_, "", "")
 
-        Args:
-            namespaces:
-                The Python namespace, split into parts.
-                e.g. ["foo", "bar", "ClassName", "get_method_data"].
 
-        Returns:
-            The found importable object or nothing if `namespaces` isn't importable.
+def _get_source_code_from_worker(
+    namespace: str,
+) -> typing.Optional[SourceResult]:
+    """Import a Python namespace path in a worker process and get its source code.
 
-        """
-        if not namespaces:
-            return None
+    If the user didn't enable ``code_include_import_workers``, the
+    namespace is imported in this process, instead.
 
-        try:
-            return __import__(".".join(namespaces))
-        except ImportError:
-            return _recursively_find_first_importable_object(namespaces[:-1])
+    Args:
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
 
-    def _resolve_object(object_: typing.Any, namespace: str) -> typing.Any:
-        """Get a Python object located at `namespace`, using a root `object_`.
+    Raises:
+        :class:`.ImportWorkerError`:
+            If the import took too long or the worker stopped unexpectedly.
 
-        Args:
-            object_:
-                A Python module that contains `namespace`.
-                e.g. The `os` module.
-            namespace:
-                A dot-separated string of some attribute, class, or
-                function that is located within `object_`.
-                e.g. "path.join".
+    Returns:
+        The found source code, assuming `namespace` describes an importable location.
 
-        Returns:
-            The resolved class, function, attribute, or module.
+    """
+    pool = _get_workers()
 
-        """
-        if object_.__name__ == namespace:
-            return object_
+    with report.phase(report.IMPORT):
+        if not pool:
+            return _get_source_code_from_object(namespace)
 
-        if not namespace:
-            return object_
+        result = pool.get(namespace)
 
-        root_namespace = object_.__name__ + "."  # Example: `os.`
-        tail = namespace[len(root_namespace) :]  # Example: `path.join`
+    if not result:
+        return None
 
-        objects = tail.split(".")  # Example: ["path", "join"]
-        parent = object_
+    return SourceResult(*result)
 
-        for item in objects:
-            try:
-                parent = getattr(parent, item)
-            except AttributeError:
-                return None
 
-        return parent
+def _get_source_code_from_file(namespace: str) -> typing.Optional[SourceResult]:
+    """Read the source code of `namespace` from its Python file, without importing it.
 
-    namespaces = namespace.split(".")
-    object_ = _recursively_find_first_importable_object(namespaces)
+    Args:
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
 
-    if not object_:
+    Returns:
+        The found source code, assuming `namespace` is defined in a Python file.
+
+    """
+    with report.phase(report.PARSE):
+        code = static.find_source(namespace, _get_state().sources)
+
+    if code is None:
         return None
 
-    resolved_object = _resolve_object(object_, namespace)
+    return SourceResult(code, namespace, "", "")
+
+
+def _get_strategy_names(prefer_import: bool) -> list[str]:
+    """Get the name of every strategy which may find source code, in the order to try them.
+
+    The order comes from the user's ``code_include_strategies``. If
+    `prefer_import` is ``False``, the intersphinx inventory is tried first.
+
+    Args:
+        prefer_import:
+            If ``False``, look for source code from Sphinx before the other strategies.
+
+    Raises:
+        EnvironmentError: If the user's ``code_include_strategies`` has an unknown name.
+
+    Returns:
+        Each of :data:`STRATEGIES` to try.
+
+    """
+    names = list(_get_setting("code_include_strategies", DEFAULT_STRATEGIES))
+    unknown = sorted(set(names) - set(STRATEGIES))
+
+    if unknown:
+        raise EnvironmentError(
+            'code_include_strategies "{unknown}" are unknown. Options were "{options}".'.format(
+                unknown=unknown,
+                options=STRATEGIES,
+            )
+        )
+
+    if not prefer_import and INVENTORY in names:
+        names.remove(INVENTORY)
+        names.insert(0, INVENTORY)
+
+    return names
+
+
+def _get_getters(
+    directive: str,
+) -> dict[str, typing.Callable[[str], typing.Optional[SourceResult]]]:
+    """Get the function of each strategy. Each function takes a namespace.
+
+    Args:
+        directive:
+            The Python type that the namespace is. Example: "py:method".
+
+    Returns:
+        Each of :data:`STRATEGIES` and its function.
+
+    """
+    return {
+        IMPORT: _get_source_code_from_worker,
+        INVENTORY: functools.partial(_get_source_code_from_inventory, directive),
+        STATIC: _get_source_code_from_file,
+    }
+
+
+def clear_caches() -> None:
+    """Remove any data from a previous build so that the next build starts fresh.
+
+    Only the caches of the current application are cleared. Pages which
+    were stored on-disk or which are shared with other applications
+    are kept. They're re-validated the next time that they are needed.
+
+    """
+    _get_state().clear()
 
-    if not resolved_object:
+
+def get_page_location(
+    directive: str, namespace: str
+) -> typing.Optional[tuple[str, str]]:
+    """Find the viewcode page that has the source code for some namespace.
+
+    Args:
+        directive:
+            The Python type that `namespace` is. Example: "py:method".
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+
+    Raises:
+        :class:`.MissingTag`:
+            If `directive` wasn't found in the intersphinx inventory.
+        :class:`.MissingNamespace`:
+            If `namespace` wasn't found in the intersphinx inventory.
+
+    Returns:
+        The URL / file-path to the viewcode page and the tag of
+        `namespace` within that page. If there's no intersphinx
+        inventory, return nothing.
+
+    """
+    cache = _get_app_inventory()
+
+    if not cache:
         return None
 
-    lines, _ = inspect.getsourcelines(resolved_object)
+    role, uri = _get_uri(directive, namespace, cache)
 
-    return SourceResult("".join(lines), resolved_object, "", "")
+    return _get_source_module_data(
+        uri,
+        role,
+        module=_get_namespace_index(cache).get_module(namespace),
+    )
 
 
-def get_source_code(
+def read_page(uri: str) -> pages.Page:
+    """Read and parse a viewcode page, if it wasn't already read during this build.
+
+    Args:
+        uri: The URL / file-path to a HTML file that has Python source-code.
+
+    Raises:
+        EnvironmentError:
+            If the user's ``code_include_html_parser`` is unknown or not installed.
+        :class:`.NotFoundFile`:
+            If `uri` is a path to an HTML file but the file does not exist.
+        :class:`.NotFoundUrl`:
+            If `uri` is a URL and it could not be read properly.
+
+    Returns:
+        The parsed page.
+
+    """
+    return _get_state().pages.get(
+        uri,
+        _read_page,
+        parser=_get_setting("code_include_html_parser", ""),
+    )
+
+
+def get_page_code(uri: str, tag: str) -> str:
+    """Find the exact code for some tag of a viewcode page.
+
+    The page is read only if it wasn't already read during this build.
+
+    Args:
+        uri: The URL / file-path to a HTML file that has Python source-code.
+        tag: The class, method, attribute, or function to get from `uri`.
+
+    Raises:
+        :class:`.NotFoundFile`:
+            If `uri` is a path to an HTML file but the file does not exist.
+        :class:`.NotFoundUrl`:
+            If `uri` is a URL and it could not be read properly.
+        RuntimeError:
+            If we find all data that we need but somehow fail to find the source code.
+
+    Returns:
+        The found source-code, as raw text.
+
+    """
+    return _get_source_code(uri, tag)
+
+
+def _resolve(
     directive: str,
     namespace: str,
-    prefer_import: bool = False,
+    prefer_import: bool,
 ) -> SourceResult:
     """Find the raw source code of some class, method, attribute, or function.
 
-    This function first tries to import the path given by `namespace`
-    directly, because that's the most sure-fire way of getting the
-    source code. But if it can't be imported, this function will fall
-    back to intersphinx's inventory to see if it was loaded as part of
-    this Sphinx project.
-
     Args:
         directive:
             The Python type that `namespace` is. Example: "py:method".
@@ -501,31 +877,48 @@ def get_source_code(
             first, instead.
 
     Raises:
+        EnvironmentError: If the user's ``code_include_strategies`` has an unknown name.
+        MissingBundleEntry:
+            If the user is building offline and the bundle has no result
+            for `namespace`.
         NoMatchFound: If no code is findable.
+        ImportWorkerError:
+            If an import took too long in a worker process and no other
+            strategy found any code.
+        NotFoundUrl:
+            If a viewcode page could not be downloaded and no other
+            strategy found any code.
 
     Returns:
-        str: The found source code.
+        The found source code.
 
     """
-    strategy: list[typing.Callable[[str], typing.Optional[SourceResult]]] = []
-
-    if prefer_import:
-        strategy = [
-            _get_source_code_from_object,
-            functools.partial(_get_source_code_from_inventory, directive),
-        ]
-    else:
-        strategy = [
-            functools.partial(_get_source_code_from_inventory, directive),
-            _get_source_code_from_object,
-        ]
-
-    for getter in strategy:
-        code = getter(namespace)
+    if bundle.get_mode(APPLICATION) == bundle.OFFLINE:
+        report.note_strategy(BUNDLE)
+
+        return SourceResult(*_get_bundle().get((directive, namespace, prefer_import)))
+
+    getters = _get_getters(directive)
+    unreachable: typing.Optional[Exception] = None
+
+    for name in _get_strategy_names(prefer_import):
+        try:
+            code = getters[name](namespace)
+        except (error_classes.ImportWorkerError, error_classes.NotFoundUrl) as error:
+            # A slow / dead website or import shouldn't stop the other strategies
+            _LOGGER.debug('Skipping unreachable "%s". Trying the next strategy.', error)
+            unreachable = error
+
+            continue
 
         if code:
+            report.note_strategy(name)
+
             return code
 
+    if unreachable:
+        raise unreachable
+
     raise error_classes.NoMatchFound(
         "No importable data or intersphinx cache could be found. "
         'Cannot directive / namespace "{directive} / {namespace}". '
@@ -534,3 +927,183 @@ def get_source_code(
             namespace=namespace,
         )
     )
+
+
+def _get_results(
+    targets: list[Target],
+    found: dict[Target, typing.Union[SourceResult, Exception]],
+    return_exceptions: bool,
+) -> list[typing.Union[SourceResult, Exception]]:
+    """Put each resolved target back in the order that the user gave.
+
+    Args:
+        targets: Every requested target, including duplicates.
+        found: Each unique target and its source code or the error it raised.
+        return_exceptions: If ``False``, raise the first error instead of returning it.
+
+    Returns:
+        The source code of each target.
+
+    """
+    results = [found[target] for target in targets]
+
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    return results
+
+
+async def get_source_codes_async(
+    targets: typing.Iterable[Target],
+    prefer_import: bool = False,
+    concurrency: int = 8,
+    return_exceptions: bool = False,
+) -> list[typing.Union[SourceResult, Exception]]:
+    """Find the source code of many targets, concurrently.
+
+    Every target shares the same page cache so each viewcode page is
+    still only read once. Duplicate targets are only resolved once.
+
+    Args:
+        targets:
+            Each (directive, namespace) pair to find source code for.
+            e.g. ``[("py:function", "foo.bar.get_method_data")]``.
+        prefer_import:
+            If ``True``, try a Python import before intersphinx. See
+            :func:`get_source_code` for details.
+        concurrency:
+            The maximum number of targets to resolve at the same time.
+        return_exceptions:
+            If ``True``, a target which fails returns its exception
+            instead of raising it.
+
+    Raises:
+        NoMatchFound: If no code is findable for some target.
+
+    Returns:
+        The source code of each target, in the same order as `targets`.
+
+    """
+    targets = list(targets)
+    unique = list(dict.fromkeys(targets))
+    loop = asyncio.get_running_loop()
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, concurrency)
+    ) as executor:
+        found = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    _resolve,
+                    directive,
+                    namespace,
+                    prefer_import,
+                )
+                for directive, namespace in unique
+            ),
+            return_exceptions=True,
+        )
+
+    return _get_results(
+        targets,
+        dict(
+            zip(unique, typing.cast(list[typing.Union[SourceResult, Exception]], found))
+        ),
+        return_exceptions,
+    )
+
+
+def get_source_codes(
+    targets: typing.Iterable[Target],
+    prefer_import: bool = False,
+    concurrency: int = 8,
+    return_exceptions: bool = False,
+) -> list[typing.Union[SourceResult, Exception]]:
+    """Find the source code of many targets, concurrently.
+
+    This is the blocking version of :func:`get_source_codes_async`. If
+    you already have a running event loop, use that function instead.
+
+    Args:
+        targets:
+            Each (directive, namespace) pair to find source code for.
+            e.g. ``[("py:function", "foo.bar.get_method_data")]``.
+        prefer_import:
+            If ``True``, try a Python import before intersphinx. See
+            :func:`get_source_code` for details.
+        concurrency:
+            The maximum number of targets to resolve at the same time.
+        return_exceptions:
+            If ``True``, a target which fails returns its exception
+            instead of raising it.
+
+    Raises:
+        NoMatchFound: If no code is findable for some target.
+
+    Returns:
+        The source code of each target, in the same order as `targets`.
+
+    """
+    targets = list(targets)
+    unique = set(targets)
+
+    if len(unique) == 1:
+        # A single target gains nothing from an event loop so it's resolved directly
+        target = targets[0]
+        result: typing.Union[SourceResult, Exception]
+
+        try:
+            result = _resolve(target[0], target[1], prefer_import)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            result = error
+
+        return _get_results(targets, {target: result}, return_exceptions)
+
+    return asyncio.run(
+        get_source_codes_async(
+            targets,
+            prefer_import=prefer_import,
+            concurrency=concurrency,
+            return_exceptions=return_exceptions,
+        )
+    )
+
+
+def get_source_code(
+    directive: str,
+    namespace: str,
+    prefer_import: bool = False,
+) -> SourceResult:
+    """Find the raw source code of some class, method, attribute, or function.
+
+    This function first tries to import the path given by `namespace`
+    directly, because that's the most sure-fire way of getting the
+    source code. But if it can't be imported, this function will fall
+    back to intersphinx's inventory to see if it was loaded as part of
+    this Sphinx project.
+
+    Args:
+        directive:
+            The Python type that `namespace` is. Example: "py:method".
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+        prefer_import:
+            If ``False``, look for source code from Sphinx before and if not found, do a
+            real Python import for the source code. If ``True`` then do a Python import
+            first, instead.
+
+    Raises:
+        NoMatchFound: If no code is findable.
+
+    Returns:
+        str: The found source code.
+
+    """
+    return typing.cast(
+        SourceResult,
+        get_source_codes([(directive, namespace)], prefer_import=prefer_import)[0],
+    )
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Keep code-include's caches separately for each Sphinx application.
+
+Several applications may build in one process, e.g. when
+sphinx-multiversion builds every version of a project or when tests
+create many applications. Each application gets its own :class:`State`
+so that the intersphinx roots, inventories, Python files, and bundle of
+one build never leak into another.
+
+Parsed viewcode pages may still be shared on purpose. Applications whose
+``code_include_cache_scope`` has the same, non-empty name read their
+pages from one :class:`.PageCache`, so the same page is only downloaded
+and parsed once for all of them. ``code_include_page_cache_size`` and
+``code_include_page_cache_ttl`` limit how many pages are kept and for
+how long.
+
+"""
+
+import threading
+import typing
+
+from sphinx import application as application_
+
+from . import bundle
+from . import dedupe
+from . import fetch
+from . import inventory
+from . import pages
+from . import report
+from . import static
+
+if typing.TYPE_CHECKING:
+    from . import workers
+
+_APPLICATION_KEY = "code_include_state"
+_LOCK = threading.Lock()
+_SCOPES: dict[str, pages.PageCache] = {}
+_T = typing.TypeVar("_T")
+
+
+class State(object):
+    """Every cache that code-include uses while one Sphinx application builds.
+
+    Code-includes may be found by many threads at once, so any attribute
+    which starts as ``None`` should be made with :meth:`get_or_create`.
+
+    Attributes:
+        bundle (Bundle | None): The user's loaded offline bundle, if any.
+        fetcher (Fetcher | None): The object which downloads viewcode pages.
+        hosts (Hosts): The latency of every request, for the build's report.
+        includes (Store): Every finished code-include, shared by identical includes.
+        namespace_index (tuple[Inventory, NamespaceIndex] | None):
+            The last intersphinx inventory and its reversed index.
+        pages (PageCache): Every parsed viewcode page.
+        root_index (RootIndex | None): Every intersphinx root of the application.
+        shared (bool): If ``pages`` is used by other applications, too.
+        sources (SourceCache): Every Python file which was read and module which was found.
+        unimportable (set[str]): Each module which failed to import.
+        workers (ImportPool | None): The processes which import the user's code.
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        pages_: typing.Optional[pages.PageCache] = None,
+        shared: bool = False,
+        sources: typing.Optional[static.SourceCache] = None,
+    ) -> None:
+        """Create empty caches.
+
+        Args:
+            pages_:
+                The page cache to read viewcode pages into. If no cache
+                is given, this state gets its own.
+            shared:
+                If ``True``, ``pages_`` is used by other applications and
+                is never cleared by this state.
+            sources:
+                The cache to read Python files into. If no cache is
+                given, this state gets its own.
+
+        """
+        super(State, self).__init__()
+
+        self._lock = threading.Lock()
+        self.bundle: typing.Optional[bundle.Bundle] = None
+        self.fetcher: typing.Optional[fetch.Fetcher] = None
+        self.hosts = report.Hosts()
+        self.includes = dedupe.Store()
+        self.namespace_index: typing.Optional[
+            tuple[inventory.Inventory, inventory.NamespaceIndex]
+        ] = None
+        self.pages = pages_ if pages_ is not None else pages.PageCache()
+        self.root_index: typing.Optional[inventory.RootIndex] = None
+        self.unimportable: set[str] = set()
+        self.workers: typing.Optional["workers.ImportPool"] = None
+        self.shared = shared
+        self.sources = sources if sources is not None else static.SourceCache()
+
+    def clear(self) -> None:
+        """Stop any open connection or process and forget the last build.
+
+        A shared page cache is kept because other applications still use it.
+        Read Python files are kept, too. Each one is read again once it changes.
+
+        """
+        with self._lock:
+            if self.fetcher:
+                self.fetcher.close()
+
+            if self.workers:
+                self.workers.close()
+
+            self.bundle = None
+            self.fetcher = None
+            self.namespace_index = None
+            self.root_index = None
+            self.workers = None
+
+        self.hosts.clear()
+        self.includes.clear()
+        self.sources.clear_modules()
+        self.unimportable.clear()
+
+        if not self.shared:
+            self.pages.clear()
+
+    def get_or_create(
+        self, name: str, factory: typing.Callable[[], typing.Optional[_T]]
+    ) -> typing.Optional[_T]:
+        """Get the attribute called ``name``, creating it if it's still ``None``.
+
+        When many threads ask for the same missing attribute at once, only
+        one of them calls ``factory``. Otherwise, each thread would make its
+        own worker processes or connections and all but one would never
+        be closed.
+
+        Args:
+            name: An attribute of this object. e.g. ``"workers"``.
+            factory: A function which creates the attribute's value.
+
+        Returns:
+            The found or newly-created value. If ``factory`` returns
+            ``None``, it's called again next time.
+
+        """
+        with self._lock:
+            found = getattr(self, name)
+
+            if found is None:
+                found = factory()
+                setattr(self, name, found)
+
+            return typing.cast(typing.Optional[_T], found)
+
+
+_DEFAULT = State(pages.CACHE, sources=static.CACHE)
+
+
+def _get_scope(application: application_.Sphinx) -> str:
+    """str: Find the user's ``code_include_cache_scope``, if any."""
+    try:
+        scope = application.config.code_include_cache_scope
+    except AttributeError:
+        return ""
+
+    return scope if isinstance(scope, str) else ""
+
+
+def _get_limit(application: application_.Sphinx, name: str) -> float:
+    """float: Find the user's page cache size / age limit, if any."""
+    try:
+        value = getattr(application.config, name)
+    except AttributeError:
+        return 0
+
+    return value if isinstance(value, (int, float)) else 0
+
+
+def _make_pages(application: application_.Sphinx) -> pages.PageCache:
+    """PageCache: Create a page cache with the user's size and age limits, if any."""
+    return pages.PageCache(
+        max_size=int(_get_limit(application, "code_include_page_cache_size")),
+        ttl=_get_limit(application, "code_include_page_cache_ttl"),
+    )
+
+
+def get(application: typing.Optional[application_.Sphinx]) -> State:
+    """Find (or create) the caches of ``application``.
+
+    Args:
+        application:
+            The Sphinx application which is building. If there's no
+            application, e.g. because code-include is used outside of
+            Sphinx, a process-wide state is used.
+
+    Returns:
+        The found state.
+
+    """
+    if application is None:
+        return _DEFAULT
+
+    found = getattr(application, _APPLICATION_KEY, None)
+
+    if isinstance(found, State):
+        return found
+
+    with _LOCK:
+        found = getattr(application, _APPLICATION_KEY, None)
+
+        if isinstance(found, State):
+            return found
+
+        scope = _get_scope(application)
+
+        if scope:
+            if scope not in _SCOPES:
+                _SCOPES[scope] = _make_pages(application)
+
+            found = State(_SCOPES[scope], shared=True)
+        else:
+            found = State(_make_pages(application))
+
+        setattr(application, _APPLICATION_KEY, found)
+
+    return found
@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Find Python source code by reading files, without importing them.
+
+Importing a user's package can be slow, fail outright, or have
+side-effects. Instead, :func:`find_source_file` finds the module's file
+the same way that Python's import system would, but without running any
+of its code (not even the ``__init__.py`` of parent packages). Then
+:func:`get_source` parses the file and slices out the exact lines of the
+requested class, function, method, or module-level variable.
+
+Each file is parsed once into a :class:`SourceFile`, which knows the
+lines of every name in the file, and is kept in a :class:`SourceCache`
+until the file changes. Each Sphinx application has its own cache (see
+:mod:`.state`). Imported objects are also read from this cache, with
+:func:`get_object_source`.
+
+"""
+
+import ast
+import importlib.machinery
+import inspect
+import logging
+import os
+import sys
+import tokenize
+import typing
+
+from . import helper
+
+_LOGGER = logging.getLogger(__name__)
+
+_Definition = typing.Union[ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef]
+_DEFINITIONS = (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+_NESTED_BODIES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith)
+
+Span = tuple[int, int]
+"""The first and last line of some source code, starting from 1 and inclusive."""
+
+
+class SourceFile(object):
+    """The source code of a Python file and the line span of every name in it."""
+
+    def __init__(self, source: str, spans: dict[str, Span]) -> None:
+        """Keep track of a file's source code.
+
+        Args:
+            source: The Python source code of some module.
+            spans: Each qualified name in ``source`` and its lines. See :func:`get_spans`.
+
+        """
+        super(SourceFile, self).__init__()
+
+        self._lines = source.splitlines(True)
+        self._source = source
+        self._spans = spans
+
+    @classmethod
+    def read(cls, path: str) -> "SourceFile":
+        """Read and index a Python file.
+
+        Args:
+            path: The absolute path to some Python file.
+
+        Raises:
+            OSError: If ``path`` could not be read.
+            SyntaxError: If ``path`` isn't valid Python or has an invalid encoding.
+
+        Returns:
+            The indexed file.
+
+        """
+        with tokenize.open(path) as handler:
+            source = handler.read()
+
+        return cls(source, get_spans(source))
+
+    def get(self, qualname: str) -> typing.Optional[str]:
+        """Get the exact source code of ``qualname``.
+
+        Args:
+            qualname:
+                A class, function, method, or variable. e.g.
+                "ClassName.get_method_data". If empty, get the whole file.
+
+        Returns:
+            The found source code, if any.
+
+        """
+        if not qualname:
+            return self._source
+
+        span = self.get_span(qualname)
+
+        if not span:
+            return None
+
+        start, end = span
+
+        return "".join(self._lines[start - 1 : end])
+
+    def get_span(self, qualname: str) -> typing.Optional[Span]:
+        """Find the first and last line of ``qualname``, if it is in this file."""
+        return self._spans.get(qualname)
+
+
+class SourceCache(object):
+    """Read and index each Python file once, until the file changes on-disk.
+
+    Every module which was found, or not found, without importing it is
+    also remembered, until :meth:`clear_modules`.
+
+    """
+
+    def __init__(self) -> None:
+        """Create an empty cache."""
+        super(SourceCache, self).__init__()
+
+        self._files = helper.Cache()
+        self._specs = helper.Cache()
+
+    def __contains__(self, path: object) -> bool:
+        """bool: Check if ``path`` was already read."""
+        return path in self._files
+
+    def __len__(self) -> int:
+        """int: The number of files which are currently stored."""
+        return len(self._files)
+
+    @property
+    def hits(self) -> int:
+        """int: The number of times that a file was served from memory."""
+        return self._files.hits
+
+    @property
+    def misses(self) -> int:
+        """int: The number of times that a file had to be read."""
+        return self._files.misses
+
+    def clear(self) -> None:
+        """Remove every stored file and module and reset the hit / miss counts."""
+        self._files.clear()
+        self._specs.clear()
+
+    def clear_modules(self) -> None:
+        """Forget every module which was found, or not found, by :meth:`find_spec`."""
+        self._specs.clear()
+
+    def find_spec(
+        self,
+        name: str,
+        path: typing.Optional[typing.Sequence[str]],
+    ) -> typing.Optional[importlib.machinery.ModuleSpec]:
+        """Find a module without importing it or any of its parent packages.
+
+        :func:`importlib.util.find_spec` imports every parent package of
+        ``name``. This method asks each import finder directly, instead.
+
+        Args:
+            name: The full module name. e.g. "foo.bar".
+            path: The folders of the parent package. If empty, ``name`` is a top-level module.
+
+        Returns:
+            The found module, if any.
+
+        """
+        module = sys.modules.get(name)
+
+        if module is not None:
+            # e.g. ``__main__`` or a module which was made at runtime may not have a spec
+            return getattr(module, "__spec__", None) or importlib.machinery.ModuleSpec(
+                name, None
+            )
+
+        return typing.cast(
+            typing.Optional[importlib.machinery.ModuleSpec],
+            self._specs.get_or_create(name, lambda: _search(name, path)),
+        )
+
+    def get(self, path: str) -> typing.Optional[SourceFile]:
+        """Find the indexed file for ``path``, reading it only if it is new or changed.
+
+        Args:
+            path: The absolute path to some Python file.
+
+        Returns:
+            The found or newly-read file. If ``path`` can't be read or
+            parsed, return nothing.
+
+        """
+        try:
+            details = os.stat(path)
+        except OSError as error:
+            _LOGGER.debug('Could not find "%s": %s', path, error)
+
+            return None
+
+        version = (details.st_mtime_ns, details.st_size)
+
+        try:
+            _, source = self._files.get_or_create(
+                path,
+                lambda: (version, SourceFile.read(path)),
+                is_valid=lambda stored: stored[0] == version,
+            )
+        except (OSError, SyntaxError, UnicodeDecodeError) as error:
+            _LOGGER.debug('Could not read "%s": %s', path, error)
+
+            return None
+
+        return typing.cast(SourceFile, source)
+
+
+def _search(
+    name: str,
+    path: typing.Optional[typing.Sequence[str]],
+) -> typing.Optional[importlib.machinery.ModuleSpec]:
+    """Ask each import finder for ``name``. See :meth:`SourceCache.find_spec` for details."""
+    for finder in sys.meta_path:
+        find_spec = getattr(finder, "find_spec", None)
+
+        if not find_spec:
+            continue
+
+        try:
+            spec = find_spec(name, path)
+        except (ImportError, ValueError) as error:
+            _LOGGER.debug(
+                'Finder "%s" could not search for "%s": %s', finder, name, error
+            )
+
+            continue
+
+        if spec is not None:
+            return typing.cast(importlib.machinery.ModuleSpec, spec)
+
+    return None
+
+
+def _get_spans(
+    body: list[ast.stmt],
+    prefix: str,
+    lines: list[str],
+    spans: dict[str, Span],
+) -> None:
+    """Add the line span of every named definition in ``body`` to ``spans``.
+
+    Args:
+        body: The statements of some module, class, or function.
+        prefix: The qualified name of ``body``'s parent, if any. e.g. "Parent.".
+        lines: Every line of the module's source code.
+        spans: Each qualified name and its span. e.g. ``{"Parent.method": (10, 12)}``.
+
+    """
+    for node in body:
+        if isinstance(node, _DEFINITIONS):
+            name = prefix + node.name
+            spans[name] = (_get_start(node), _get_end(node, lines))
+            _get_spans(node.body, name + ".", lines, spans)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+
+            for target in targets:
+                for name_ in _get_names(target):
+                    spans[prefix + name_] = (
+                        node.lineno,
+                        typing.cast(int, node.end_lineno),
+                    )
+        elif isinstance(node, _NESTED_BODIES):
+            # e.g. ``if typing.TYPE_CHECKING:`` blocks still define names in the same scope
+            _get_spans(node.body, prefix, lines, spans)
+            _get_spans(getattr(node, "orelse", []), prefix, lines, spans)
+        elif isinstance(node, ast.Try):
+            for statements in (node.body, node.orelse, node.finalbody):
+                _get_spans(statements, prefix, lines, spans)
+
+            for handler in node.handlers:
+                _get_spans(handler.body, prefix, lines, spans)
+
+
+def _get_end(node: _Definition, lines: list[str]) -> int:
+    """Get the last line of ``node``, including any comments at the end of its body.
+
+    The comments are included so that the result matches :func:`inspect.getsourcelines`.
+
+    Args:
+        node: Some class or function.
+        lines: Every line of the module's source code.
+
+    Returns:
+        The line number, starting from 1.
+
+    """
+    end = typing.cast(int, node.end_lineno)
+
+    for number in range(end + 1, len(lines) + 1):
+        line = lines[number - 1]
+        stripped = line.lstrip()
+
+        if not stripped:
+            continue
+
+        if not stripped.startswith("#") or len(line) - len(stripped) <= node.col_offset:
+            break
+
+        end = number
+
+    return end
+
+
+def _get_names(target: ast.expr) -> list[str]:
+    """list[str]: Get every plain variable name that ``target`` assigns to."""
+    if isinstance(target, ast.Name):
+        return [target.id]
+
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return [name for item in target.elts for name in _get_names(item)]
+
+    return []
+
+
+def _get_start(node: _Definition) -> int:
+    """int: Get the first line of ``node``, including its decorators."""
+    if node.decorator_list:
+        return min(decorator.lineno for decorator in node.decorator_list)
+
+    return node.lineno
+
+
+def _find_module_spec(
+    tokens: list[str],
+    cache: SourceCache,
+) -> typing.Optional[tuple[importlib.machinery.ModuleSpec, int]]:
+    """Find the longest module of some namespace, without importing it.
+
+    Args:
+        tokens:
+            The Python namespace, split into parts.
+            e.g. ["foo", "bar", "ClassName", "get_method_data"].
+        cache:
+            The object which remembers every found module.
+
+    Returns:
+        The found module and the number of ``tokens`` in its name, if any.
+
+    """
+    found: typing.Optional[tuple[importlib.machinery.ModuleSpec, int]] = None
+    path: typing.Optional[typing.Sequence[str]] = None
+
+    for index in range(len(tokens)):
+        spec = cache.find_spec(".".join(tokens[: index + 1]), path)
+
+        if spec is None:
+            break
+
+        found = (spec, index + 1)
+
+        if spec.submodule_search_locations is None:
+            break
+
+        path = list(spec.submodule_search_locations)
+
+    return found
+
+
+def _get_cache(cache: typing.Optional[SourceCache]) -> SourceCache:
+    """SourceCache: Get ``cache`` or, if there's none, the process-wide :data:`CACHE`."""
+    return CACHE if cache is None else cache
+
+
+def find_module(
+    namespace: str, cache: typing.Optional[SourceCache] = None
+) -> typing.Optional[tuple[str, str]]:
+    """Find the longest importable module of ``namespace``, without importing it.
+
+    Args:
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+        cache:
+            The object which remembers every found module. If none is
+            given, :data:`CACHE` is used.
+
+    Returns:
+        The module's name and the rest of ``namespace``, relative to that
+        module. e.g. ``("foo.bar", "ClassName.get_method_data")``. If no
+        part of ``namespace`` is a module, return nothing.
+
+    """
+    tokens = namespace.split(".")
+    found = _find_module_spec(tokens, _get_cache(cache))
+
+    if not found:
+        return None
+
+    _, count = found
+
+    return ".".join(tokens[:count]), ".".join(tokens[count:])
+
+
+def find_source_file(
+    namespace: str, cache: typing.Optional[SourceCache] = None
+) -> typing.Optional[tuple[str, str]]:
+    """Find the Python file which defines ``namespace``, without importing it.
+
+    Args:
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+        cache:
+            The object which remembers every found module. If none is
+            given, :data:`CACHE` is used.
+
+    Returns:
+        The path to the module's source file and the rest of ``namespace``,
+        relative to that module. e.g. ``("/.../foo/bar.py", "ClassName.get_method_data")``.
+        If no module of ``namespace`` has a Python source file, return nothing.
+
+    """
+    tokens = namespace.split(".")
+    found = _find_module_spec(tokens, _get_cache(cache))
+
+    if not found:
+        return None
+
+    spec, count = found
+
+    if not spec.has_location or not spec.origin:
+        return None
+
+    if not spec.origin.endswith(tuple(importlib.machinery.SOURCE_SUFFIXES)):
+        # e.g. A compiled extension module. There's no source code to read.
+        return None
+
+    return spec.origin, ".".join(tokens[count:])
+
+
+def get_spans(source: str) -> dict[str, Span]:
+    """Find the lines of every class, function, method, and variable in ``source``.
+
+    Nested definitions use their parent's name, e.g. "Parent.method" or
+    "function.inner_function". If a name is defined more than once, the
+    last definition wins, just like it would when the module is imported.
+
+    Args:
+        source: The Python source code of some module.
+
+    Raises:
+        SyntaxError: If ``source`` isn't valid Python.
+
+    Returns:
+        Each qualified name and its first and last line.
+
+    """
+    spans: dict[str, Span] = {}
+    _get_spans(ast.parse(source).body, "", source.splitlines(), spans)
+
+    return spans
+
+
+def get_source(
+    path: str, qualname: str, cache: typing.Optional[SourceCache] = None
+) -> typing.Optional[str]:
+    """Get the exact source code of ``qualname`` from a Python file.
+
+    Args:
+        path: The absolute path to some Python file.
+        qualname:
+            A class, function, method, or variable in ``path``. e.g.
+            "ClassName.get_method_data". If empty, get the whole file.
+        cache:
+            The object which reads each file once. If none is given,
+            :data:`CACHE` is used.
+
+    Returns:
+        The found source code, if any.
+
+    """
+    source = _get_cache(cache).get(path)
+
+    if not source:
+        return None
+
+    return source.get(qualname)
+
+
+def get_object_source(
+    object_: typing.Any, cache: typing.Optional[SourceCache] = None
+) -> typing.Optional[str]:
+    """Get the source code of an imported module, class, or function from its file.
+
+    Unlike :func:`inspect.getsourcelines`, the file is only read and
+    tokenized once, no matter how many of its objects are requested.
+
+    Args:
+        object_:
+            Some imported module, class, method, or function.
+        cache:
+            The object which reads each file once. If none is given,
+            :data:`CACHE` is used.
+
+    Returns:
+        The found source code. If ``object_`` can't be found in its
+        file, e.g. because it was made dynamically, return nothing.
+
+    """
+    object_ = inspect.unwrap(object_)
+
+    try:
+        path = inspect.getsourcefile(object_)
+    except TypeError:  # e.g. A built-in module or function
+        path = None
+
+    source = _get_cache(cache).get(os.path.abspath(path)) if path else None
+
+    if not source:
+        return None
+
+    if inspect.ismodule(object_):
+        return source.get("")
+
+    qualname = getattr(object_, "__qualname__", None)
+
+    if not isinstance(qualname, str):
+        return None
+
+    qualname = qualname.replace(".<locals>", "")
+    span = source.get_span(qualname)
+    code = getattr(object_, "__code__", None)
+
+    if not span or (code and code.co_firstlineno != span[0]):
+        # e.g. A function which is defined twice, under an ``if`` / ``else``
+        return None
+
+    return source.get(qualname)
+
+
+def find_source(
+    namespace: str, cache: typing.Optional[SourceCache] = None
+) -> typing.Optional[str]:
+    """Find the source code of ``namespace`` without importing anything.
+
+    Args:
+        namespace:
+            The importable Python location of some class, method, or function.
+            Example: "foo.bar.ClassName.get_method_data".
+        cache:
+            The object which reads each file and module once. If none is
+            given, :data:`CACHE` is used.
+
+    Returns:
+        The found source code, if any.
+
+    """
+    found = find_source_file(namespace, cache)
+
+    if not found:
+        return None
+
+    path, qualname = found
+
+    return get_source(path, qualname, cache)
+
+
+CACHE = SourceCache()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Import the user's Python packages in separate, long-lived worker processes.
+
+Importing a package in the Sphinx process keeps it in :data:`sys.modules`
+for the rest of the build. Large packages can add gigabytes of memory
+this way and an import which never finishes stops the whole build.
+
+:class:`ImportPool` sends each namespace to a worker process instead.
+The worker imports the namespace, finds its source code, and sends
+back plain text. A worker which takes too long is killed. A worker is
+also replaced once it has served too many namespaces or uses too much
+memory, so that imported packages don't pile up forever.
+
+"""
+
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import typing
+from multiprocessing import connection as connection_
+
+from . import error_classes
+from . import importer
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None  # type: ignore  # pylint: disable=invalid-name
+
+_LOGGER = logging.getLogger(__name__)
+_STOP_TIMEOUT = 5.0
+
+DEFAULT_TIMEOUT = 60
+"""The default ``code_include_import_timeout``, in seconds."""
+DEFAULT_MAX_REQUESTS = 100
+"""The default ``code_include_import_worker_max_requests``."""
+DEFAULT_MAX_MEMORY = 0
+"""The default ``code_include_import_worker_max_memory``, in bytes. 0 means no limit."""
+
+Result = tuple[str, str, str, str]
+"""The data of a :class:`.SourceResult` - code / namespace / source link / documentation link."""
+
+
+class _Worker(object):
+    """One worker process and the connection used to talk to it."""
+
+    def __init__(self) -> None:
+        """Start the process."""
+        super(_Worker, self).__init__()
+
+        context = multiprocessing.get_context("spawn")
+        self._connection, child = context.Pipe()
+        self._process = context.Process(
+            target=_serve,
+            args=(child,),
+            name="code-include-import-worker",
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+        self.memory = 0
+        self.requests = 0
+
+    def kill(self) -> None:
+        """Stop the process immediately, e.g. because it stopped responding."""
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+
+    def request(self, namespace: str, timeout: float) -> typing.Optional[Result]:
+        """Find the source code of ``namespace`` in the worker process.
+
+        Args:
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+            timeout:
+                The most seconds to wait for the worker to respond.
+
+        Raises:
+            :class:`.ImportWorkerError`:
+                If the worker didn't respond in time or if it stopped
+                unexpectedly. In both cases, the worker is killed.
+            Exception:
+                Whatever the import / source code look-up raised in the worker.
+
+        Returns:
+            The found source code, if `namespace` is importable.
+
+        """
+        try:
+            self._connection.send(namespace)
+            finished = self._connection.poll(timeout)
+        except (EOFError, OSError) as error_:
+            self.kill()
+
+            raise error_classes.ImportWorkerError(
+                'The import worker for "{namespace}" stopped unexpectedly.'.format(
+                    namespace=namespace
+                )
+            ) from error_
+
+        if not finished:
+            self.kill()
+
+            raise error_classes.ImportWorkerError(
+                'Importing "{namespace}" took more than {timeout} seconds.'.format(
+                    namespace=namespace, timeout=timeout
+                )
+            )
+
+        try:
+            result, error, self.memory = self._connection.recv()
+        except (EOFError, OSError) as error_:
+            self.kill()
+
+            raise error_classes.ImportWorkerError(
+                'The import worker for "{namespace}" stopped unexpectedly.'.format(
+                    namespace=namespace
+                )
+            ) from error_
+
+        self.requests += 1
+
+        if error:
+            raise error
+
+        return typing.cast(typing.Optional[Result], result)
+
+    def stop(self) -> None:
+        """Ask the process to exit and wait for it. If it doesn't exit, kill it."""
+        try:
+            self._connection.send(None)
+        except (EOFError, OSError):
+            pass
+
+        self._process.join(_STOP_TIMEOUT)
+
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+
+        self._connection.close()
+
+
+class ImportPool(object):
+    """Find the source code of namespaces in separate worker processes.
+
+    Workers are started the first time that they're needed and are
+    re-used until :meth:`close`. Every method is thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_requests: int = DEFAULT_MAX_REQUESTS,
+        max_memory: int = DEFAULT_MAX_MEMORY,
+    ) -> None:
+        """Keep track of the pool's limits.
+
+        Args:
+            workers:
+                The most worker processes to run at once.
+            timeout:
+                The most seconds that one namespace may take. A worker
+                which takes longer is killed.
+            max_requests:
+                The number of namespaces that a worker finds before it is
+                replaced. 0 means no limit.
+            max_memory:
+                The number of bytes that a worker may use before it is
+                replaced. 0 means no limit.
+
+        """
+        super(ImportPool, self).__init__()
+
+        self._condition = threading.Condition()
+        self._count = 0
+        self._idle: list[_Worker] = []
+        self._max_memory = max_memory
+        self._max_requests = max_requests
+        self._size = max(1, workers)
+        self._timeout = timeout
+
+    def _acquire(self) -> _Worker:
+        """Get an idle worker. If every worker is busy, start one or wait for one."""
+        with self._condition:
+            while not self._idle and self._count >= self._size:
+                self._condition.wait()
+
+            if self._idle:
+                return self._idle.pop()
+
+            self._count += 1
+
+        try:
+            return _Worker()
+        except BaseException:
+            self._release(None)
+
+            raise
+
+    def _is_exhausted(self, worker: _Worker) -> bool:
+        """bool: Check if ``worker`` served too many namespaces or uses too much memory."""
+        if self._max_requests and worker.requests >= self._max_requests:
+            return True
+
+        return bool(self._max_memory and worker.memory >= self._max_memory)
+
+    def _release(self, worker: typing.Optional[_Worker]) -> None:
+        """Make ``worker`` available again. If it's empty, a new worker may start."""
+        with self._condition:
+            if worker:
+                self._idle.append(worker)
+            else:
+                self._count -= 1
+
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Stop every idle worker."""
+        with self._condition:
+            workers = list(self._idle)
+            self._idle.clear()
+            self._count -= len(workers)
+
+        for worker in workers:
+            worker.stop()
+
+    def get(self, namespace: str) -> typing.Optional[Result]:
+        """Import ``namespace`` in a worker process and get its source code.
+
+        Args:
+            namespace:
+                The importable Python location of some class, method, or function.
+                Example: "foo.bar.ClassName.get_method_data".
+
+        Raises:
+            :class:`.ImportWorkerError`:
+                If the worker took too long or stopped unexpectedly.
+
+        Returns:
+            The found source code, if `namespace` is importable.
+
+        """
+        worker = self._acquire()
+
+        try:
+            result = worker.request(namespace, self._timeout)
+        except error_classes.ImportWorkerError:
+            self._release(None)
+
+            raise
+        except BaseException:
+            self._release(worker)
+
+            raise
+
+        if self._is_exhausted(worker):
+            _LOGGER.debug(
+                "Replacing an import worker after %s request(s) and %s byte(s).",
+                worker.requests,
+                worker.memory,
+            )
+            worker.stop()
+            self._release(None)
+        else:
+            self._release(worker)
+
+        return result
+
+
+def _get_memory() -> int:
+    """int: Get the number of bytes that the current process uses, if known."""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as handler:
+            return int(handler.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, IndexError, OSError, ValueError):
+        pass
+
+    if resource is None:
+        return 0
+
+    # The peak memory of the process. It's in kilobytes, except on macOS
+    maximum = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return int(maximum if sys.platform == "darwin" else maximum * 1024)
+
+
+def _serve(connection: connection_.Connection) -> None:
+    """Find the source code of each namespace that is sent to ``connection``.
+
+    This function runs in a worker process, until it receives ``None``.
+
+    Args:
+        connection: The pipe to the parent process.
+
+    """
+    unimportable: set[str] = set()
+
+    while True:
+        try:
+            namespace = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        if namespace is None:
+            return
+
+        result: typing.Optional[Result] = None
+        error: typing.Optional[BaseException] = None
+
+        try:
+            found = importer.get_source(namespace, unimportable)
+        except Exception as error_:  # pylint: disable=broad-exception-caught
+            error = error_
+        else:
+            if found:
+                result = (found[0], namespace, "", "")
+
+        try:
+            pickle.dumps(error)
+        except Exception:  # pylint: disable=broad-exception-caught
+            error = RuntimeError(
+                "{name}: {error}".format(name=type(error).__name__, error=error)
+            )
+
+        connection.send((result, error, _get_memory()))
@@ -11,6 +11,7 @@ from unittest import mock
 
 from docutils import statemachine
 from sphinx import application
+from sphinx import config
 from sphinx.ext import intersphinx
 
 from code_include import extension
@@ -59,6 +60,36 @@ def make_mock_directive(
     )
 
 
+def make_configured_application(
+    overrides: typing.Optional[dict[str, str]] = None,
+    settings: typing.Optional[dict[str, typing.Any]] = None,
+) -> mock.MagicMock:
+    """Create a fake Sphinx application which has code-include's settings.
+
+    Args:
+        overrides:
+            Settings which the user gave from the command-line. e.g.
+            ``{"code_include_prefetch_workers": "0"}``.
+        settings:
+            Settings which the user wrote in their ``conf.py``. e.g.
+            ``{"code_include_deferred": True}``.
+
+    Returns:
+        The application. Its ``config`` is a real Sphinx configuration.
+
+    """
+    fake = mock.MagicMock()
+    fake.config = config.Config(dict(settings or {}), dict(overrides or {}))
+    fake.add_config_value.side_effect = fake.config.add
+
+    with mock.patch("code_include.source_code.APPLICATION"):
+        extension.setup(fake)
+
+    fake.config.init_values()
+
+    return fake
+
+
 @helper.memoize
 def load_cache(path: str) -> Inventory:
     """Load some inventory file as raw data.
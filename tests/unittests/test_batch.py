@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that many code-include targets can be resolved at once."""
+
+import asyncio
+import threading
+import typing
+import unittest
+from unittest import mock
+
+from code_include import error_classes
+from code_include import source_code
+
+_SOURCES = {
+    "foo.bar": "def bar():\n    pass\n",
+    "foo.fizz": "def fizz():\n    pass\n",
+    "foo.buzz": "def buzz():\n    pass\n",
+}
+
+
+class _Common(unittest.TestCase):
+    """Replace the real import / intersphinx strategies with fake ones."""
+
+    def setUp(self) -> None:
+        """Make every namespace in :data:`_SOURCES` importable."""
+        self.calls: list[str] = []
+        self._lock = threading.Lock()
+
+        def _get_from_object(
+            namespace: str,
+        ) -> typing.Optional[source_code.SourceResult]:
+            with self._lock:
+                self.calls.append(namespace)
+
+            if namespace not in _SOURCES:
+                return None
+
+            return source_code.SourceResult(_SOURCES[namespace], namespace, "", "")
+
+        patchers = [
+            mock.patch(
+                "code_include.source_code._get_source_code_from_object",
+                side_effect=_get_from_object,
+            ),
+            mock.patch(
+                "code_include.source_code._get_app_inventory",
+                return_value={},
+            ),
+        ]
+
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class GetSourceCodes(_Common):
+    """Check :func:`code_include.source_code.get_source_codes`."""
+
+    def test_order_and_duplicates(self) -> None:
+        """Return results in the given order and resolve duplicates once."""
+        targets = [
+            ("py:function", "foo.buzz"),
+            ("py:function", "foo.bar"),
+            ("py:function", "foo.buzz"),
+            ("py:function", "foo.fizz"),
+        ]
+
+        results = source_code.get_source_codes(targets, prefer_import=True)
+
+        self.assertEqual(
+            [_SOURCES[namespace] for _, namespace in targets],
+            [typing.cast(source_code.SourceResult, result).code for result in results],
+        )
+        self.assertEqual(3, len(self.calls))
+
+    def test_errors(self) -> None:
+        """Raise the same error classes as the single-target function."""
+        targets = [("py:function", "foo.bar"), ("py:function", "does.not.exist")]
+
+        with self.assertRaises(error_classes.NoMatchFound):
+            source_code.get_source_codes(targets, prefer_import=True)
+
+        results = source_code.get_source_codes(
+            targets,
+            prefer_import=True,
+            return_exceptions=True,
+        )
+
+        self.assertIsInstance(results[0], source_code.SourceResult)
+        self.assertIsInstance(results[1], error_classes.NoMatchFound)
+
+    def test_single(self) -> None:
+        """Make sure the single-target function still works the same way."""
+        self.assertEqual(
+            _SOURCES["foo.bar"],
+            source_code.get_source_code("py:function", "foo.bar", True).code,
+        )
+
+        with self.assertRaises(error_classes.NoMatchFound):
+            source_code.get_source_code("py:function", "does.not.exist", True)
+
+
+class GetSourceCodesAsync(_Common):
+    """Check :func:`code_include.source_code.get_source_codes_async`."""
+
+    def test_running_loop(self) -> None:
+        """Resolve targets from inside of an already-running event loop."""
+
+        async def _run() -> list[typing.Union[source_code.SourceResult, Exception]]:
+            found: list[typing.Union[source_code.SourceResult, Exception]] = (
+                await source_code.get_source_codes_async(
+                    [("py:function", namespace) for namespace in _SOURCES],
+                    prefer_import=True,
+                    concurrency=2,
+                )
+            )
+
+            return found
+
+        results = asyncio.run(_run())
+
+        self.assertEqual(
+            list(_SOURCES.values()),
+            [typing.cast(source_code.SourceResult, result).code for result in results],
+        )
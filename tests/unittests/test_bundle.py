@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that code-include results can be recorded and replayed offline."""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import typing
+import unittest
+from unittest import mock
+
+from code_include import bundle
+from code_include import error_classes
+from code_include import source_code
+
+from .. import common
+
+_KEY = ("py:function", "foo.bar", True)
+_RESULT = bundle.Result("def bar():\n    pass\n", "foo.bar", "", "")
+
+
+class _Common(unittest.TestCase):
+    """Make a temporary directory for bundle files."""
+
+    def setUp(self) -> None:
+        """Create the directory."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_bundle")
+        self._path = os.path.join(self._directory, "bundle.json.gz")
+
+    def tearDown(self) -> None:
+        """Delete the directory."""
+        shutil.rmtree(self._directory)
+
+    def _make_application(self, mode: str) -> mock.MagicMock:
+        """Create a fake Sphinx application which uses a bundle.
+
+        Args:
+            mode: The ``code_include_bundle_mode`` to use.
+
+        Returns:
+            The fake application.
+
+        """
+        application = common.make_configured_application(
+            settings={
+                "code_include_bundle_mode": mode,
+                "code_include_bundle_path": "bundle.json.gz",
+            }
+        )
+        application.confdir = self._directory
+
+        return application
+
+
+class Bundle(_Common):
+    """Check that :class:`code_include.bundle.Bundle` is read and written correctly."""
+
+    def test_round_trip(self) -> None:
+        """Save a bundle and load it again."""
+        original = bundle.Bundle()
+        original.add(_KEY, _RESULT)
+        original.save(self._path)
+
+        loaded = bundle.Bundle.load(self._path)
+
+        self.assertEqual(1, len(loaded))
+        self.assertEqual(_RESULT, loaded.get(_KEY))
+
+    def test_permissions(self) -> None:
+        """Let other users read the bundle, like any other new file."""
+        mask = os.umask(0)
+        os.umask(mask)
+
+        bundle.Bundle().save(self._path)
+
+        self.assertEqual(0o666 & ~mask, os.stat(self._path).st_mode & 0o777)
+
+    def test_missing(self) -> None:
+        """Raise a clear error if a target isn't in the bundle."""
+        with self.assertRaises(error_classes.MissingBundleEntry):
+            bundle.Bundle().get(_KEY)
+
+    def test_version(self) -> None:
+        """Refuse to read a bundle from an incompatible version."""
+        with gzip.open(self._path, "wt", encoding="utf-8") as handler:
+            json.dump({"format": "sphinx-code-include-bundle", "version": 0}, handler)
+
+        with self.assertRaises(EnvironmentError):
+            bundle.Bundle.load(self._path)
+
+
+class Modes(_Common):
+    """Check the "record" and "offline" modes."""
+
+    def tearDown(self) -> None:
+        """Forget the bundle which was loaded by a test."""
+        source_code.clear_caches()
+
+        super(Modes, self).tearDown()
+
+    def test_command_line(self) -> None:
+        """Let the user choose a mode and path with ``sphinx-build -D``."""
+        application = common.make_configured_application(
+            {
+                "code_include_bundle_mode": bundle.OFFLINE,
+                "code_include_bundle_path": "bundle.json.gz",
+            }
+        )
+        application.confdir = self._directory
+
+        self.assertEqual(bundle.OFFLINE, bundle.get_mode(application))
+        self.assertEqual(
+            os.path.join(self._directory, "bundle.json.gz"),
+            bundle.get_path(application),
+        )
+
+    def test_record(self) -> None:
+        """Write every recorded result once the build finishes."""
+        application = self._make_application(bundle.RECORD)
+        application.env = mock.MagicMock(spec=[])
+        bundle.record(application.env, "index", _KEY, _RESULT)
+        bundle.record(application.env, "other", _KEY, _RESULT)
+        bundle.purge_document(application, application.env, "other")
+
+        bundle.write(application, None)
+
+        self.assertEqual(_RESULT, bundle.Bundle.load(self._path).get(_KEY))
+
+    @mock.patch("code_include.source_code._get_source_code_from_inventory")
+    @mock.patch("code_include.source_code._get_source_code_from_object")
+    def test_offline(
+        self,
+        _get_source_code_from_object: mock.MagicMock,
+        _get_source_code_from_inventory: mock.MagicMock,
+    ) -> None:
+        """Serve every target from the bundle, without importing or downloading."""
+        recorded = bundle.Bundle()
+        recorded.add(_KEY, _RESULT)
+        recorded.save(self._path)
+
+        with mock.patch(
+            "code_include.source_code.APPLICATION",
+            self._make_application(bundle.OFFLINE),
+        ):
+            result = source_code.get_source_code(*_KEY)
+
+            with self.assertRaises(error_classes.MissingBundleEntry):
+                source_code.get_source_code("py:function", "foo.missing", True)
+
+        self.assertEqual(_RESULT.code, typing.cast(str, result.code))
+        self.assertFalse(_get_source_code_from_object.called)
+        self.assertFalse(_get_source_code_from_inventory.called)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that identical code-includes are resolved once per-build."""
+
+import types
+import typing
+import unittest
+from unittest import mock
+
+from docutils import nodes
+
+from code_include import bundle
+from code_include import dedupe
+from code_include import records
+from code_include import source_code
+from code_include import state
+
+from .. import common
+
+
+class Store(unittest.TestCase):
+    """Check the thread-safe store of finished code-includes."""
+
+    def test_add(self) -> None:
+        """Keep the first entry of a key and count every re-use."""
+        store = dedupe.Store()
+        key = ("py:function", "foo.bar", True, True)
+        first = dedupe.Entry(mock.MagicMock(), "first")
+
+        self.assertIsNone(store.get(key))
+        self.assertIs(first, store.add(key, first))
+        self.assertIs(first, store.add(key, dedupe.Entry(mock.MagicMock(), "other")))
+        self.assertIs(first, store.get(key))
+        self.assertEqual((1, 1), (len(store), store.saved))
+
+        store.clear()
+
+        self.assertNotIn(key, store)
+        self.assertEqual(0, store.saved)
+
+
+class Directive(unittest.TestCase):
+    """Check that identical directives of different documents share one result."""
+
+    def _get_node(
+        self,
+        document: str,
+        unindent: bool,
+        options: typing.Optional[dict[str, object]] = None,
+    ) -> nodes.literal_block:
+        """Run a code-include directive in ``document`` and get its code-block."""
+        directive = common.make_mock_directive([":func:`foo.bar`"], options=options)
+        directive.state.document.settings.env = types.SimpleNamespace(
+            app=None, docname=document, note_dependency=mock.MagicMock()
+        )
+
+        with mock.patch.object(directive, "_needs_unindent", return_value=unindent):
+            (node,) = directive.run()
+
+        self.assertIsInstance(node, nodes.literal_block)
+
+        return typing.cast(nodes.literal_block, node)
+
+    def _run(self, document: str, unindent: bool) -> str:
+        """Run a code-include directive in ``document`` and get its text."""
+        return self._get_node(document, unindent).astext()
+
+    @mock.patch("code_include.records.make")
+    @mock.patch("code_include.formatter.unindent_outer_whitespace")
+    @mock.patch("code_include.source_code.get_source_code")
+    def test_reuse(
+        self,
+        get_source_code: mock.MagicMock,
+        unindent_outer_whitespace: mock.MagicMock,
+        make: mock.MagicMock,
+    ) -> None:
+        """Resolve and unindent identical directives once."""
+        application = common.make_configured_application()
+        get_source_code.return_value = source_code.SourceResult(
+            "    def bar():\n        pass", "foo.bar", "", ""
+        )
+        unindent_outer_whitespace.return_value = "def bar():\n    pass"
+        make.return_value = records.Record(
+            bundle.Result("", "foo.bar", "", ""), "", None
+        )
+
+        with mock.patch("code_include.source_code.APPLICATION", application):
+            self.addCleanup(state.get(application).clear)
+
+            self.assertEqual("def bar():\n    pass", self._run("first", True))
+            self.assertEqual("def bar():\n    pass", self._run("second", True))
+            self.assertEqual("    def bar():\n        pass", self._run("third", False))
+
+        get_source_code.assert_has_calls(
+            [
+                mock.call("py:function", "foo.bar", prefer_import=True),
+                mock.call("py:function", "foo.bar", prefer_import=True),
+            ]
+        )
+        self.assertEqual(2, get_source_code.call_count)
+        unindent_outer_whitespace.assert_called_once()
+        self.assertEqual(1, state.get(application).includes.saved)
+
+    @mock.patch("code_include.source_code.get_source_code")
+    def test_language(self, get_source_code: mock.MagicMock) -> None:
+        """Re-use the code of an include whose language differs, but not its language."""
+        application = common.make_configured_application()
+        get_source_code.return_value = source_code.SourceResult(
+            "def bar():\n    pass", "foo.bar", "", ""
+        )
+
+        with mock.patch("code_include.source_code.APPLICATION", application):
+            self.addCleanup(state.get(application).clear)
+
+            first = self._get_node("first", True)
+            second = self._get_node("second", True, options={"language": "text"})
+
+        get_source_code.assert_called_once()
+        self.assertEqual(first.astext(), second.astext())
+        self.assertEqual(("python", "text"), (first["language"], second["language"]))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that deferred code-includes are resolved once per-document."""
+
+import typing
+import unittest
+from unittest import mock
+
+from docutils import frontend
+from docutils import nodes
+from docutils import utils
+from docutils.parsers import rst
+
+from code_include import error_classes
+from code_include import extension
+from code_include import report
+from code_include import source_code
+
+from .. import common
+
+
+class Deferred(unittest.TestCase):
+    """Check the placeholders of ``code_include_deferred`` and their transform."""
+
+    def setUp(self) -> None:
+        """Enable deferred code-includes and make an empty document."""
+        application = common.make_configured_application(
+            settings={
+                "code_include_deferred": True,
+                "code_include_prefetch_workers": 2,
+            }
+        )
+        patcher = mock.patch("code_include.source_code.APPLICATION", application)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self._env = mock.MagicMock(spec=["app", "docname", "note_dependency"])
+        self._env.app = application
+        self._env.docname = "index"
+        settings = frontend.get_default_settings(rst.Parser)
+        settings.env = self._env
+        self._document = utils.new_document("index", settings)
+
+    def _add(self, content: str, options: dict[str, object]) -> nodes.pending:
+        """Add a placeholder for ``content`` to the document."""
+        directive = common.make_mock_directive([content], options=options)
+        directive.state.document.settings.env = self._env
+        (node,) = directive.run()
+        self._document.append(node)
+
+        return typing.cast(nodes.pending, node)
+
+    @mock.patch("code_include.prefetch.prefetch_targets")
+    @mock.patch("code_include.source_code.get_source_code")
+    def test_batch(
+        self,
+        get_source_code: mock.MagicMock,
+        prefetch_targets: mock.MagicMock,
+    ) -> None:
+        """Find identical targets once and replace every placeholder."""
+        links: dict[str, object] = {
+            "link-to-source": None,
+            "link-to-documentation": None,
+        }
+        get_source_code.side_effect = lambda _, namespace, **__: (
+            source_code.SourceResult(
+                "def {}():\n    pass\n".format(namespace.split(".")[-1]),
+                namespace,
+                "",
+                "",
+            )
+        )
+        first = self._add(":func:`foo.get_value`", {})
+        self._add(":func:`foo.get_value`", {})
+        self._add(":func:`foo.get_other`", links)
+
+        transform = extension._ResolveIncludes(  # pylint: disable=protected-access
+            self._document, startnode=first
+        )
+        transform.apply()
+        transform.apply()
+
+        self.assertEqual(
+            [
+                "def get_value():\n    pass",
+                "def get_value():\n    pass",
+                "def get_other():\n    pass",
+            ],
+            [node.astext() for node in self._document.findall(nodes.literal_block)],
+        )
+        self.assertEqual([], list(self._document.findall(nodes.pending)))
+        self.assertCountEqual(
+            [
+                mock.call("py:function", "foo.get_value", prefer_import=True),
+                mock.call("py:function", "foo.get_other", prefer_import=False),
+            ],
+            get_source_code.call_args_list,
+        )
+        prefetch_targets.assert_called_once()
+
+    @mock.patch("code_include.prefetch.prefetch_targets")
+    @mock.patch("code_include.source_code.get_source_code")
+    def test_missing(
+        self,
+        get_source_code: mock.MagicMock,
+        _: mock.MagicMock,
+    ) -> None:
+        """Use the fallback text of a missing target or remove its placeholder."""
+        get_source_code.side_effect = error_classes.NoMatchFound("foo.missing")
+        first = self._add(":func:`foo.missing`", {"fallback-text": "Nothing"})
+        self._add(":func:`foo.missing`", {})
+
+        extension._ResolveIncludes(  # pylint: disable=protected-access
+            self._document, startnode=first
+        ).apply()
+
+        self.assertEqual(
+            ["Nothing"], [node.astext() for node in self._document.children]
+        )
+
+    @mock.patch("code_include.prefetch.prefetch_targets")
+    @mock.patch("code_include.source_code.get_source_code")
+    def test_report(
+        self,
+        get_source_code: mock.MagicMock,
+        _: mock.MagicMock,
+    ) -> None:
+        """Measure the time that a deferred target took in its worker thread."""
+
+        def _get_source_code(
+            _: str, namespace: str, **__: object
+        ) -> source_code.SourceResult:
+            with report.phase(report.FETCH):
+                report.note_transfer(10)
+                report.note_strategy(source_code.INVENTORY)
+
+            return source_code.SourceResult("def bar():\n", namespace, "", "")
+
+        get_source_code.side_effect = _get_source_code
+        self._env.app.confdir = "/"
+        self._env.app.config.code_include_report_path = "report.json"
+        first = self._add(":func:`foo.bar`", {})
+        self._add(":func:`foo.bar`", {})
+
+        extension._ResolveIncludes(  # pylint: disable=protected-access
+            self._document, startnode=first
+        ).apply()
+
+        includes = report._get_includes(self._env)  # pylint: disable=protected-access
+        found, duplicate = includes["index"]
+
+        self.assertEqual(("index", "foo.bar"), (found.document, found.namespace))
+        self.assertEqual(source_code.INVENTORY, found.strategy)
+        self.assertEqual(10, found.bytes)
+        self.assertGreater(found.phases[report.FETCH], 0.0)
+        self.assertGreaterEqual(found.seconds, found.phases[report.FETCH])
+        self.assertEqual(0, duplicate.bytes)
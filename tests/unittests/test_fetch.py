@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that remote viewcode pages are downloaded and cached correctly."""
+
+import gzip
+import http.server
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import typing
+import unittest
+from unittest import mock
+from urllib import error as urllib_error
+from urllib import request as urllib_request
+
+from code_include import error_classes
+from code_include import fetch
+from code_include import report
+from code_include import source_code
+
+_PAGE = b"<html><body><div id='foo'>def foo(): pass</div></body></html>"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serve :data:`_PAGE` and respect the "If-None-Match" header."""
+
+    connections = 0
+    delay = 0.0
+    drop_connections = False
+    etag = '"abc"'
+    failures = 0
+    protocol_version = "HTTP/1.1"
+    requests: list[dict[str, str]] = []
+    status = 200
+
+    def setup(self) -> None:
+        """Count each new connection."""
+        super(_Handler, self).setup()
+
+        _Handler.connections += 1
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Send back the page or a "304 Not Modified" response."""
+        self.requests.append(dict(self.headers))
+        time.sleep(self.delay)
+
+        if _Handler.failures or self.status != 200:
+            _Handler.failures = max(0, _Handler.failures - 1)
+            self.send_response(503 if self.status == 200 else self.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+            return
+
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+
+            return
+
+        body = _PAGE
+
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+
+        if body != _PAGE:
+            self.send_header("Content-Encoding", "gzip")
+
+        self.end_headers()
+        self.wfile.write(body)
+
+        if self.drop_connections:
+            # Close the connection without telling the client, like a
+            # server that hit its keep-alive timeout would.
+            #
+            self.close_connection = True
+
+    def log_message(self, *args: typing.Any) -> None:
+        """Don't print anything while the tests run."""
+
+
+class _Common(unittest.TestCase):
+    """Start a local HTTP server so that no test needs the internet."""
+
+    def setUp(self) -> None:
+        """Start the server and make a temporary cache directory."""
+        _Handler.connections = 0
+        _Handler.delay = 0.0
+        _Handler.drop_connections = False
+        _Handler.failures = 0
+        _Handler.requests = []
+        _Handler.status = 200
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.01},
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        self._directory = tempfile.mkdtemp(suffix="_code_include_fetch")
+        self._url = "http://127.0.0.1:{port}/_modules/foo.html".format(
+            port=self._server.server_address[1]
+        )
+
+    def _make_fetcher(self, **kwargs: typing.Any) -> fetch.Fetcher:
+        """fetch.Fetcher: Create a fetcher which is closed once the test exits."""
+        fetcher = fetch.Fetcher(**kwargs)
+        self.addCleanup(fetcher.close)
+
+        return fetcher
+
+    def tearDown(self) -> None:
+        """Stop the server and delete any cached pages."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        shutil.rmtree(self._directory)
+
+
+class Fetcher(_Common):
+    """Check that :class:`code_include.fetch.Fetcher` re-validates pages."""
+
+    def test_no_cache(self) -> None:
+        """Download a page each time if there is no cache."""
+        fetcher = self._make_fetcher()
+
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertEqual(2, len(_Handler.requests))
+
+    def test_other_scheme(self) -> None:
+        """Read non-HTTP URLs with the same read timeout as web pages."""
+        path = os.path.join(self._directory, "foo.html")
+
+        with open(path, "wb") as handler:
+            handler.write(_PAGE)
+
+        fetcher = self._make_fetcher(pool=fetch.ConnectionPool(read_timeout=5))
+
+        with mock.patch(
+            "code_include.fetch.urllib_request.urlopen",
+            wraps=urllib_request.urlopen,
+        ) as urlopen:
+            self.assertEqual(_PAGE, fetcher.fetch("file://" + path))
+
+        urlopen.assert_called_once_with("file://" + path, timeout=5)
+
+    def test_not_modified(self) -> None:
+        """Send the stored ETag so that an unchanged page returns "304 Not Modified"."""
+        fetcher = self._make_fetcher(cache=fetch.DiskCache(self._directory))
+
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertEqual(2, len(_Handler.requests))
+        self.assertNotIn("If-None-Match", _Handler.requests[0])
+        self.assertEqual('"abc"', _Handler.requests[1]["If-None-Match"])
+
+    def test_max_age(self) -> None:
+        """Don't send any request if the stored page is still fresh."""
+        fetcher = self._make_fetcher(
+            cache=fetch.DiskCache(self._directory), options=fetch.Options(max_age=60)
+        )
+
+        fetcher.fetch(self._url)
+
+        # A new fetcher re-uses the same directory, like a new build would
+        fetcher = self._make_fetcher(
+            cache=fetch.DiskCache(self._directory), options=fetch.Options(max_age=60)
+        )
+
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertEqual(1, len(_Handler.requests))
+
+    def test_report(self) -> None:
+        """Time each request and count its bytes, for the build's report."""
+        hosts = report.Hosts()
+        fetcher = self._make_fetcher(hosts=hosts)
+        include = report.Include("index", "py:function", "foo.foo")
+
+        with report.measure(include):
+            fetcher.fetch(self._url)
+
+        fetcher.fetch(self._url)
+        found = hosts.to_dict()["127.0.0.1:{}".format(self._server.server_address[1])]
+
+        self.assertEqual(2, found["requests"])
+        self.assertEqual(2, sum(found["histogram"].values()))
+        self.assertEqual(len(_PAGE), include.bytes)
+
+
+class ConnectionPool(_Common):
+    """Check that :class:`code_include.fetch.ConnectionPool` re-uses connections."""
+
+    def test_keep_alive(self) -> None:
+        """Send many requests over a single connection."""
+        pool = fetch.ConnectionPool()
+
+        for _ in range(5):
+            self.assertEqual(_PAGE, pool.request(self._url, {}).body)
+
+        pool.close()
+
+        self.assertEqual(1, pool.connections)
+        self.assertEqual(5, pool.requests)
+        self.assertEqual(1, _Handler.connections)
+
+    def test_compressed(self) -> None:
+        """Ask for compressed responses and decompress them."""
+        pool = fetch.ConnectionPool()
+        response = pool.request(self._url, {})
+        pool.close()
+
+        self.assertEqual("gzip", response.headers["content-encoding"])
+        self.assertEqual(_PAGE, response.body)
+        self.assertIn("gzip", _Handler.requests[0]["Accept-Encoding"])
+
+    def test_closed_by_server(self) -> None:
+        """Open a new connection if the server closed an idle one."""
+        _Handler.drop_connections = True
+        pool = fetch.ConnectionPool()
+
+        self.assertEqual(_PAGE, pool.request(self._url, {}).body)
+        self.assertEqual(_PAGE, pool.request(self._url, {}).body)
+        pool.close()
+
+        self.assertEqual(2, _Handler.connections)
+
+
+class DiskCache(_Common):
+    """Check that :class:`code_include.fetch.DiskCache` stays under its size limit."""
+
+    def test_eviction(self) -> None:
+        """Delete the least-recently-used page once the cache is full."""
+        urls = [self._url + "?page={index}".format(index=index) for index in range(3)]
+        self._make_fetcher(cache=fetch.DiskCache(self._directory)).fetch(urls[0])
+        # Both the page and its metadata count towards the limit. The
+        # metadata's fetch time may be a few bytes longer, for other pages.
+        #
+        size = sum(
+            os.path.getsize(os.path.join(self._directory, name))
+            for name in os.listdir(self._directory)
+        )
+        cache = fetch.DiskCache(self._directory, max_size=size * 2 + 32)
+        fetcher = self._make_fetcher(cache=cache)
+
+        for url in urls[1:]:
+            fetcher.fetch(url)
+
+        self.assertIsNone(cache.get(urls[0]))
+        self.assertIsNotNone(cache.get(urls[1]))
+        self.assertIsNotNone(cache.get(urls[2]))
+        self.assertEqual(4, len(os.listdir(self._directory)))
+
+
+class Resilience(_Common):
+    """Check timeouts, retries, and the circuit breaker."""
+
+    def test_retry(self) -> None:
+        """Re-send a request which failed for a temporary reason."""
+        _Handler.failures = 2
+        fetcher = self._make_fetcher(
+            options=fetch.Options(retry=fetch.RetryPolicy(retries=2, backoff=0))
+        )
+
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertEqual(3, len(_Handler.requests))
+
+    def test_retry_exhausted(self) -> None:
+        """Stop re-sending once every retry is used up."""
+        _Handler.failures = 5
+        fetcher = self._make_fetcher(
+            options=fetch.Options(retry=fetch.RetryPolicy(retries=1, backoff=0))
+        )
+
+        with self.assertRaises(urllib_error.HTTPError):
+            fetcher.fetch(self._url)
+
+        self.assertEqual(2, len(_Handler.requests))
+
+    def test_read_timeout(self) -> None:
+        """Give up on a server which takes too long to respond."""
+        _Handler.delay = 0.5
+        fetcher = self._make_fetcher(
+            pool=fetch.ConnectionPool(read_timeout=0.05),
+            options=fetch.Options(retry=fetch.RetryPolicy(retries=0)),
+        )
+
+        with self.assertRaises(socket.timeout):
+            fetcher.fetch(self._url)
+
+    def test_circuit_breaker(self) -> None:
+        """Fail immediately once a host has failed too many times."""
+        with socket.socket() as handler:
+            # Find a port that nothing is listening on
+            handler.bind(("127.0.0.1", 0))
+            port = handler.getsockname()[1]
+
+        url = "http://127.0.0.1:{port}/_modules/foo.html".format(port=port)
+        pool = fetch.ConnectionPool(connect_timeout=0.5)
+        fetcher = self._make_fetcher(
+            pool=pool,
+            options=fetch.Options(retry=fetch.RetryPolicy(retries=0), threshold=2),
+        )
+
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                fetcher.fetch(url)
+
+        with mock.patch.object(pool, "request") as request:
+            with self.assertRaises(error_classes.NotFoundUrl):
+                fetcher.fetch(url)
+
+            self.assertFalse(request.called)
+
+    def test_stale(self) -> None:
+        """Use the stored page while its server is temporarily unavailable."""
+        cache = fetch.DiskCache(self._directory)
+        fetcher = self._make_fetcher(
+            cache=cache,
+            options=fetch.Options(retry=fetch.RetryPolicy(retries=0)),
+        )
+        fetcher.fetch(self._url)
+        _Handler.failures = 1
+
+        self.assertEqual(_PAGE, fetcher.fetch(self._url))
+        self.assertIsNotNone(cache.get(self._url))
+
+    def test_removed(self) -> None:
+        """Delete the stored page once the server says that it's gone."""
+        cache = fetch.DiskCache(self._directory)
+        fetcher = self._make_fetcher(cache=cache)
+        fetcher.fetch(self._url)
+        _Handler.status = 404
+
+        with self.assertRaises(urllib_error.HTTPError):
+            fetcher.fetch(self._url)
+
+        self.assertIsNone(cache.get(self._url))
+        self.assertEqual([], os.listdir(self._directory))
+
+    def test_circuit_breaker_reset(self) -> None:
+        """Allow a request again once the breaker's reset time has passed."""
+        breaker = fetch.CircuitBreaker(threshold=1, reset_after=0.0)
+        breaker.record_failure("foo")
+
+        self.assertTrue(breaker.allow("foo"))
+
+        breaker = fetch.CircuitBreaker(threshold=1, reset_after=60.0)
+        breaker.record_failure("foo")
+
+        self.assertFalse(breaker.allow("foo"))
+        self.assertTrue(breaker.allow("bar"))
+
+    @mock.patch("code_include.source_code._get_source_code_from_object")
+    @mock.patch("code_include.source_code._get_source_code_from_inventory")
+    def test_fallback_to_import(
+        self,
+        _get_source_code_from_inventory: mock.MagicMock,
+        _get_source_code_from_object: mock.MagicMock,
+    ) -> None:
+        """Try a Python import if the intersphinx website is unreachable."""
+        expected = source_code.SourceResult("def foo(): pass", "foo", "", "")
+        _get_source_code_from_inventory.side_effect = error_classes.NotFoundUrl("foo")
+        _get_source_code_from_object.return_value = expected
+
+        self.assertEqual(expected, source_code.get_source_code("py:function", "foo"))
+
+        _get_source_code_from_object.return_value = None
+
+        with self.assertRaises(error_classes.NotFoundUrl):
+            source_code.get_source_code("py:function", "foo")
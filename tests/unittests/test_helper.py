@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that the shared caches are bounded, thread-safe, and count their use."""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from code_include import helper
+
+
+class Cache(unittest.TestCase):
+    """Check the limits, invalidation, and single-flight of :class:`helper.Cache`."""
+
+    def test_max_size(self) -> None:
+        """Remove the least-recently-used value once the cache is full."""
+        cache = helper.Cache(max_size=2)
+        cache.set("first", 1)
+        cache.set("second", 2)
+        cache.get("first")
+        cache.set("third", 3)
+
+        self.assertIn("first", cache)
+        self.assertNotIn("second", cache)
+        self.assertEqual((1, 0, 1), (cache.hits, cache.misses, cache.evictions))
+
+    def test_ttl(self) -> None:
+        """Create a value again once it expires."""
+        cache = helper.Cache(ttl=10.0)
+        factory = mock.MagicMock(side_effect=[1, 2])
+
+        with mock.patch("time.monotonic", return_value=0.0):
+            self.assertEqual(1, cache.get_or_create("key", factory))
+
+        with mock.patch("time.monotonic", return_value=5.0):
+            self.assertEqual(1, cache.get_or_create("key", factory))
+
+        with mock.patch("time.monotonic", return_value=20.0):
+            self.assertEqual(2, cache.get_or_create("key", factory))
+
+        self.assertEqual((1, 2, 1), (cache.hits, cache.misses, cache.evictions))
+
+    def test_invalidate(self) -> None:
+        """Create a value again once it's invalidated or no longer valid."""
+        cache = helper.Cache()
+        factory = mock.MagicMock(side_effect=[1, 2, 3])
+
+        cache.get_or_create("key", factory)
+        self.assertTrue(cache.invalidate("key"))
+        self.assertFalse(cache.invalidate("key"))
+        self.assertEqual(2, cache.get_or_create("key", factory))
+        self.assertEqual(
+            3, cache.get_or_create("key", factory, is_valid=lambda value: value > 2)
+        )
+
+        cache.clear()
+
+        self.assertEqual(
+            (0, 0, 0, 0), (len(cache), cache.hits, cache.misses, cache.evictions)
+        )
+
+    def test_single_flight(self) -> None:
+        """Create a missing value once, even if many threads need it at once."""
+
+        def _create() -> str:
+            time.sleep(0.1)
+
+            return "value"
+
+        cache = helper.Cache()
+        factory = mock.MagicMock(side_effect=_create)
+        found = []
+
+        def _get() -> None:
+            found.append(cache.get_or_create("key", factory))
+
+        threads = [threading.Thread(target=_get) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(["value"] * 8, found)
+        factory.assert_called_once()
+        self.assertEqual((7, 1), (cache.hits, cache.misses))
+
+    def test_error(self) -> None:
+        """Never store a value whose factory failed."""
+        cache = helper.Cache()
+
+        with self.assertRaises(ValueError):
+            cache.get_or_create("key", mock.MagicMock(side_effect=ValueError))
+
+        self.assertNotIn("key", cache)
+        self.assertEqual("value", cache.get_or_create("key", lambda: "value"))
+
+
+class DiskStore(unittest.TestCase):
+    """Check that :class:`helper.DiskStore` keeps every file of an entry together."""
+
+    def setUp(self) -> None:
+        """Make a directory to store entries in."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_helper")
+
+    def tearDown(self) -> None:
+        """Delete the directory."""
+        shutil.rmtree(self._directory)
+
+    def test_evict(self) -> None:
+        """Count, find, and delete every file of an entry at once."""
+        store = helper.DiskStore(self._directory, (".a", ".b"), max_size=8)
+
+        self.assertTrue(store.write("first", {".a": b"12", ".b": b"12"}))
+        self.assertTrue(store.write("second", {".a": b"12", ".b": b"12"}))
+        self.assertFalse(store.write("huge", {".a": b"12345", ".b": b"12345"}))
+        store.update("first", ".b", b"34")
+        self.assertEqual({".a": b"12", ".b": b"34"}, store.read("first"))
+        self.assertTrue(store.write("third", {".a": b"12", ".b": b"12"}))
+
+        self.assertIsNone(store.read("second"))
+        self.assertIsNotNone(store.read("third"))
+        self.assertEqual(4, len(os.listdir(self._directory)))
+
+        store.remove("first")
+
+        self.assertIsNone(store.read("first"))
+        self.assertEqual(2, len(os.listdir(self._directory)))
+
+    def test_running_size(self) -> None:
+        """List the directory once and keep counting the size of entries in memory."""
+        helper.DiskStore(self._directory, (".a",), max_size=4).write(
+            "first", {".a": b"12"}
+        )
+        store = helper.DiskStore(self._directory, (".a",), max_size=4)
+
+        with mock.patch("os.listdir", wraps=os.listdir) as listdir:
+            store.write("second", {".a": b"12"})
+            store.write("second", {".a": b"12"})
+            store.write("third", {".a": b"12"})
+
+        self.assertEqual(1, listdir.call_count)
+        self.assertIsNone(store.read("first"))
+        self.assertIsNotNone(store.read("second"))
+        self.assertIsNotNone(store.read("third"))
+
+
+class Memoize(unittest.TestCase):
+    """Check that :func:`helper.memoize` calls its function once per arguments."""
+
+    def test_memoize(self) -> None:
+        """Call the function once per unique arguments, with or without limits."""
+        function = mock.MagicMock(side_effect=lambda value: value * 2)
+        function.__name__ = "function"
+        unbounded = helper.memoize(function)
+        bounded = helper.memoize(max_size=1)(function)
+
+        self.assertEqual([2, 2, 4], [unbounded(1), unbounded(1), unbounded(2)])
+        self.assertEqual([2, 4, 2], [bounded(1), bounded(2), bounded(1)])
+        self.assertEqual(5, function.call_count)
+        self.assertEqual(2, bounded.cache.evictions)
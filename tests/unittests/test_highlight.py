@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that the highlighted markup of code-includes is re-used."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pygments  # type: ignore
+from docutils import nodes
+from sphinx import highlighting
+
+from code_include import highlight
+
+from .. import common
+
+
+class Highlighter(unittest.TestCase):
+    """Check that code-include markup is stored and re-used between builds."""
+
+    def setUp(self) -> None:
+        """Make a directory to store markup in."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_highlight")
+
+    def tearDown(self) -> None:
+        """Delete the directory."""
+        shutil.rmtree(self._directory)
+
+    def _make_highlighter(self) -> highlight.Highlighter:
+        """Wrap a real Sphinx highlighter, as if it was a new build."""
+        return highlight.Highlighter(
+            highlighting.PygmentsBridge("html"), highlight.Cache(self._directory)
+        )
+
+    @staticmethod
+    def _make_node(code: str) -> nodes.literal_block:
+        """Make a code-include node of ``code``."""
+        node = nodes.literal_block(code, code)
+        highlight.mark(node)
+
+        return node
+
+    def test_reuse(self) -> None:
+        """Highlight code-includes once, even in later builds."""
+        node = self._make_node("def foo():\n    pass")
+        expected = highlighting.PygmentsBridge("html").highlight_block(
+            node.rawsource, "python"
+        )
+
+        with mock.patch(
+            "sphinx.highlighting.highlight", wraps=pygments.highlight
+        ) as highlight_:
+            self.assertEqual(
+                expected,
+                self._make_highlighter().highlight_block(
+                    node.rawsource, "python", location=node
+                ),
+            )
+            highlighter = self._make_highlighter()
+            self.assertEqual(
+                expected,
+                highlighter.highlight_block(node.rawsource, "python", location=node),
+            )
+            highlighter.highlight_block(
+                node.rawsource, "python", location=node, linenos=True
+            )
+
+        self.assertEqual(2, highlight_.call_count)
+        self.assertEqual((1, 1), (highlighter.hits, highlighter.misses))
+
+    def test_other(self) -> None:
+        """Highlight any other code normally."""
+        highlighter = self._make_highlighter()
+        code = "def foo():\n    pass"
+
+        highlighter.highlight_block(code, "python", location=nodes.literal_block())
+        highlighter.highlight_block(code, "python")
+
+        self.assertEqual([], os.listdir(self._directory))
+        self.assertEqual((0, 0), (highlighter.hits, highlighter.misses))
+
+    def test_warnings(self) -> None:
+        """Highlight code which Sphinx warns about again, so that it always warns."""
+        node = self._make_node("def foo():\n    pass")
+
+        for _ in range(2):
+            with self.assertLogs("sphinx.sphinx.highlighting", "WARNING"):
+                self._make_highlighter().highlight_block(
+                    node.rawsource, "not_a_language", location=node
+                )
+
+        self.assertEqual([], os.listdir(self._directory))
+
+    def test_evict(self) -> None:
+        """Delete the least-recently-used markup once the cache is full."""
+        cache = highlight.Cache(self._directory, max_size=10)
+        cache.write("first", "12345")
+        cache.write("second", "12345")
+        cache.read("first")
+        cache.write("third", "12345")
+
+        self.assertEqual("12345", cache.read("first"))
+        self.assertIsNone(cache.read("second"))
+        self.assertEqual("12345", cache.read("third"))
+
+
+class Settings(unittest.TestCase):
+    """Check that the highlight cache's settings are real Sphinx settings."""
+
+    def test_default(self) -> None:
+        """Store markup in the doctree directory, by default."""
+        application = common.make_configured_application({})
+        application.doctreedir = "/doctrees"
+
+        self.assertEqual(
+            os.path.join("/doctrees", "code_include_highlight"),
+            highlight.get_directory(application),
+        )
+
+    def test_override(self) -> None:
+        """Let users move or turn off the cache from the command-line."""
+        application = common.make_configured_application(
+            {"code_include_cache_directory": "/cache"}
+        )
+
+        self.assertEqual(
+            os.path.join("/cache", "highlight"), highlight.get_directory(application)
+        )
+
+        application = common.make_configured_application(
+            {"code_include_highlight_cache_size": "0"}
+        )
+
+        self.assertEqual("", highlight.get_directory(application))
+
+    def test_dark(self) -> None:
+        """Wrap the builder's dark-mode highlighter, too."""
+        application = common.make_configured_application({})
+        application.doctreedir = "/doctrees"
+        application.builder.highlighter = highlighting.PygmentsBridge("html")
+        application.builder.dark_highlighter = highlighting.PygmentsBridge(
+            "html", "monokai"
+        )
+
+        highlight.install(application)
+
+        self.assertIsInstance(application.builder.highlighter, highlight.Highlighter)
+        self.assertIsInstance(
+            application.builder.dark_highlighter, highlight.Highlighter
+        )
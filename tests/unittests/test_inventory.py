@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that the intersphinx inventory is searched correctly."""
+
+import unittest
+from unittest import mock
+
+from code_include import error_classes
+from code_include import inventory
+from code_include import source_code
+
+_INVENTORY: inventory.Inventory = {
+    "py:module": {
+        "foo": ("foo", "", "api.html#module-foo", "-"),
+        "foo.bar": ("foo", "", "api.html#module-foo.bar", "-"),
+    },
+    "py:class": {
+        "foo.bar.Parent": ("foo", "", "api.html#foo.bar.Parent", "-"),
+        "foo.bar.Parent.Nested": ("foo", "", "api.html#foo.bar.Parent.Nested", "-"),
+    },
+    "py:method": {
+        "foo.bar.Parent.Nested.get_value": (
+            "foo",
+            "",
+            "api.html#foo.bar.Parent.Nested.get_value",
+            "-",
+        ),
+    },
+    "py:data": {
+        "foo.bar.VALUE": ("foo", "", "api.html#foo.bar.VALUE", "-"),
+    },
+    "py:attribute": {
+        "foo.bar.Parent": ("foo", "", "api.html#attribute-foo.bar.Parent", "-"),
+    },
+    "std:label": {
+        "foo.bar.VALUE": ("foo", "", "api.html#label", "-"),
+    },
+}
+
+
+class NamespaceIndex(unittest.TestCase):
+    """Check :class:`code_include.inventory.NamespaceIndex`."""
+
+    def test_priority(self) -> None:
+        """Pick the same role for a namespace every time, using :data:`.ROLES`."""
+        index = inventory.NamespaceIndex(_INVENTORY)
+
+        self.assertEqual(
+            inventory.Entry("py:attribute", "api.html#attribute-foo.bar.Parent"),
+            index.get("foo.bar.Parent"),
+        )
+        self.assertEqual("py:data", index.get("foo.bar.VALUE").role)  # type: ignore
+        self.assertEqual("py:module", index.get("foo.bar").role)  # type: ignore
+        self.assertIsNone(index.get("foo.bar.does_not_exist"))
+        self.assertEqual(6, len(index))
+
+    def test_get_module(self) -> None:
+        """Find the longest documented module of a namespace."""
+        index = inventory.NamespaceIndex(_INVENTORY)
+
+        self.assertEqual("foo.bar", index.get_module("foo.bar.Parent.Nested.get_value"))
+        self.assertEqual("foo", index.get_module("foo.fizz"))
+        self.assertIsNone(index.get_module("fizz.buzz"))
+
+
+class RootIndex(unittest.TestCase):
+    """Check :class:`code_include.inventory.RootIndex`."""
+
+    def test_longest(self) -> None:
+        """Prefer the most nested root of a URI."""
+        index = inventory.RootIndex(
+            ["https://host/docs", "https://host/docs/v2/", "/tmp/project"]
+        )
+
+        self.assertEqual(
+            "https://host/docs/v2/", index.get("https://host/docs/v2/api.html")
+        )
+        self.assertEqual("https://host/docs", index.get("https://host/docs/api.html"))
+        self.assertEqual("/tmp/project", index.get("/tmp/project/api.html"))
+        self.assertEqual(3, len(index))
+
+    def test_boundary(self) -> None:
+        """Only match a root at the end of a folder name."""
+        index = inventory.RootIndex(["https://host/docs"])
+
+        self.assertEqual("", index.get("https://host/docs2/api.html"))
+        self.assertEqual("", index.get("https://host/do"))
+        self.assertEqual("https://host/docs", index.get("https://host/docs"))
+
+    def test_mapping(self) -> None:
+        """Read roots from every ``intersphinx_mapping`` syntax."""
+        application = mock.MagicMock()
+        application.config.intersphinx_mapping = {
+            "normalized": ("normalized", ("https://host/normalized", (None,))),
+            "raw": ("https://host/raw", None),
+            "https://host/old": None,
+        }
+
+        with mock.patch("code_include.source_code.APPLICATION", application):
+            roots = (
+                source_code._get_all_intersphinx_roots()  # pylint: disable=protected-access
+            )
+
+        self.assertEqual(
+            {"https://host/normalized", "https://host/raw", "https://host/old"}, roots
+        )
+
+
+class Suggestions(unittest.TestCase):
+    """Check that missing namespaces suggest similar, documented namespaces."""
+
+    def tearDown(self) -> None:
+        """Forget the last index."""
+        source_code.clear_caches()
+
+    def test_suggest(self) -> None:
+        """Find the closest namespaces first."""
+        index = inventory.SuggestionIndex(
+            ["foo.bar.Parent", "foo.bar.Parent.Nested", "foo.bar.VALUE", "fizz"]
+        )
+
+        self.assertEqual(
+            ["foo.bar.Parent", "foo.bar.Parent.Nested"],
+            index.suggest("foo.bar.Prent", count=2),
+        )
+        self.assertEqual([], index.suggest("zzzzzz"))
+
+    def test_reuse(self) -> None:
+        """Index each role once, no matter how many namespaces are missing."""
+        index = inventory.NamespaceIndex(_INVENTORY)
+
+        with mock.patch.object(
+            inventory.SuggestionIndex,
+            "__init__",
+            autospec=True,
+            side_effect=inventory.SuggestionIndex.__init__,
+        ) as initialize:
+            index.get_suggestions("foo.bar.Prent", role="py:class")
+            index.get_suggestions("foo.bar.Parent.Nestd", role="py:class")
+            index.get_suggestions("foo.bar.VALEU")
+
+        self.assertEqual(2, initialize.call_count)
+
+    def test_message(self) -> None:
+        """Include the suggestions in the error message."""
+        with self.assertRaisesRegex(
+            error_classes.MissingNamespace,
+            'Did you mean "foo.bar.Parent.Nested"',
+        ):
+            source_code._get_uri(  # pylint: disable=protected-access
+                "py:class",
+                "foo.bar.Parent.Nestd",
+                _INVENTORY,
+            )
+
+
+class GetUri(unittest.TestCase):
+    """Check how source code pages are found from the inventory."""
+
+    def tearDown(self) -> None:
+        """Forget the last index."""
+        source_code.clear_caches()
+
+    def test_obj(self) -> None:
+        """Find any role with :obj: and report the role that was found."""
+        entry = source_code._get_uri(  # pylint: disable=protected-access
+            "obj",
+            "foo.bar.Parent.Nested.get_value",
+            _INVENTORY,
+        )
+
+        self.assertEqual("py:method", entry.role)
+
+        with self.assertRaises(error_classes.MissingNamespace):
+            source_code._get_uri(  # pylint: disable=protected-access
+                "obj",
+                "foo.bar.does_not_exist",
+                _INVENTORY,
+            )
+
+    def test_explicit(self) -> None:
+        """Only check the role that the user asked for."""
+        entry = source_code._get_uri(  # pylint: disable=protected-access
+            "py:class",
+            "foo.bar.Parent",
+            _INVENTORY,
+        )
+
+        self.assertEqual(inventory.Entry("py:class", "api.html#foo.bar.Parent"), entry)
+
+        with self.assertRaises(error_classes.MissingTag):
+            source_code._get_uri(  # pylint: disable=protected-access
+                "py:decorator",
+                "foo.bar.Parent",
+                _INVENTORY,
+            )
+
+        with self.assertRaises(error_classes.MissingNamespace):
+            source_code._get_uri(  # pylint: disable=protected-access
+                "py:class",
+                "foo.bar.VALUE",
+                _INVENTORY,
+            )
+
+    def test_module_tag(self) -> None:
+        """Find the viewcode page and tag of nested members and whole modules."""
+        self.assertEqual(
+            ("_modules/foo/bar.html", "Parent.Nested.get_value"),
+            source_code._get_module_tag(  # pylint: disable=protected-access
+                "foo.bar.Parent.Nested.get_value",
+                "py:method",
+                module="foo.bar",
+            ),
+        )
+        self.assertEqual(
+            ("_modules/foo/bar.html", "Parent.get_value"),
+            source_code._get_module_tag(  # pylint: disable=protected-access
+                "foo.bar.Parent.get_value",
+                "py:classmethod",
+            ),
+        )
+        self.assertEqual(
+            ("_modules/foo/bar.html", ""),
+            source_code._get_module_tag(  # pylint: disable=protected-access
+                "module-foo.bar",
+                "py:module",
+            ),
+        )
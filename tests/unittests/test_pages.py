@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that viewcode pages are read and parsed only once."""
+
+import glob
+import io
+import os
+import typing
+import unittest
+from unittest import mock
+
+import bs4
+from bs4 import element
+
+from code_include import pages
+from code_include import source_code
+
+_CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+_BASIC_PAGE = os.path.join(
+    _CURRENT_DIRECTORY,
+    "fake_project",
+    "_modules",
+    "fake_project",
+    "basic.html",
+)
+
+
+def _read(path: str) -> str:
+    """str: Get the raw text of ``path``."""
+    with io.open(path, "r", encoding="utf-8") as handler:
+        return handler.read()
+
+
+def _get_div_text(soup: bs4.BeautifulSoup, tag: str) -> str:
+    """str: Get the text of the ``<div>`` whose id is ``tag``, using BeautifulSoup."""
+    return typing.cast(element.Tag, soup.find("div", {"id": tag})).get_text()
+
+
+class PageCache(unittest.TestCase):
+    """Check that :class:`code_include.pages.PageCache` reads each page once."""
+
+    def test_hits_and_misses(self) -> None:
+        """Read the same page for several tags and count the reads."""
+        cache = pages.PageCache()
+        reader = mock.MagicMock(side_effect=_read)
+
+        for tag in ["MyKlass", "MyKlass.get_method", "set_function_thing", ""]:
+            cache.get(_BASIC_PAGE, reader).get_text(tag)
+
+        self.assertEqual(1, reader.call_count)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(3, cache.hits)
+
+        cache.clear()
+
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(0, cache.misses)
+
+    def test_preprocessor_does_not_modify_the_page(self) -> None:
+        """Run a destructive pre-processor and make sure later lookups are unaffected."""
+
+        def _remove_everything(node: element.Tag) -> None:
+            for child in list(node.children):
+                child.extract()
+
+        cache = pages.PageCache()
+        page = cache.get(_BASIC_PAGE, _read)
+        original = page.get_text("set_function_thing")
+
+        self.assertEqual(
+            "", page.get_text("set_function_thing", preprocessor=_remove_everything)
+        )
+        self.assertEqual(original, page.get_text("set_function_thing"))
+
+    def test_preprocessor_tree(self) -> None:
+        """Give the pre-processor a node which is still part of its page."""
+        found = []
+
+        def _find_body(node: element.Tag) -> None:
+            found.append(node.find_parent("body"))
+
+        page = pages.PageCache().get(_BASIC_PAGE, _read)
+        page.get_text("set_function_thing", preprocessor=_find_body)
+
+        self.assertIsNotNone(found[0])
+
+    def test_preprocessor_parser(self) -> None:
+        """Give the pre-processor an "html.parser" tree unless the user chose a parser."""
+        parsers = []
+
+        def _get_parser(node: element.Tag) -> None:
+            soup = typing.cast(bs4.BeautifulSoup, list(node.parents)[-1])
+            parsers.append(soup.builder.NAME)
+
+        pages.Page(_read(_BASIC_PAGE)).get_text(
+            "set_function_thing", preprocessor=_get_parser
+        )
+
+        self.assertEqual([pages.HTML_PARSER], parsers)
+
+    def test_missing_tag(self) -> None:
+        """Raise an exception if a tag isn't on the page."""
+        page = pages.PageCache().get(_BASIC_PAGE, _read)
+
+        with self.assertRaises(RuntimeError):
+            page.get_text("does_not_exist")
+
+    @mock.patch("code_include.source_code._read_page")
+    def test_source_code(self, _read_page: mock.MagicMock) -> None:
+        """Make sure the directive-level function uses the shared cache."""
+        _read_page.side_effect = _read
+        pages.CACHE.clear()
+
+        source_code._get_source_code(  # pylint: disable=protected-access
+            _BASIC_PAGE, "MyKlass"
+        )
+        source_code._get_source_code(  # pylint: disable=protected-access
+            _BASIC_PAGE, "set_function_thing"
+        )
+
+        self.assertEqual(1, _read_page.call_count)
+        self.assertEqual(1, pages.CACHE.hits)
+
+
+class Extract(unittest.TestCase):
+    """Check that :func:`code_include.pages.extract` matches a full parse."""
+
+    def test_every_tag(self) -> None:
+        """Get every tag of every page and compare it with BeautifulSoup."""
+        for path in glob.glob(
+            os.path.join(_CURRENT_DIRECTORY, "fake_project", "**", "*.html"),
+            recursive=True,
+        ):
+            contents = _read(path)
+            soup = pages.parse(contents)
+            tags = [node["id"] for node in soup.find_all("div", {"id": True})]
+
+            for tag in tags:
+                with self.subTest(path=path, tag=tag):
+                    self.assertEqual(
+                        _get_div_text(soup, tag),
+                        pages.extract(contents, tag),
+                    )
+
+    def test_module(self) -> None:
+        """Get the whole module's source code."""
+        contents = _read(_BASIC_PAGE)
+        node = pages.parse(contents).find("span", {"class": "ch"})
+
+        self.assertIsInstance(node, bs4.Tag)
+        self.assertEqual(
+            node.parent.get_text().lstrip(),  # type: ignore
+            pages.extract(contents, ""),
+        )
+
+    def test_early_exit(self) -> None:
+        """Stop reading as soon as the tag closes, even if the rest is broken."""
+        contents = (
+            '<div id="foo"><pre>def foo():'
+            '<a class="viewcode-back" href="#">[docs]</a>\n    pass</pre></div>'
+            '<div id="bar"><span class="ch"'
+        )
+
+        self.assertEqual("def foo():\n    pass", pages.extract(contents, "foo"))
+
+        with self.assertRaises(RuntimeError):
+            pages.extract(contents, "does_not_exist")
+
+    @mock.patch("code_include.pages.PageIndex.build", wraps=pages.PageIndex.build)
+    @mock.patch("code_include.pages.extract", wraps=pages.extract)
+    def test_index_after_first_tag(
+        self,
+        extract: mock.MagicMock,
+        build: mock.MagicMock,
+    ) -> None:
+        """Stream the first tag and index the page once more tags are needed."""
+        page = pages.PageCache().get(_BASIC_PAGE, _read)
+
+        for tag in ["MyKlass", "MyKlass", "ParentClass", "set_function_thing", ""]:
+            page.get_text(tag)
+
+        self.assertEqual(1, extract.call_count)
+        self.assertEqual(1, build.call_count)
+
+    @mock.patch("code_include.pages.parse")
+    def test_no_tree(self, parse: mock.MagicMock) -> None:
+        """Only build a BeautifulSoup tree when a pre-processor needs one."""
+        page = pages.PageCache().get(_BASIC_PAGE, _read)
+        page.get_text("MyKlass")
+        page.get_text("")
+
+        self.assertFalse(parse.called)
+
+
+class PageIndex(unittest.TestCase):
+    """Check that :class:`code_include.pages.PageIndex` matches a full parse."""
+
+    def test_every_tag(self) -> None:
+        """Index every page and compare each tag with :func:`.extract`."""
+        for path in glob.glob(
+            os.path.join(_CURRENT_DIRECTORY, "fake_project", "**", "*.html"),
+            recursive=True,
+        ):
+            contents = _read(path)
+            index = pages.PageIndex.build(contents)
+            soup = pages.parse(contents)
+            tags = [node["id"] for node in soup.find_all("div", {"id": True})]
+
+            self.assertEqual(len(set(tags)), len(index))
+
+            for tag in tags + [""]:
+                with self.subTest(path=path, tag=tag):
+                    try:
+                        expected = pages.extract(contents, tag)
+                    except RuntimeError:
+                        self.assertNotIn(tag, index)
+
+                        continue
+
+                    self.assertEqual(expected, index.get(tag))
+
+
+class Parsers(unittest.TestCase):
+    """Check that every HTML parser finds the same source code."""
+
+    def tearDown(self) -> None:
+        """Forget any parser which was found while testing."""
+        pages.get_parser.cache_clear()
+
+    def test_every_parser(self) -> None:
+        """Compare each installed parser with BeautifulSoup's "html.parser" tree."""
+        for path in glob.glob(
+            os.path.join(
+                _CURRENT_DIRECTORY, "fake_project", "_modules", "**", "*.html"
+            ),
+            recursive=True,
+        ):
+            contents = _read(path)
+            soup = pages.parse(contents, parser=pages.HTML_PARSER)
+            tags = [node["id"] for node in soup.find_all("div", {"id": True})]
+
+            for parser in pages.PARSERS:
+                try:
+                    pages.get_parser(parser)
+                except EnvironmentError:
+                    continue
+
+                index = pages.PageIndex.build(contents, parser=parser)
+
+                for tag in tags:
+                    with self.subTest(path=path, parser=parser, tag=tag):
+                        expected = _get_div_text(soup, tag)
+
+                        self.assertEqual(
+                            expected, pages.extract(contents, tag, parser=parser)
+                        )
+                        self.assertEqual(expected, index.get(tag))
+
+    def test_default(self) -> None:
+        """Pick the fastest parser that is installed."""
+        with mock.patch(
+            "code_include.pages._is_installed",
+            side_effect=lambda name: name != pages.LXML,
+        ):
+            self.assertEqual(pages.HTML_PARSER, pages.get_parser())
+
+    def test_invalid(self) -> None:
+        """Raise a clear error for unknown or missing parsers."""
+        with self.assertRaises(EnvironmentError):
+            pages.get_parser("does_not_exist")
+
+        with mock.patch("code_include.pages._is_installed", return_value=False):
+            with self.assertRaises(EnvironmentError):
+                pages.get_parser(pages.HTML5LIB)
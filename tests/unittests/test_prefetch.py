@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that code-include targets are found and prefetched before reading."""
+
+import os
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from sphinx import environment
+
+from code_include import bundle
+from code_include import pages
+from code_include import prefetch
+from code_include import records
+
+from .. import common
+
+_CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+_MODULES = os.path.join(_CURRENT_DIRECTORY, "fake_project", "_modules", "fake_project")
+
+
+class GetTargets(unittest.TestCase):
+    """Check that :func:`code_include.prefetch.get_targets` parses documents."""
+
+    def test_targets(self) -> None:
+        """Find targets on the same line, on the next line, and with options."""
+        text = textwrap.dedent("""\
+            Some title
+            ==========
+
+            .. code-include :: :func:`fake_project.basic.set_function_thing`
+
+            .. code-include::
+                :link-to-source:
+                :link-to-documentation:
+
+                :meth:`get_method <fake_project.basic.MyKlass.get_method>`
+
+            .. code-include :: :not-a-valid-target
+
+            .. code-block:: python
+
+                x = 1
+            """)
+
+        self.assertEqual(
+            [
+                prefetch.Target(
+                    "py:function",
+                    "fake_project.basic.set_function_thing",
+                    frozenset(),
+                ),
+                prefetch.Target(
+                    "py:method",
+                    "fake_project.basic.MyKlass.get_method",
+                    frozenset(("link-to-source", "link-to-documentation")),
+                ),
+            ],
+            prefetch.get_targets(text),
+        )
+
+
+class Prefetch(unittest.TestCase):
+    """Check that pages are read into the cache before any directive runs."""
+
+    def setUp(self) -> None:
+        """Start every test with an empty page cache."""
+        pages.CACHE.clear()
+
+    def tearDown(self) -> None:
+        """Remove any page that a test read."""
+        pages.CACHE.clear()
+
+    @mock.patch("code_include.source_code.get_page_location")
+    def test_distinct_pages(self, get_page_location: mock.MagicMock) -> None:
+        """Read each distinct page only once, skipping importable targets."""
+        basic = os.path.join(_MODULES, "basic.html")
+        another = os.path.join(_MODULES, "nested_folder", "another.html")
+        locations = {
+            "fake_project.basic.MyKlass": (basic, "MyKlass"),
+            "fake_project.basic.set_function_thing": (basic, "set_function_thing"),
+            "fake_project.nested_folder.another.MyKlass": (another, "MyKlass"),
+        }
+        get_page_location.side_effect = lambda _, namespace: locations[namespace]
+        options = frozenset(("link-to-source", "link-to-documentation"))
+        targets = [
+            prefetch.Target("py:class", namespace, options) for namespace in locations
+        ]
+        # An importable target is never looked up
+        targets.append(prefetch.Target("py:function", "os.path.join", frozenset()))
+
+        prefetch.prefetch(
+            prefetch._get_locations(targets),  # pylint: disable=protected-access
+            workers=4,
+        )
+
+        self.assertEqual(3, get_page_location.call_count)
+        self.assertEqual(2, pages.CACHE.misses)
+        self.assertIn(basic, pages.CACHE)
+        self.assertIn(another, pages.CACHE)
+
+
+class Workers(unittest.TestCase):
+    """Check that code-include's prefetch settings are real Sphinx settings."""
+
+    def test_default(self) -> None:
+        """Prefetch pages and check remote pages by default."""
+        application = common.make_configured_application({})
+
+        self.assertEqual(prefetch.DEFAULT_WORKERS, prefetch.get_workers(application))
+        self.assertTrue(prefetch.is_checking_remote(application))
+
+    def test_override(self) -> None:
+        """Let users turn prefetching off from the command-line."""
+        application = common.make_configured_application(
+            {"code_include_prefetch_workers": "0"}
+        )
+
+        self.assertEqual(0, prefetch.get_workers(application))
+
+    def test_check_remote(self) -> None:
+        """Let users turn off checking remote pages from the command-line."""
+        application = common.make_configured_application(
+            {"code_include_check_remote": "0"}
+        )
+
+        self.assertFalse(prefetch.is_checking_remote(application))
+
+
+class Offline(unittest.TestCase):
+    """Check that offline builds never read a page from the network."""
+
+    @mock.patch("code_include.fetch.Fetcher.fetch")
+    @mock.patch("code_include.source_code.read_page")
+    @mock.patch("code_include.prefetch.prefetch")
+    def test_hooks(
+        self,
+        prefetch_: mock.MagicMock,
+        read_page: mock.MagicMock,
+        fetch: mock.MagicMock,
+    ) -> None:
+        """Don't prefetch or re-check any remote page."""
+        application = common.make_configured_application(
+            settings={"code_include_bundle_mode": bundle.OFFLINE}
+        )
+        env = mock.MagicMock(spec=environment.BuildEnvironment)
+        key = ("py:function", "foo.bar", False)
+        records.add(
+            env,
+            "index",
+            key,
+            records.Record(
+                bundle.Result("code", key[1], "https://host/_modules/foo.html#bar", ""),
+                records.get_digest("code"),
+                records.Provenance(records.PAGE, "https://host/_modules/foo.html", ""),
+            ),
+        )
+
+        with tempfile.NamedTemporaryFile("w", suffix=".rst", delete=False) as handler:
+            handler.write(".. code-include :: :func:`foo.other`\n")
+
+        self.addCleanup(os.remove, handler.name)
+        env.doc2path.return_value = handler.name
+
+        prefetch.prefetch_documents(application, env, ["index"])
+        self.assertEqual(
+            [], prefetch.get_outdated(application, env, set(), set(), set())
+        )
+
+        self.assertFalse(prefetch_.called)
+        self.assertFalse(read_page.called)
+        self.assertFalse(fetch.called)
+        self.assertTrue(records.has(env, key))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that resolved code-includes are re-used between builds."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from sphinx import environment
+
+from code_include import prefetch
+from code_include import records
+from code_include import source_code
+from code_include import static
+
+from .. import common
+
+_KEY = ("py:function", "records_module.get_value", True)
+
+
+class _Common(unittest.TestCase):
+    """Make a Python file for results to come from."""
+
+    def setUp(self) -> None:
+        """Create the file."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_records")
+        self._path = os.path.join(self._directory, "records_module.py")
+        self._write("def get_value():\n    return 8\n")
+
+    def tearDown(self) -> None:
+        """Delete the file."""
+        shutil.rmtree(self._directory)
+
+    def _write(self, text: str) -> None:
+        """Replace the contents of the Python file with ``text``."""
+        with open(self._path, "w", encoding="utf-8") as handler:
+            handler.write(text)
+
+    @staticmethod
+    def _make_env() -> mock.MagicMock:
+        """Create a fake environment that records can be stored in."""
+        return mock.MagicMock(spec=environment.BuildEnvironment)
+
+    def _make_record(self) -> records.Record:
+        """records.Record: Make a record which comes from the Python file."""
+        with mock.patch.object(
+            static, "find_source_file", return_value=(self._path, "get_value")
+        ):
+            return records.make(
+                source_code.SourceResult("def get_value():\n", _KEY[1], "", ""),
+                _KEY[1],
+            )
+
+
+class Records(_Common):
+    """Check that records are stored, checked, purged, and merged correctly."""
+
+    def test_provenance(self) -> None:
+        """Only re-use a record while the file that it came from is unchanged."""
+        env = self._make_env()
+        record = self._make_record()
+        records.add(env, "index", _KEY, record)
+
+        self.assertEqual(records.FILE, record.provenance.kind)  # type: ignore
+        self.assertEqual(record, records.get(env, "other", _KEY))
+        self.assertTrue(records.has(env, _KEY))
+
+        self._write("def get_value():\n    return 10\n")
+
+        self.assertIsNone(records.get(env, "other", _KEY))
+        self.assertFalse(records.has(env, _KEY))
+
+    def test_remote_page(self) -> None:
+        """Keep a record from a remote viewcode page."""
+        env = self._make_env()
+        record = records.make(
+            source_code.SourceResult(
+                "code", "foo.bar", "https://host/_modules/foo.html#bar", "doc"
+            ),
+            "foo.bar",
+        )
+        records.add(env, "index", _KEY, record)
+
+        self.assertEqual(
+            records.Provenance(records.PAGE, "https://host/_modules/foo.html", ""),
+            record.provenance,
+        )
+        self.assertEqual(record, records.get(env, "index", _KEY))
+
+    def test_purge_and_prune(self) -> None:
+        """Keep the records of a purged document until it's clear that they're unused."""
+        env = self._make_env()
+        records.add(env, "index", _KEY, self._make_record())
+
+        records.purge_document(mock.MagicMock(), env, "index")
+
+        self.assertIsNotNone(records.get(env, "index", _KEY))
+
+        records.purge_document(mock.MagicMock(), env, "index")
+        records.prune(mock.MagicMock(), env)
+
+        self.assertIsNone(records.get(env, "index", _KEY))
+
+    def test_merge(self) -> None:
+        """Copy the records of documents which were read in parallel."""
+        env = self._make_env()
+        other = self._make_env()
+        record = self._make_record()
+        records.add(other, "index", _KEY, record)
+        records.add(other, "unrelated", ("py:class", "foo.Bar", True), record)
+
+        records.merge_documents(mock.MagicMock(), env, {"index"}, other)
+        records.prune(mock.MagicMock(), env)
+
+        self.assertEqual(record, records.get(env, "index", _KEY))
+        self.assertIsNone(records.get(env, "index", ("py:class", "foo.Bar", True)))
+
+
+class Outdated(_Common):
+    """Check that documents are re-read when their remote code changes."""
+
+    @mock.patch("code_include.prefetch.prefetch")
+    @mock.patch("code_include.source_code._get_source_code")
+    def test_remote(
+        self,
+        _get_source_code: mock.MagicMock,
+        _prefetch: mock.MagicMock,
+    ) -> None:
+        """Re-read only the documents whose remote code has a different hash."""
+        env = self._make_env()
+        changed = ("py:function", "foo.changed", False)
+        same = ("py:function", "foo.same", False)
+
+        for key, document in [(changed, "changed"), (same, "same")]:
+            records.add(
+                env,
+                document,
+                key,
+                records.make(
+                    source_code.SourceResult(
+                        "old", key[1], "https://host/_modules/foo.html#" + key[1], ""
+                    ),
+                    key[1],
+                ),
+            )
+
+        records.add(env, "local", _KEY, self._make_record())
+        _get_source_code.side_effect = lambda uri, tag: (
+            "new" if tag == "foo.changed" else "old"
+        )
+
+        application = common.make_configured_application()
+
+        self.assertEqual(
+            ["changed"],
+            prefetch.get_outdated(application, env, set(), set(), set()),
+        )
+        self.assertFalse(records.has(env, changed))
+        self.assertTrue(records.has(env, same))
+        self.assertEqual(2, _get_source_code.call_count)
+
+
+class Directive(_Common):
+    """Check that the code-include directive re-uses stored records."""
+
+    @mock.patch("code_include.source_code.get_source_code")
+    def test_reuse(self, get_source_code: mock.MagicMock) -> None:
+        """Don't resolve a target again if its stored record is still current."""
+        directive = common.make_mock_directive([":func:`records_module.get_value`"])
+        env = mock.MagicMock(spec=["docname", "note_dependency"])
+        env.docname = "index"
+        directive.state.document.settings.env = env
+        get_source_code.return_value = source_code.SourceResult(
+            "def get_value():\n", _KEY[1], "", ""
+        )
+
+        with mock.patch.object(
+            static, "find_source_file", return_value=(self._path, "get_value")
+        ):
+            first = directive._get_code(*_KEY)  # pylint: disable=protected-access
+            second = directive._get_code(*_KEY)  # pylint: disable=protected-access
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, get_source_code.call_count)
+        env.note_dependency.assert_has_calls([mock.call(self._path)] * 2)
+
+    @mock.patch("code_include.prefetch.prefetch")
+    @mock.patch("code_include.source_code.get_page_code")
+    def test_off(
+        self,
+        get_page_code: mock.MagicMock,
+        _prefetch: mock.MagicMock,
+    ) -> None:
+        """Don't check any remote page if the user turned it off."""
+        env = self._make_env()
+        key = ("py:function", "foo.changed", False)
+        records.add(
+            env,
+            "changed",
+            key,
+            records.make(
+                source_code.SourceResult(
+                    "old", key[1], "https://host/_modules/foo.html#" + key[1], ""
+                ),
+                key[1],
+            ),
+        )
+
+        application = common.make_configured_application(
+            settings={"code_include_check_remote": False}
+        )
+
+        self.assertEqual(
+            [],
+            prefetch.get_outdated(application, env, set(), set(), set()),
+        )
+        self.assertFalse(get_page_code.called)
+        self.assertFalse(_prefetch.called)
+        self.assertTrue(records.has(env, key))
+
+
+class Settings(_Common):
+    """Check that records are forgotten once the user changes how code is found."""
+
+    def test_changed(self) -> None:
+        """Re-read every document with a record, only once the settings change."""
+        env = self._make_env()
+        records.add(env, "index", _KEY, self._make_record())
+        records.add(env, "changed", _KEY, self._make_record())
+        application = common.make_configured_application(
+            settings={"code_include_strategies": ["import", "inventory"]}
+        )
+
+        self.assertEqual(
+            ["index"],
+            records.get_outdated(application, env, set(), {"changed"}, set()),
+        )
+        self.assertFalse(records.has(env, _KEY))
+
+        records.add(env, "index", _KEY, self._make_record())
+
+        self.assertEqual(
+            [], records.get_outdated(application, env, set(), set(), set())
+        )
+        self.assertTrue(records.has(env, _KEY))
+
+        application.config.code_include_strategies = ["static"]
+
+        self.assertEqual(
+            ["index"], records.get_outdated(application, env, set(), set(), set())
+        )
+        self.assertFalse(records.has(env, _KEY))
+
+    def test_bundle(self) -> None:
+        """Notice when the user starts or stops reading code from a bundle."""
+        application = common.make_configured_application()
+        settings = records.get_settings(application)
+
+        application.config.code_include_bundle_mode = "offline"
+        offline = records.get_settings(application)
+        application.config.code_include_bundle_path = "/other/bundle.json"
+
+        self.assertNotEqual(settings, offline)
+        self.assertNotEqual(offline, records.get_settings(application))
+
+    def test_preprocessor(self) -> None:
+        """Notice when the user's preprocessor function changes."""
+
+        def _preprocessor(soup: object) -> None:
+            del soup
+
+        application = common.make_configured_application(
+            settings={"code_include_preprocessor": _preprocessor}
+        )
+        settings = records.get_settings(application)
+
+        application.config.code_include_preprocessor = lambda soup: None
+
+        self.assertNotEqual(settings, records.get_settings(application))
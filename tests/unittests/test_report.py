@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that each code-include's timings are measured and reported."""
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+from sphinx import environment
+
+from code_include import prefetch
+from code_include import report
+from code_include import source_code
+
+from .. import common
+
+
+class Measure(unittest.TestCase):
+    """Check that phases, caches, and strategies are measured per-include."""
+
+    def test_phases(self) -> None:
+        """Count the time of nested phases only once."""
+        include = report.Include("index", "py:function", "foo.bar")
+
+        with report.measure(include):
+            with report.phase(report.PARSE):
+                with report.phase(report.FETCH):
+                    time.sleep(0.05)
+
+            report.note_cache(True)
+            report.note_cache(False)
+            report.note_strategy(source_code.INVENTORY)
+
+        self.assertGreaterEqual(include.phases[report.FETCH], 0.05)
+        self.assertLess(include.phases[report.PARSE], 0.05)
+        self.assertGreaterEqual(include.seconds, 0.05)
+        self.assertEqual((1, 1), (include.hits, include.misses))
+        self.assertEqual(source_code.INVENTORY, include.strategy)
+
+    def test_not_measured(self) -> None:
+        """Do nothing if no include is being measured."""
+        with report.phase(report.IMPORT):
+            report.note_cache(True)
+            report.note_transfer(10)
+
+    def test_histogram(self) -> None:
+        """Put each request into the bucket of its latency."""
+        hosts = report.Hosts()
+        hosts.add("host", 0.001, 10)
+        hosts.add("host", 0.3, 20)
+        hosts.add("host", 60.0, 0, failed=True)
+
+        found = hosts.to_dict()["host"]
+
+        self.assertEqual(
+            (3, 1, 30), (found["requests"], found["failures"], found["bytes"])
+        )
+        self.assertEqual(1, found["histogram"]["0.01"])
+        self.assertEqual(1, found["histogram"]["0.5"])
+        self.assertEqual(1, found["histogram"]["inf"])
+
+
+class Write(unittest.TestCase):
+    """Check the JSON report which is written once the build finishes."""
+
+    def setUp(self) -> None:
+        """Make a directory to write to."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_report")
+
+    def tearDown(self) -> None:
+        """Delete the directory."""
+        shutil.rmtree(self._directory)
+
+    def _make_application(self) -> mock.MagicMock:
+        """Create a fake Sphinx application which wants a report."""
+        application = common.make_configured_application(
+            settings={
+                "code_include_report_path": "report.json",
+                "code_include_report_slowest": 1,
+            }
+        )
+        application.confdir = self._directory
+        application.env = types.SimpleNamespace()
+
+        return application
+
+    def test_write(self) -> None:
+        """List the slowest includes and every document, including parallel ones."""
+        application = self._make_application()
+        other = mock.MagicMock(spec=environment.BuildEnvironment)
+
+        for env, document, seconds in [
+            (application.env, "fast", 0.1),
+            (other, "slow", 2.0),
+            (other, "ignored", 3.0),
+        ]:
+            include = report.Include(document, "py:function", document + ".get")
+            include.seconds = seconds
+            report.add(env, include)
+
+        report.merge_documents(application, application.env, {"slow"}, other)
+        hosts = report._get_hosts(application.env)  # pylint: disable=protected-access
+        hosts.add("host", 0.1, 10)
+
+        report.write(application, None)
+
+        with open(
+            os.path.join(self._directory, "report.json"), "r", encoding="utf-8"
+        ) as handler:
+            data = json.load(handler)
+
+        self.assertEqual(["slow.get"], [item["namespace"] for item in data["slowest"]])
+        self.assertEqual(
+            ["fast", "slow"], [item["document"] for item in data["includes"]]
+        )
+        self.assertEqual(["host"], list(data["hosts"]))
+
+    @mock.patch("code_include.source_code.read_page")
+    def test_prefetch(self, read_page: mock.MagicMock) -> None:
+        """Report the downloads of prefetched pages, which belong to no include."""
+
+        def _read_page(uri: str) -> None:
+            with report.phase(report.FETCH):
+                report.note_transfer(len(uri))
+
+        read_page.side_effect = _read_page
+        application = self._make_application()
+        other = mock.MagicMock(spec=environment.BuildEnvironment)
+
+        with mock.patch("code_include.source_code.APPLICATION", application):
+            prefetch.prefetch(["https://a", "https://bb"], 2, env=application.env)
+            prefetch.prefetch(["https://ccc"], 1, env=other, document="deferred")
+            prefetch.prefetch(["https://dddd"], 1, env=other, document="ignored")
+
+        report.merge_documents(application, application.env, {"deferred"}, other)
+        report.write(application, None)
+
+        with open(
+            os.path.join(self._directory, "report.json"), "r", encoding="utf-8"
+        ) as handler:
+            data = json.load(handler)
+
+        self.assertEqual(0, data["bytes"])
+        self.assertEqual(
+            ["https://a", "https://bb", "https://ccc"],
+            [page["uri"] for page in data["prefetch"]["pages"]],
+        )
+        self.assertEqual(
+            [9, 10, 11], [page["bytes"] for page in data["prefetch"]["pages"]]
+        )
+        self.assertEqual(30, data["prefetch"]["bytes"])
+        self.assertGreater(data["prefetch"]["phases"][report.FETCH], 0.0)
+
+        report.purge_document(application, application.env, "deferred")
+        report.write(application, None)
+
+        with open(
+            os.path.join(self._directory, "report.json"), "r", encoding="utf-8"
+        ) as handler:
+            data = json.load(handler)
+
+        self.assertEqual(19, data["prefetch"]["bytes"])
+
+    def test_hosts(self) -> None:
+        """Add the requests of parallel sub-processes without counting any twice."""
+        application = self._make_application()
+        hosts = report.Hosts()
+        report.reset(application.env, hosts)
+        hosts.add("host", 0.1, 10)
+        other = mock.MagicMock(spec=environment.BuildEnvironment)
+        copied = pickle.loads(pickle.dumps(hosts))  # As a forked sub-process would
+        report.reset(other, copied)
+
+        with mock.patch("code_include.report._ORIGIN", (os.getpid(), "forked")):
+            copied.add("host", 0.2, 20)
+            copied.add("other", 0.2, 5)
+
+        report.merge_documents(application, application.env, set(), other)
+        report.merge_documents(application, application.env, set(), other)
+        report.write(application, None)
+
+        with open(
+            os.path.join(self._directory, "report.json"), "r", encoding="utf-8"
+        ) as handler:
+            data = json.load(handler)
+
+        self.assertEqual(
+            {"host": (2, 30), "other": (1, 5)},
+            {
+                name: (found["requests"], found["bytes"])
+                for name, found in data["hosts"].items()
+            },
+        )
+
+    def test_directive(self) -> None:
+        """Measure each code-include directive, once the user enables the report."""
+        application = self._make_application()
+        directive = common.make_mock_directive([":func:`foo.bar`"])
+        directive.state.document.settings.env = application.env
+        application.env.docname = "index"
+
+        with mock.patch(
+            "code_include.source_code.APPLICATION", application
+        ), mock.patch(
+            "code_include.source_code.get_source_code",
+            return_value=source_code.SourceResult("def bar():\n", "foo.bar", "", ""),
+        ):
+            directive.run()
+
+        get_includes = report._get_includes  # pylint: disable=protected-access
+        data = report.make(get_includes(application.env)["index"], report.Hosts())
+
+        self.assertEqual("foo.bar", data["includes"][0]["namespace"])
+        self.assertEqual(1, data["misses"])
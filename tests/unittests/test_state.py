@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that each Sphinx application keeps its own caches."""
+
+import concurrent.futures
+import threading
+import time
+import typing
+import unittest
+from unittest import mock
+
+from code_include import source_code
+from code_include import state
+
+from .. import common
+
+
+def _make_application(roots: list[str], scope: str = "") -> mock.MagicMock:
+    """Create a fake Sphinx application with some intersphinx roots."""
+    application = common.make_configured_application(
+        settings={"code_include_cache_scope": scope}
+    )
+    application.config.intersphinx_mapping = {
+        root: (root, (root, None)) for root in roots
+    }
+
+    return application
+
+
+class State(unittest.TestCase):
+    """Check that caches are kept per-application and shared only on purpose."""
+
+    def test_separate(self) -> None:
+        """Never let one application's intersphinx roots leak into another."""
+        first = _make_application(["https://host/1.0"])
+        second = _make_application(["https://host/2.0"])
+
+        for application, root in [
+            (first, "https://host/1.0"),
+            (second, "https://host/2.0"),
+            (first, "https://host/1.0"),
+        ]:
+            with mock.patch("code_include.source_code.APPLICATION", application):
+                index = (
+                    source_code._get_root_index()  # pylint: disable=protected-access
+                )
+
+            self.assertEqual([root], list(index))
+
+        self.assertIsNot(state.get(first), state.get(second))
+        self.assertIs(state.get(first), state.get(first))
+
+    def test_scope(self) -> None:
+        """Share pages only between applications with the same cache scope."""
+        first = _make_application([], scope="test_scope")
+        second = _make_application([], scope="test_scope")
+        other = _make_application([])
+
+        self.assertIs(state.get(first).pages, state.get(second).pages)
+        self.assertIsNot(state.get(first).pages, state.get(other).pages)
+
+        state.get(first).pages.get("page.html", lambda _: "<html></html>")
+        state.get(first).clear()
+
+        self.assertIn("page.html", state.get(second).pages)
+
+    def test_sources(self) -> None:
+        """Read Python files into each application's own cache."""
+        first = _make_application([])
+        second = _make_application([])
+
+        for application in [first, first, second]:
+            with mock.patch("code_include.source_code.APPLICATION", application):
+                source_code._get_source_code_from_file(  # pylint: disable=protected-access
+                    "code_include.helper.memoize"
+                )
+
+        sources = state.get(first).sources
+
+        self.assertEqual((1, 1), (sources.hits, sources.misses))
+        self.assertEqual(1, state.get(second).sources.misses)
+
+        state.get(first).clear()
+
+        self.assertEqual(1, len(sources))
+
+    def test_activate(self) -> None:
+        """Use the caches of whichever application started building last."""
+        first = _make_application([])
+        second = _make_application([])
+
+        with mock.patch("code_include.source_code.APPLICATION", None):
+            source_code.activate(first)
+            found = source_code._get_state()  # pylint: disable=protected-access
+            source_code.activate(second)
+
+            self.assertIs(state.get(first), found)
+            self.assertIs(
+                state.get(second),
+                source_code._get_state(),  # pylint: disable=protected-access
+            )
+
+    def test_limits(self) -> None:
+        """Keep only as many pages as the user allows."""
+        application = _make_application([])
+        application.config.code_include_page_cache_size = 1
+        pages = state.get(application).pages
+
+        for uri in ["first.html", "second.html"]:
+            pages.get(uri, lambda _: "<html></html>")
+
+        self.assertEqual((1, 1), (len(pages), pages.evictions))
+        self.assertIn("second.html", pages)
+
+    def test_workers(self) -> None:
+        """Start only one import pool, even when many threads ask for it at once."""
+        application = _make_application([])
+        application.config.code_include_import_workers = 2
+        barrier = threading.Barrier(8)
+
+        def _make_pool(**_: typing.Any) -> mock.MagicMock:
+            time.sleep(0.05)
+
+            return mock.MagicMock()
+
+        def _get_workers() -> typing.Any:
+            barrier.wait()
+
+            return source_code._get_workers()  # pylint: disable=protected-access
+
+        with mock.patch(
+            "code_include.workers.ImportPool", side_effect=_make_pool
+        ) as pool, mock.patch("code_include.source_code.APPLICATION", application):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+                found = list(executor.map(lambda _: _get_workers(), range(8)))
+
+        self.assertEqual(1, pool.call_count)
+        self.assertEqual(1, len({id(workers) for workers in found}))
+        self.assertIs(state.get(application).workers, found[0])
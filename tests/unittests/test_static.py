@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that source code can be found without importing anything."""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from code_include import error_classes
+from code_include import source_code
+from code_include import static
+
+from .. import common
+
+_MODULE = textwrap.dedent('''\
+    import typing
+
+    VALUE = 8
+    FIRST, SECOND = 1, 2
+
+    if typing.TYPE_CHECKING:
+        ALIAS: typing.TypeAlias = int
+
+
+    class Parent(object):
+        """A class."""
+
+        attribute = "text"
+
+        @property
+        def get_value(self):
+            return 8
+
+        class Nested(object):
+            async def get_nested(self):
+                pass
+
+
+    def outer():
+        def inner():
+            pass
+
+        return inner
+    ''')
+
+
+class _Common(unittest.TestCase):
+    """Make a package which raises an exception if it is ever imported."""
+
+    def setUp(self) -> None:
+        """Create the package and make it findable."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_static")
+        package = os.path.join(self._directory, "static_package")
+        os.makedirs(os.path.join(package, "inner"))
+
+        for path, text in [
+            ("__init__.py", "raise RuntimeError('Never import me')\n"),
+            (os.path.join("inner", "__init__.py"), "raise RuntimeError('Or me')\n"),
+            (os.path.join("inner", "module.py"), _MODULE),
+            (os.path.join("..", "static_module.py"), _MODULE),
+            (os.path.join("..", "broken_module.py"), "import does_not_exist\n"),
+        ]:
+            with open(os.path.join(package, path), "w", encoding="utf-8") as handler:
+                handler.write(text)
+
+        sys.path.insert(0, self._directory)
+
+    def tearDown(self) -> None:
+        """Delete the package."""
+        sys.path.remove(self._directory)
+        sys.modules.pop("static_module", None)
+        shutil.rmtree(self._directory)
+        static.CACHE.clear()
+
+
+class Find(_Common):
+    """Check :func:`code_include.static.find_source`."""
+
+    def test_file(self) -> None:
+        """Find a module's file and the namespace within it."""
+        path, qualname = static.find_source_file(  # type: ignore
+            "static_package.inner.module.Parent.Nested"
+        )
+
+        self.assertEqual(
+            os.path.join(self._directory, "static_package", "inner", "module.py"),
+            path,
+        )
+        self.assertEqual("Parent.Nested", qualname)
+        self.assertNotIn("static_package", sys.modules)
+        self.assertIsNone(static.find_source_file("does_not_exist.module"))
+
+    def test_members(self) -> None:
+        """Get the exact lines of classes, methods, nested functions, and variables."""
+        prefix = "static_package.inner.module."
+
+        self.assertEqual("VALUE = 8\n", static.find_source(prefix + "VALUE"))
+        self.assertEqual(
+            "FIRST, SECOND = 1, 2\n", static.find_source(prefix + "SECOND")
+        )
+        self.assertEqual(
+            "    ALIAS: typing.TypeAlias = int\n", static.find_source(prefix + "ALIAS")
+        )
+        self.assertEqual(
+            "    @property\n    def get_value(self):\n        return 8\n",
+            static.find_source(prefix + "Parent.get_value"),
+        )
+        self.assertEqual(
+            "        async def get_nested(self):\n            pass\n",
+            static.find_source(prefix + "Parent.Nested.get_nested"),
+        )
+        self.assertEqual(
+            "    def inner():\n        pass\n",
+            static.find_source(prefix + "outer.inner"),
+        )
+        self.assertEqual(_MODULE, static.find_source(prefix[:-1]))
+        self.assertIsNone(static.find_source(prefix + "Parent.does_not_exist"))
+        self.assertNotIn("static_package", sys.modules)
+
+
+class FindModule(_Common):
+    """Check that modules are found once per-build, without failing imports."""
+
+    def test_memoize(self) -> None:
+        """Remember both modules that exist and modules that don't exist."""
+        with mock.patch(
+            "code_include.static._search",
+            wraps=static._search,  # pylint: disable=protected-access
+        ) as search:
+            for _ in range(2):
+                self.assertEqual(
+                    ("static_package.inner.module", "Parent.get_value"),
+                    static.find_module("static_package.inner.module.Parent.get_value"),
+                )
+                self.assertIsNone(static.find_module("does_not_exist.get_value"))
+
+        self.assertEqual(4, search.call_count)
+        self.assertNotIn("static_package", sys.modules)
+
+    def test_import_once(self) -> None:
+        """Import only the longest module and never re-try a failed import."""
+        with mock.patch(
+            "importlib.import_module", wraps=importlib.import_module
+        ) as import_module:
+            for _ in range(2):
+                self.assertIsNone(
+                    source_code._get_source_code_from_object(  # pylint: disable=protected-access
+                        "broken_module.get_value"
+                    )
+                )
+
+        import_module.assert_called_once_with("broken_module")
+        source_code.clear_caches()
+
+    def test_parent(self) -> None:
+        """Import a parent package once its submodule fails to import."""
+        package = os.path.join(self._directory, "fallback_package")
+        os.makedirs(package)
+
+        for name, text in [
+            ("__init__.py", "def optional():\n    return 8\n"),
+            ("optional.py", "import does_not_exist\n"),
+        ]:
+            with open(os.path.join(package, name), "w", encoding="utf-8") as handler:
+                handler.write(text)
+
+        self.addCleanup(sys.modules.pop, "fallback_package", None)
+        self.addCleanup(source_code.clear_caches)
+
+        with mock.patch(
+            "importlib.import_module", wraps=importlib.import_module
+        ) as import_module:
+            for _ in range(2):
+                result = source_code._get_source_code_from_object(  # pylint: disable=protected-access
+                    "fallback_package.optional"
+                )
+
+                self.assertEqual(
+                    "def optional():\n    return 8\n",
+                    result.code,  # type: ignore
+                )
+
+        self.assertEqual(
+            [
+                mock.call("fallback_package.optional"),
+                mock.call("fallback_package"),
+                mock.call("fallback_package"),
+            ],
+            import_module.call_args_list,
+        )
+
+
+class SourceCache(_Common):
+    """Check that each file is parsed once, until it changes."""
+
+    def test_invalidate(self) -> None:
+        """Re-read a file once its size or modification time changes."""
+        path = os.path.join(self._directory, "static_module.py")
+
+        self.assertEqual("VALUE = 8\n", static.get_source(path, "VALUE"))
+        self.assertEqual("FIRST, SECOND = 1, 2\n", static.get_source(path, "FIRST"))
+        self.assertEqual((1, 1), (static.CACHE.hits, static.CACHE.misses))
+
+        with open(path, "w", encoding="utf-8") as handler:
+            handler.write("VALUE = 10\n")
+
+        self.assertEqual("VALUE = 10\n", static.get_source(path, "VALUE"))
+        self.assertIsNone(static.get_source(path, "FIRST"))
+        self.assertEqual((2, 2), (static.CACHE.hits, static.CACHE.misses))
+
+    @mock.patch("inspect.getsourcelines")
+    def test_import(self, getsourcelines: mock.MagicMock) -> None:
+        """Slice imported objects from the cached file, without tokenizing it again."""
+        method = source_code._get_source_code_from_object(  # pylint: disable=protected-access
+            "static_module.Parent.Nested.get_nested"
+        )
+        inner = source_code._get_source_code_from_object(  # pylint: disable=protected-access
+            "static_module.outer"
+        )
+
+        self.assertEqual(
+            "        async def get_nested(self):\n            pass\n",
+            method.code,  # type: ignore
+        )
+        self.assertTrue(inner.code.startswith("def outer():\n"))  # type: ignore
+        self.assertEqual(1, static.CACHE.misses)
+        self.assertFalse(getsourcelines.called)
+
+
+class Strategies(_Common):
+    """Check that the static strategy is chosen with ``code_include_strategies``."""
+
+    def _make_application(self, strategies: list[str]) -> mock.MagicMock:
+        """Create a fake Sphinx application with some ``code_include_strategies``."""
+        return common.make_configured_application(
+            settings={"code_include_strategies": strategies}
+        )
+
+    @mock.patch("code_include.source_code._get_source_code_from_object")
+    def test_static(self, _get_source_code_from_object: mock.MagicMock) -> None:
+        """Never import the namespace when only the static strategy is used."""
+        with mock.patch(
+            "code_include.source_code.APPLICATION",
+            self._make_application([source_code.STATIC]),
+        ):
+            result = source_code.get_source_code(
+                "py:function", "static_package.inner.module.outer", prefer_import=True
+            )
+
+        self.assertTrue(result.code.startswith("def outer():\n"))
+        self.assertFalse(_get_source_code_from_object.called)
+        self.assertNotIn("static_package", sys.modules)
+
+    @mock.patch("code_include.source_code._get_source_code_from_inventory")
+    @mock.patch("code_include.source_code._get_source_code_from_file")
+    def test_order(
+        self,
+        _get_source_code_from_file: mock.MagicMock,
+        _get_source_code_from_inventory: mock.MagicMock,
+    ) -> None:
+        """Try the inventory first, unless an import is preferred."""
+        calls = mock.MagicMock()
+        calls.attach_mock(_get_source_code_from_file, "static")
+        calls.attach_mock(_get_source_code_from_inventory, "inventory")
+        _get_source_code_from_file.return_value = None
+        _get_source_code_from_inventory.return_value = None
+
+        with mock.patch(
+            "code_include.source_code.APPLICATION",
+            self._make_application([source_code.STATIC, source_code.INVENTORY]),
+        ):
+            for prefer_import in (True, False):
+                with self.assertRaises(error_classes.NoMatchFound):
+                    source_code._resolve(  # pylint: disable=protected-access
+                        "py:class", "foo.Bar", prefer_import
+                    )
+
+        self.assertEqual(
+            [
+                mock.call.static("foo.Bar"),
+                mock.call.inventory("py:class", "foo.Bar"),
+                mock.call.inventory("py:class", "foo.Bar"),
+                mock.call.static("foo.Bar"),
+            ],
+            calls.mock_calls,
+        )
+
+    def test_invalid(self) -> None:
+        """Fail early if a strategy is misspelled."""
+        with mock.patch(
+            "code_include.source_code.APPLICATION",
+            self._make_application(["statik"]),
+        ):
+            with self.assertRaises(EnvironmentError):
+                source_code._resolve(  # pylint: disable=protected-access
+                    "py:class", "foo.Bar", True
+                )
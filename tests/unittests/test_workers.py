@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make sure that namespaces can be imported in separate worker processes."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from code_include import error_classes
+from code_include import source_code
+from code_include import state
+from code_include import workers
+
+from .. import common
+
+
+class ImportPool(unittest.TestCase):
+    """Check :class:`code_include.workers.ImportPool`."""
+
+    def setUp(self) -> None:
+        """Make a module that is fast to import and one that never finishes importing."""
+        self._directory = tempfile.mkdtemp(suffix="_code_include_workers")
+
+        for name, text in [
+            ("isolated_module", "def get_value():\n    return 8\n"),
+            ("slow_module", "import time\ntime.sleep(60)\n"),
+        ]:
+            path = os.path.join(self._directory, name + ".py")
+
+            with open(path, "w", encoding="utf-8") as handler:
+                handler.write(text)
+
+        sys.path.insert(0, self._directory)
+
+    def tearDown(self) -> None:
+        """Delete the modules."""
+        sys.path.remove(self._directory)
+        shutil.rmtree(self._directory)
+
+    def test_isolated(self) -> None:
+        """Find source code without importing anything into this process."""
+        pool = workers.ImportPool(workers=1)
+        self.addCleanup(pool.close)
+
+        self.assertEqual(
+            ("def get_value():\n    return 8\n", "isolated_module.get_value", "", ""),
+            pool.get("isolated_module.get_value"),
+        )
+        self.assertIsNone(pool.get("does_not_exist.get_value"))
+        self.assertNotIn("isolated_module", sys.modules)
+
+    def test_timeout(self) -> None:
+        """Kill a worker which takes too long and replace it."""
+        pool = workers.ImportPool(workers=1, timeout=1.0)
+        self.addCleanup(pool.close)
+
+        with self.assertRaises(error_classes.ImportWorkerError):
+            pool.get("slow_module")
+
+        self.assertIsNotNone(pool.get("isolated_module.get_value"))
+
+    def test_recycle(self) -> None:
+        """Replace a worker once it served enough namespaces."""
+        pool = workers.ImportPool(workers=1, max_requests=2)
+        self.addCleanup(pool.close)
+
+        with mock.patch.object(
+            workers._Worker,  # pylint: disable=protected-access
+            "__init__",
+            autospec=True,
+            side_effect=workers._Worker.__init__,  # pylint: disable=protected-access
+        ) as initialize:
+            for _ in range(3):
+                pool.get("isolated_module.get_value")
+
+        self.assertEqual(2, initialize.call_count)
+
+
+class Strategy(unittest.TestCase):
+    """Check that the import strategy uses workers, once they're enabled."""
+
+    @mock.patch("code_include.source_code._get_source_code_from_object")
+    def test_enabled(self, _get_source_code_from_object: mock.MagicMock) -> None:
+        """Import in a worker process instead of this process."""
+        application = common.make_configured_application(
+            settings={"code_include_import_workers": 1}
+        )
+
+        with mock.patch("code_include.source_code.APPLICATION", application):
+            self.addCleanup(state.get(application).clear)
+            result = source_code.get_source_code(
+                "py:function", "json.dumps", prefer_import=True
+            )
+
+        self.assertTrue(result.code.startswith("def dumps("))
+        self.assertEqual("json.dumps", result.namespace)
+        self.assertFalse(_get_source_code_from_object.called)